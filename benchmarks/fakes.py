@@ -0,0 +1,106 @@
+from contextlib import contextmanager
+from typing import Iterator
+from typing import Any
+import time
+
+
+class FakeMessage:
+    """Mimics the chat message returned by the Vertex AI chat model."""
+
+    def __init__(self, content: str) -> None:
+        self.content = content
+
+
+class FakeChatModel:
+    """
+    Stands in for ChatVertexAI with a fixed simulated remote latency.
+
+    The completion echoes the tail of the prompt so downstream formatting sees realistic text sizes.
+    """
+
+    def __init__(self, latency: float = 0.05, completion_chars: int = 1200) -> None:
+        self.latency = latency
+        self.completion_chars = completion_chars
+        self.calls = 0
+
+    def __call__(self, messages: list, **kwargs: Any) -> FakeMessage:
+        self.calls += 1
+        time.sleep(self.latency)
+        prompt = '\n'.join(str(message.content) for message in messages)
+        return FakeMessage(prompt[-self.completion_chars:])
+
+
+class FakeBlob:
+    """Serves the PDF fixture with a simulated download latency."""
+
+    def __init__(self, payload: bytes, latency: float) -> None:
+        self.payload = payload
+        self.latency = latency
+
+    def download_to_file(self, file_obj: Any) -> None:
+        time.sleep(self.latency)
+        file_obj.write(self.payload)
+
+    def download_as_bytes(self) -> bytes:
+        time.sleep(self.latency)
+        return self.payload
+
+
+class FakeBucket:
+    """Returns the same fixture blob for every blob name."""
+
+    def __init__(self, payload: bytes, latency: float) -> None:
+        self.payload = payload
+        self.latency = latency
+
+    def blob(self, blob_name: str) -> FakeBlob:
+        return FakeBlob(self.payload, self.latency)
+
+
+class FakeStorageClient:
+    """Stands in for google.cloud.storage.Client."""
+
+    def __init__(self, payload: bytes, latency: float) -> None:
+        self.payload = payload
+        self.latency = latency
+
+    def bucket(self, bucket_name: str) -> FakeBucket:
+        return FakeBucket(self.payload, self.latency)
+
+
+@contextmanager
+def fake_storage(payload: bytes, latency: float = 0.02) -> Iterator[None]:
+    """
+    Temporarily replaces google.cloud.storage.Client so every download serves the given payload.
+
+    Args:
+    payload (bytes): The bytes every blob download returns.
+    latency (float): Simulated download latency in seconds.
+    """
+    from google.cloud import storage
+
+    original = storage.Client
+    storage.Client = lambda *args, **kwargs: FakeStorageClient(payload, latency)
+    try:
+        yield
+    finally:
+        storage.Client = original
+
+
+@contextmanager
+def fake_chat_model(latency: float = 0.05) -> Iterator[FakeChatModel]:
+    """
+    Temporarily installs a FakeChatModel as the LLM singleton.
+
+    Args:
+    latency (float): Simulated completion latency in seconds.
+    """
+    from src.generate.llm import LLM
+
+    original = LLM._model_instance
+    model = FakeChatModel(latency)
+    LLM._model_instance = model
+    try:
+        yield model
+    finally:
+        LLM._model_instance = original
@@ -0,0 +1,163 @@
+from src.config.logging import logger
+from typing import Dict
+from typing import List
+import pandas as pd
+import json
+import os
+
+
+SINGLE_QUERY_SOURCE = './data/results/sampled_eval_doc_search.jsonl'
+MULTI_QUERY_SOURCE = './data/results/sampled_eval_mq_doc_search.jsonl'
+TABLE_SOURCE = './data/results/coalesced_sample.csv'
+
+
+def read_source_lines(file_path: str) -> List[str]:
+    """
+    Reads the raw lines of a recorded JSONL search result file.
+
+    Args:
+    file_path (str): Path to the recorded JSONL file.
+
+    Returns:
+    List[str]: The non-empty lines of the file.
+    """
+    with open(file_path, 'r') as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def replicate_jsonl(source_path: str, target_path: str, rows: int) -> int:
+    """
+    Writes a JSONL fixture of the requested size by cycling over the recorded rows.
+
+    Args:
+    source_path (str): Path to the recorded JSONL file.
+    target_path (str): Path of the fixture to write.
+    rows (int): Number of rows in the fixture.
+
+    Returns:
+    int: The number of rows written.
+    """
+    lines = read_source_lines(source_path)
+    with open(target_path, 'w') as file:
+        for i in range(rows):
+            file.write(lines[i % len(lines)] + '\n')
+    return rows
+
+
+def collect_summaries(source_path: str) -> List[str]:
+    """
+    Collects every summarized answer (including multi-query variants) from a recorded JSONL file.
+
+    Args:
+    source_path (str): Path to the recorded JSONL file.
+
+    Returns:
+    List[str]: The summarized answers found in the file.
+    """
+    summaries = []
+    for line in read_source_lines(source_path):
+        data = json.loads(line)
+        if 'summarized_answer' in data:
+            summaries.append(data['summarized_answer'])
+            continue
+        for variant, info in data.items():
+            if variant not in ['query', 'brand'] and info:
+                summaries.append(info['summarized_answer'])
+    return summaries
+
+
+def collect_segments(source_path: str) -> List[str]:
+    """
+    Collects the extractive segments of a recorded single-query JSONL file. They are used as page text for the PDF fixture.
+
+    Args:
+    source_path (str): Path to the recorded JSONL file.
+
+    Returns:
+    List[str]: The extractive segments found in the file.
+    """
+    segments = []
+    for line in read_source_lines(source_path):
+        data = json.loads(line)
+        for match in data.get('match_info', []):
+            segments.extend(match.get('extractive_segments', []))
+    return segments
+
+
+def _escape_pdf_text(text: str) -> str:
+    """ Escapes a line of text for use inside a PDF string literal. """
+    text = text.encode('latin-1', 'replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def build_pdf(pages: List[str]) -> bytes:
+    """
+    Builds a minimal text PDF with one page per entry, readable by PyPDF2.
+
+    Args:
+    pages (List[str]): Text content of each page.
+
+    Returns:
+    bytes: The encoded PDF document.
+    """
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for page_text in pages:
+        lines = ['BT', '/F1 10 Tf', '12 TL', '40 800 Td']
+        for line in page_text.splitlines() or ['']:
+            lines.append(f'({_escape_pdf_text(line)}) Tj T*')
+        lines.append('ET')
+        stream = '\n'.join(lines).encode('latin-1')
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        content_id = len(objects)
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] '
+                       b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % content_id)
+        kids.append(b'%d 0 R' % len(objects))
+    objects[1] = b'<< /Type /Pages /Kids [' + b' '.join(kids) + b'] /Count %d >>' % len(kids)
+
+    body = b'%PDF-1.4\n'
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += b'%d 0 obj\n' % number + obj + b'\nendobj\n'
+    xref_offset = len(body)
+    body += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        body += b'%010d 00000 n \n' % offset
+    body += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref_offset)
+    return body
+
+
+def build_fixtures(fixture_dir: str, rows: int = 500, pdf_pages: int = 20) -> Dict[str, str]:
+    """
+    Builds the benchmark fixtures from the recorded sampled eval search results.
+
+    Args:
+    fixture_dir (str): Directory the fixtures are written to.
+    rows (int): Number of rows in the JSONL and table fixtures.
+    pdf_pages (int): Number of pages in the PDF fixture.
+
+    Returns:
+    Dict[str, str]: Paths of the generated fixtures keyed by fixture name.
+    """
+    os.makedirs(fixture_dir, exist_ok=True)
+    paths = {
+        'single_query': os.path.join(fixture_dir, 'single_query.jsonl'),
+        'multi_query': os.path.join(fixture_dir, 'multi_query.jsonl'),
+        'pdf': os.path.join(fixture_dir, 'document.pdf'),
+        'table': os.path.join(fixture_dir, 'table.csv'),
+    }
+    replicate_jsonl(SINGLE_QUERY_SOURCE, paths['single_query'], rows)
+    replicate_jsonl(MULTI_QUERY_SOURCE, paths['multi_query'], rows)
+
+    segments = collect_segments(SINGLE_QUERY_SOURCE)
+    pages = ['\n'.join(segments[i::pdf_pages]) for i in range(pdf_pages)]
+    with open(paths['pdf'], 'wb') as file:
+        file.write(build_pdf(pages))
+
+    table = pd.read_csv(TABLE_SOURCE)
+    table = pd.concat([table] * (rows // len(table) + 1), ignore_index=True).head(rows)
+    table.to_csv(paths['table'], index=False)
+
+    logger.info(f"Benchmark fixtures written to {fixture_dir}")
+    return paths
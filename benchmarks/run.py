@@ -0,0 +1,300 @@
+from benchmarks.fakes import fake_chat_model
+from benchmarks.fakes import fake_storage
+from benchmarks.fixtures import collect_summaries
+from benchmarks.fixtures import build_fixtures
+from src.config.logging import logger
+from typing import Callable
+from typing import Optional
+from typing import Tuple
+from typing import List
+from typing import Dict
+from typing import Any
+import pandas as pd
+import importlib
+import argparse
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+
+
+BASELINE_PATH = './benchmarks/baseline.json'
+BENCHMARKS = []
+
+
+class Benchmark:
+    """A named benchmark whose setup returns the callable to time and the number of items it processes."""
+
+    def __init__(self, name: str, setup: Callable[[Dict[str, Any]], Tuple[Callable[[], Any], int]], repeat: int) -> None:
+        self.name = name
+        self.setup = setup
+        self.repeat = repeat
+
+
+def benchmark(name: str, repeat: int = 10) -> Callable:
+    """ Registers a benchmark setup function under the given name. """
+    def register(setup: Callable) -> Callable:
+        BENCHMARKS.append(Benchmark(name, setup, repeat))
+        return setup
+    return register
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """
+    Computes a percentile of the samples using linear interpolation.
+
+    Args:
+    samples (List[float]): Measured values.
+    q (float): Percentile between 0 and 100.
+
+    Returns:
+    float: The interpolated percentile value.
+    """
+    ordered = sorted(samples)
+    if len(ordered) == 1:
+        return ordered[0]
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def run_benchmark(bench: Benchmark, context: Dict[str, Any]) -> Optional[Dict[str, float]]:
+    """
+    Runs one benchmark and reports its latency percentiles and throughput.
+
+    Args:
+    bench (Benchmark): The benchmark to run.
+    context (Dict[str, Any]): Fixture paths and run options shared by all benchmarks.
+
+    Returns:
+    Optional[Dict[str, float]]: p50/p95/p99 latency in seconds and items per second, or None if the benchmark was skipped.
+    """
+    try:
+        fn, items = bench.setup(context)
+    except Exception as e:
+        logger.error(f"Skipping benchmark {bench.name}: {e}")
+        return None
+
+    fn()  # warm-up
+    samples = []
+    for _ in range(bench.repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+
+    return {
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+        'throughput': items * len(samples) / sum(samples),
+    }
+
+
+def compare_to_baseline(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """
+    Compares benchmark results against the stored baseline.
+
+    Args:
+    results (Dict[str, Dict[str, float]]): Results of the current run keyed by benchmark name.
+    baseline (Dict[str, Dict[str, float]]): Stored baseline results keyed by benchmark name.
+    tolerance (float): Allowed relative slowdown before a result counts as a regression.
+
+    Returns:
+    List[str]: A description of every regression found.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        if result['p95'] > reference['p95'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95'] * 1000:.2f}ms vs baseline {reference['p95'] * 1000:.2f}ms")
+        if result['throughput'] < reference['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {result['throughput']:.1f}/s vs baseline {reference['throughput']:.1f}/s")
+    return regressions
+
+
+def print_report(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]]) -> None:
+    """ Prints a table of the results next to the baseline throughput. """
+    print(f"{'benchmark':<40} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'items/s':>12} {'baseline/s':>12}")
+    print('-' * 98)
+    for name, result in results.items():
+        reference = baseline.get(name, {}).get('throughput')
+        reference = f'{reference:.1f}' if reference else '-'
+        print(f"{name:<40} {result['p50'] * 1000:>10.2f} {result['p95'] * 1000:>10.2f} "
+              f"{result['p99'] * 1000:>10.2f} {result['throughput']:>12.1f} {reference:>12}")
+
+
+@benchmark('parse.retriever_jsonl')
+def bench_retriever_parse(context: Dict[str, Any]):
+    from src.search.retriever import read_jsonl_file
+    path = context['paths']['single_query']
+    return lambda: read_jsonl_file(path), context['rows']
+
+
+@benchmark('parse.multi_query_retriever_jsonl', repeat=5)
+def bench_multi_query_parse(context: Dict[str, Any]):
+    from src.search.multi_query_retriever import read_jsonl_file
+    path = context['paths']['multi_query']
+    return lambda: read_jsonl_file(path), context['rows']
+
+
+@benchmark('fusion.find_most_weighted_ids', repeat=20)
+def bench_rank_fusion(context: Dict[str, Any]):
+    from src.search.multi_query_retriever import find_most_weighted_ids
+    ranked_lists = []
+    with open(context['paths']['multi_query']) as file:
+        for line in file:
+            data = json.loads(line)
+            ranked_lists.append([(match['rank'], match['knowledge_id'])
+                                 for variant, info in data.items() if variant not in ['query', 'brand'] and info
+                                 for match in info['match_info']])
+    return lambda: [find_most_weighted_ids(ranked, top_k=5) for ranked in ranked_lists], len(ranked_lists)
+
+
+@benchmark('citations.parse_citations', repeat=20)
+def bench_parse_citations(context: Dict[str, Any]):
+    from src.search.citations import parse_citations
+    summaries = context['summaries']
+    return lambda: [parse_citations(summary) for summary in summaries], len(summaries)
+
+
+@benchmark('citations.most_cited', repeat=20)
+def bench_most_cited(context: Dict[str, Any]):
+    from src.search.retriever import QueryResults
+    summaries = context['summaries']
+    query_results = QueryResults('', '', '', [])
+    return lambda: [query_results.most_cited(summary) for summary in summaries], len(summaries)
+
+
+@benchmark('pdf.extract_text_from_gcs_pdf', repeat=10)
+def bench_pdf_extraction(context: Dict[str, Any]):
+    from src.utils.pdf import extract_text_from_gcs_pdf
+    with open(context['paths']['pdf'], 'rb') as file:
+        payload = file.read()
+
+    def run():
+        with fake_storage(payload, latency=0):
+            return extract_text_from_gcs_pdf('gs://fixtures/document.pdf')
+    return run, 1
+
+
+@benchmark('io.save_to_csv', repeat=5)
+def bench_save_to_csv(context: Dict[str, Any]):
+    from src.utils.io import save_to_csv
+    df = pd.read_csv(context['paths']['table'])
+    target = os.path.join(context['fixture_dir'], 'out.csv')
+    return lambda: save_to_csv(df, target), len(df)
+
+
+@benchmark('io.save_to_excel', repeat=3)
+def bench_save_to_excel(context: Dict[str, Any]):
+    from src.utils.io import save_to_excel
+    df = pd.read_csv(context['paths']['table'])
+    target = os.path.join(context['fixture_dir'], 'out.xlsx')
+    return lambda: save_to_excel(df, target), len(df)
+
+
+def pipeline_benchmark(module_name: str, entry_point: str, fixture: str, rows: int = 10) -> Callable:
+    """
+    Builds the setup of an end-to-end experiment benchmark that runs with a simulated chat model and storage latency.
+
+    Args:
+    module_name (str): The experiment module to run.
+    entry_point (str): Name of the function that processes the JSONL file.
+    fixture (str): Name of the JSONL fixture the experiment reads.
+    rows (int): Number of rows the experiment processes per run.
+
+    Returns:
+    Callable: The benchmark setup function.
+    """
+    def setup(context: Dict[str, Any]):
+        source = context['paths'][fixture]
+        path = os.path.join(context['fixture_dir'], f'{module_name.rsplit(".", 1)[-1]}.jsonl')
+        with open(source) as src_file, open(path, 'w') as dst_file:
+            for _, line in zip(range(rows), src_file):
+                dst_file.write(line)
+        with open(context['paths']['pdf'], 'rb') as file:
+            payload = file.read()
+
+        with fake_chat_model(context['latency']) as model:
+            module = importlib.import_module(module_name)
+        module.llm.model = model
+
+        def run():
+            with fake_storage(payload, latency=context['latency'] / 2):
+                return getattr(module, entry_point)(path)
+        return run, rows
+    return setup
+
+
+for _experiment, _entry_point in [('experiment_1', 'read_and_process_jsonl'), ('experiment_2', 'extract_and_process_data'),
+                                  ('experiment_3', 'extract_and_process_data'), ('experiment_4', 'extract_and_process_data')]:
+    benchmark(f'pipeline.{_experiment}', repeat=3)(
+        pipeline_benchmark(f'src.experiments.{_experiment}', _entry_point, 'single_query'))
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, float]]:
+    """ Loads the stored baseline, returning an empty mapping if none exists yet. """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file).get('benchmarks', {})
+
+
+def main() -> int:
+    """ Builds the fixtures, runs the selected benchmarks and compares them with the baseline. """
+    parser = argparse.ArgumentParser(description='Performance benchmarks for the eval pipeline.')
+    parser.add_argument('--rows', type=int, default=500, help='Rows in the JSONL and table fixtures.')
+    parser.add_argument('--latency', type=float, default=0.05, help='Simulated remote latency in seconds.')
+    parser.add_argument('--only', default='', help='Run only benchmarks whose name contains this string.')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Path of the stored baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative slowdown before failing.')
+    parser.add_argument('--update-baseline', action='store_true', help='Store this run as the new baseline.')
+    parser.add_argument('--output', default='', help='Optional path to write the results as JSON.')
+    args = parser.parse_args()
+
+    fixture_dir = tempfile.mkdtemp(prefix='bench_')
+    try:
+        context = {
+            'fixture_dir': fixture_dir,
+            'paths': build_fixtures(fixture_dir, rows=args.rows),
+            'rows': args.rows,
+            'latency': args.latency,
+        }
+        context['summaries'] = collect_summaries(context['paths']['multi_query'])
+
+        results = {}
+        for bench in BENCHMARKS:
+            if args.only in bench.name:
+                result = run_benchmark(bench, context)
+                if result:
+                    results[bench.name] = result
+    finally:
+        shutil.rmtree(fixture_dir, ignore_errors=True)
+
+    baseline = load_baseline(args.baseline)
+    print_report(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as file:
+            json.dump({'rows': args.rows, 'latency': args.latency, 'benchmarks': baseline}, file, indent=2)
+        logger.info(f"Baseline updated at {args.baseline}")
+        return 0
+
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    for regression in regressions:
+        logger.error(f"Regression: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
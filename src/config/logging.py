@@ -1,11 +1,34 @@
+from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueListener
+from logging.handlers import QueueHandler
+import multiprocessing
+import threading
 import logging
+import atexit
+import queue
+import json
+import time
 import os
 
 
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')  # 'text' or 'json'
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '5'))  # sampled records per second per call site
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', '5'))
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] [%(module)s] [%(pathname)s]: %(message)s"
+
+_listener = None
+_handlers = []
+_log_filepath = None
+_worker_queue = None
+_worker_listener = None
+
+
 def custom_path_filter(path):
     # Define the project root name
     project_root = "VertexAIDocExplorer"
-    
+
     # Find the index of the project root in the path
     idx = path.find(project_root)
     if idx != -1:
@@ -18,7 +41,100 @@ class CustomLogRecord(logging.LogRecord):
         super().__init__(*args, **kwargs)
         self.pathname = custom_path_filter(self.pathname)
 
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'module': record.module,
+            'path': record.pathname,
+            'line': record.lineno,
+            'process': record.process,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Rate-limits hot-path records per call site.
+
+    Only records logged with extra={'sampled': True} are limited. At most `rate` of them pass per second
+    for each call site; the next record that passes carries the number suppressed in between.
+    """
+
+    def __init__(self, rate: float = LOG_SAMPLE_RATE) -> None:
+        super().__init__()
+        self.rate = rate
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'sampled', False):
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            start, count, suppressed = self.windows.get(key, (now, 0, 0))
+            if now - start >= 1.0:
+                start, count = now, 0
+            if count >= self.rate:
+                self.windows[key] = (start, count, suppressed + 1)
+                return False
+            self.windows[key] = (start, count + 1, 0)
+        record.suppressed = suppressed
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+        return True
+
+
+def _build_handlers(log_filepath: str) -> list:
+    """ Creates the console and rotating file handlers that run on the listener thread. """
+    formatter = JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers = [
+        logging.StreamHandler(),
+        RotatingFileHandler(log_filepath, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True),
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _route_root_to(log_queue) -> None:
+    """ Replaces the root handlers with a single non-blocking QueueHandler feeding the given queue. """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = QueueHandler(log_queue)
+    handler.addFilter(SampleFilter())
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+
+def _stop_listeners() -> None:
+    for listener in (_worker_listener, _listener):
+        if listener is not None:
+            try:
+                listener.stop()
+            except Exception:
+                pass
+
+
 def setup_logger(log_filename="app.log", log_dir="logs"):
+    """
+    Configures non-blocking logging.
+
+    Callers only enqueue records; a listener thread formats them and writes them to the console and a
+    rotating file, so hot loops never wait on file I/O.
+    """
+    global _listener, _handlers, _log_filepath
     # Ensure the logging directory exists
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
@@ -26,18 +142,68 @@ def setup_logger(log_filename="app.log", log_dir="logs"):
     # Define the log file path
     log_filepath = os.path.join(log_dir, log_filename)
 
-    # Define the logging configuration
     logging.setLogRecordFactory(CustomLogRecord)
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] [%(module)s] [%(pathname)s]: %(message)s",
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler(log_filepath)
-        ]
-    )
+    _log_filepath = log_filepath
+    _handlers = _build_handlers(log_filepath)
+    log_queue = queue.SimpleQueue()
+    _route_root_to(log_queue)
+    _listener = QueueListener(log_queue, *_handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listeners)
 
     # Return the configured logger
     return logging.getLogger()
 
-logger = setup_logger()
\ No newline at end of file
+
+def get_log_queue():
+    """
+    Returns a multiprocessing queue drained by the parent's handlers.
+
+    Pass it to `configure_worker` as the initializer of a process pool so workers never open the log file themselves.
+    """
+    global _worker_queue, _worker_listener
+    if _worker_queue is None:
+        _worker_queue = multiprocessing.Queue()
+        _worker_listener = QueueListener(_worker_queue, *_handlers, respect_handler_level=True)
+        _worker_listener.start()
+    return _worker_queue
+
+
+def configure_worker(log_queue) -> None:
+    """
+    Process pool initializer that sends every record of the worker to the parent process.
+
+    Usage: ProcessPoolExecutor(initializer=configure_worker, initargs=(get_log_queue(),))
+    """
+    logging.setLogRecordFactory(CustomLogRecord)
+    _route_root_to(log_queue)
+
+
+def _process_log_path(log_filepath: str, pid: int) -> str:
+    """ Log file of a forked child, e.g. logs/app.1234.log, so it never writes to or rotates the parent's file. """
+    root, extension = os.path.splitext(log_filepath)
+    return f"{root}.{pid}{extension}"
+
+
+def _after_fork_in_child() -> None:
+    """
+    Listener threads do not survive fork, so forked children forward to the parent or start their own listener.
+
+    A child without a parent queue writes to the console and to its own rotating file; sharing the
+    parent's file handler would let both processes rotate logs/app.log independently.
+    """
+    global _listener, _handlers
+    if _worker_queue is not None:
+        _route_root_to(_worker_queue)
+    elif _handlers:
+        _handlers = _build_handlers(_process_log_path(_log_filepath, os.getpid()))
+        log_queue = queue.SimpleQueue()
+        _route_root_to(log_queue)
+        _listener = QueueListener(log_queue, *_handlers, respect_handler_level=True)
+        _listener.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+logger = setup_logger()
@@ -1,12 +1,22 @@
 from src.config.logging import logger
+from typing import Optional
 from typing import Dict
 from typing import Any
-import subprocess
+import threading
+import datetime
 import yaml
 import os
 
 class Config:
+    """
+    Lazily loaded project configuration.
+
+    Nothing is read at import time. The YAML file is loaded on the first attribute access, and the
+    access token is fetched through google-auth on first use, cached, and refreshed shortly before it expires.
+    """
     _instance = None
+    TOKEN_SCOPES = ['https://www.googleapis.com/auth/cloud-platform']
+    TOKEN_REFRESH_MARGIN = datetime.timedelta(minutes=5)
 
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
@@ -14,7 +24,7 @@ class Config:
             # The following line ensures that the __init__ method is only called once.
             cls._instance.__initialized = False
         return cls._instance
-    
+
     def __init__(self, config_path: str = "./config/config.yml"):
         """
         Initialize the Config class.
@@ -25,14 +35,57 @@ class Config:
         if self.__initialized:
             return
         self.__initialized = True
-        
-        self.__config = self._load_config(config_path)
-        self.PROJECT_ID = self.__config['project_id']
-        self.DATA_STORE_ID = self.__config['datastore_id']
-        self.CREDENTIALS_PATH = self.__config['credentials_json']
-        self._set_google_credentials(self.CREDENTIALS_PATH)
-        self.ACCESS_TOKEN = self._set_access_token()
-        self.TEXT_GEN_MODEL_NAME = self.__config['text_gen_model_name']
+
+        self.__config_path = config_path
+        self.__config: Optional[Dict[str, Any]] = None
+        self.__credentials = None
+        self.__lock = threading.Lock()
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Load the configuration on first use and point Google clients at the configured credentials.
+
+        Returns:
+        - dict: Loaded configuration data.
+        """
+        if self.__config is None:
+            with self.__lock:
+                if self.__config is None:
+                    config = self._load_config(self.__config_path) or {}
+                    if config.get('credentials_json'):
+                        self._set_google_credentials(config['credentials_json'])
+                    self.__config = config
+        return self.__config
+
+    @property
+    def PROJECT_ID(self) -> str:
+        return self.load()['project_id']
+
+    @property
+    def DATA_STORE_ID(self) -> str:
+        return self.load()['datastore_id']
+
+    @property
+    def CREDENTIALS_PATH(self) -> str:
+        return self.load()['credentials_json']
+
+    @property
+    def TEXT_GEN_MODEL_NAME(self) -> str:
+        return self.load()['text_gen_model_name']
+
+    @property
+    def ACCESS_TOKEN(self) -> Optional[str]:
+        """
+        An OAuth access token for the configured credentials, refreshed before expiry.
+
+        Returns:
+        - str: The cached or freshly fetched access token, or None if it cannot be fetched.
+        """
+        self.load()
+        with self.__lock:
+            if self.__credentials is None or self._needs_refresh(self.__credentials):
+                self.__credentials = self._fetch_credentials(self.__credentials)
+            return self.__credentials.token if self.__credentials else None
 
     @staticmethod
     def _load_config(config_path: str) -> Dict[str, Any]:
@@ -61,22 +114,49 @@ class Config:
         """
         os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_path
 
-    @staticmethod
-    def _set_access_token() -> str:
+    @classmethod
+    def _needs_refresh(cls, credentials) -> bool:
         """
-        Fetch an access token for authentication.
+        Check whether cached credentials are missing a token or expire within the refresh margin.
+
+        Args:
+        - credentials: google-auth credentials.
 
         Returns:
-        - str: The fetched access token.
+        - bool: True if the token should be refreshed.
+        """
+        if not credentials.token:
+            return True
+        if credentials.expiry is None:
+            return False
+        # google-auth stores expiry as a naive UTC datetime.
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return credentials.expiry - now < cls.TOKEN_REFRESH_MARGIN
+
+    @classmethod
+    def _fetch_credentials(cls, credentials=None):
+        """
+        Fetch or refresh credentials through google-auth.
+
+        Args:
+        - credentials: Previously fetched credentials to refresh, if any.
+
+        Returns:
+        - Credentials with a valid token, or None if fetching fails.
         """
         logger.info("Fetching access token...")
-        cmd = ["gcloud", "auth", "print-access-token"]
         try:
-            token = subprocess.check_output(cmd).decode('utf-8').strip()
+            import google.auth
+            from google.auth.transport.requests import Request
+
+            if credentials is None:
+                credentials, _ = google.auth.default(scopes=cls.TOKEN_SCOPES)
+            credentials.refresh(Request())
             logger.info("Access token obtained successfully.")
-            return token
-        except subprocess.CalledProcessError as e:
+            return credentials
+        except Exception as e:
             logger.error(f"Failed to fetch access token. Error: {e}")
+            return None
 
 
-config = Config()
\ No newline at end of file
+config = Config()
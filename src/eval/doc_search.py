@@ -1,25 +1,58 @@
-from src.search.doc_search import search
+from src.search.doc_search import search_batch
+from src.utils.incremental import load_previous_records
+from src.utils.textstore import externalize_texts
+from src.utils.textstore import text_store_path
+from src.utils.textstore import TextStore
 from src.config.logging import logger
+from src.utils.incremental import row_key
+from src.utils import singleflight
 import jsonlines 
 import csv
 
 
-def process_csv_and_write_jsonl(csv_file_path, jsonl_file_path):
+def process_csv_and_write_jsonl(csv_file_path, jsonl_file_path, reuse_previous=True, chunk_size=64, share_across_brands=False, profile='full',
+                                store_texts=True):
+    """
+    Searches every question of the eval CSV and writes one result per line.
+
+    When `reuse_previous` is set, questions already present in the existing JSONL file (same
+    question and brand) keep their stored result, so only new or changed questions are searched.
+    Rows are searched concurrently in chunks of `chunk_size` (see search_batch) and each chunk is
+    written as soon as it completes. `profile` selects what each search returns (see SEARCH_PROFILES);
+    'full' keeps everything experiments 1-4 use.
+
+    With `store_texts`, extractive answers and segments are written once to the file's text store
+    (see src/utils/textstore.py) and the records only hold their hashes.
+    """
+    previous = load_previous_records(jsonl_file_path) if reuse_previous else {}
+    texts = TextStore(text_store_path(jsonl_file_path)) if store_texts else None
+    reused = 0
     with open(csv_file_path, mode='r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        with jsonlines.open(jsonl_file_path, mode='w') as writer:
-            for row in reader:
-                query = row['question']
-                brand = row['filter']
-                logger.info(f'Performing doc search for query={query}')
-                search_result = search(query, brand)
-                # Include the query and brand in the result
-                search_result.update({"query": query, "brand": brand})
-                writer.write(search_result)
+        rows = [(row['question'], row['filter']) for row in csv.DictReader(file)]
+
+    with jsonlines.open(jsonl_file_path, mode='w') as writer:
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            stored = [previous.get(row_key(query, brand)) for query, brand in chunk]
+            reused += sum(record is not None for record in stored)
+            pending = [pair for pair, record in zip(chunk, stored) if record is None]
+            logger.info(f'Performing doc search for {len(pending)} queries', extra={'sampled': True})
+            searched = iter(search_batch(pending, share_across_brands=share_across_brands, profile=profile))
+            for (query, brand), record in zip(chunk, stored):
+                if record is None:
+                    record = next(searched)
+                    # Include the query and brand in the result
+                    record.update({"query": query, "brand": brand})
+                if texts is not None:
+                    record = externalize_texts(record, texts)
+                writer.write(record)
+    logger.info(f"Reused {reused} stored search results")
+    logger.info(f"Single-flight: {singleflight.stats()}")
 
-# Define file paths
-csv_file_path = './data/input/eval_2.csv'
-jsonl_file_path = './data/results/eval_doc_search_2.jsonl'
+if __name__ == '__main__':
+    # Define file paths
+    csv_file_path = './data/input/eval_2.csv'
+    jsonl_file_path = './data/results/eval_doc_search_2.jsonl'
 
-# Process the CSV file and write to a JSONL file
-process_csv_and_write_jsonl(csv_file_path, jsonl_file_path)
\ No newline at end of file
+    # Process the CSV file and write to a JSONL file
+    process_csv_and_write_jsonl(csv_file_path, jsonl_file_path)
\ No newline at end of file
@@ -1,25 +1,62 @@
 from src.search.doc_search_multi_query import multi_query_search
+from src.search.doc_search_multi_query import adaptive_stats
+from src.utils.incremental import load_previous_records
+from src.utils.textstore import externalize_texts
+from src.utils.textstore import text_store_path
+from src.utils.textstore import TextStore
 from src.config.logging import logger
+from src.utils.incremental import row_key
+from src.utils import singleflight
 import jsonlines 
+import argparse
 import csv
 
 
-def process_csv_and_write_jsonl(csv_file_path, jsonl_file_path):
+def process_csv_and_write_jsonl(csv_file_path, jsonl_file_path, reuse_previous=True, store_texts=True, adaptive=False):
+    """
+    Searches every question of the eval CSV and writes one result per line.
+
+    When `reuse_previous` is set, questions already present in the existing JSONL file (same
+    question and brand) keep their stored result, so only new or changed questions are searched.
+
+    With `store_texts`, extractive answers and segments are written once to the file's text store
+    (see src/utils/textstore.py) and the records only hold their hashes.
+
+    With `adaptive`, a question is only expanded into variants when its original search is weak
+    (see multi_query_search), so records may hold fewer variants.
+    """
+    previous = load_previous_records(jsonl_file_path) if reuse_previous else {}
+    texts = TextStore(text_store_path(jsonl_file_path)) if store_texts else None
+    reused = 0
     with open(csv_file_path, mode='r', encoding='utf-8') as file:
         reader = csv.DictReader(file)
         with jsonlines.open(jsonl_file_path, mode='w') as writer:
             for row in reader:
                 query = row['question']
                 brand = row['filter']
-                logger.info(f'Performing doc search for query={query}')
-                search_result = multi_query_search(query, brand)
+                stored = previous.get(row_key(query, brand))
+                if stored is not None:
+                    writer.write(externalize_texts(stored, texts) if texts is not None else stored)
+                    reused += 1
+                    continue
+                logger.info(f'Performing doc search for query={query}', extra={'sampled': True})
+                search_result = multi_query_search(query, brand, adaptive=adaptive)
                 # Include the query and brand in the result
                 search_result.update({"query": query, "brand": brand})
+                if texts is not None:
+                    search_result = externalize_texts(search_result, texts)
                 writer.write(search_result)
+    logger.info(f"Reused {reused} stored search results")
+    logger.info(f"Single-flight: {singleflight.stats()}")
+    if adaptive:
+        logger.info(f"Adaptive multi-query: {adaptive_stats()}")
 
-# Define file paths
-csv_file_path = './data/input/eval_2.csv'
-jsonl_file_path = './data/results/eval_2_mq_doc_search_new.jsonl'
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Multi-query search over every question of an eval CSV.')
+    parser.add_argument('--csv', default='./data/input/eval_2.csv', help='Eval CSV.')
+    parser.add_argument('--output', default='./data/results/eval_2_mq_doc_search_new.jsonl', help='Search results JSONL.')
+    parser.add_argument('--adaptive', action='store_true', help='Expand a question only when its original search is weak.')
+    args = parser.parse_args()
 
-# Process the CSV file and write to a JSONL file
-process_csv_and_write_jsonl(csv_file_path, jsonl_file_path)
\ No newline at end of file
+    # Process the CSV file and write to a JSONL file
+    process_csv_and_write_jsonl(args.csv, args.output, adaptive=args.adaptive)
\ No newline at end of file
@@ -0,0 +1,255 @@
+from src.insights.compare import normalize_outcomes
+from src.utils.incremental import row_key
+from src.utils.cache import content_hash
+from src.config.logging import logger
+from statistics import NormalDist
+from typing import Optional
+from typing import Tuple
+from typing import List
+from typing import Dict
+from typing import Any
+import pandas as pd
+import numpy as np
+import argparse
+import math
+
+
+STRATA = ['filter', 'pass_fail', 'article_id']  # Coarsest first; rare strata fall back to a prefix of this list
+MIN_STRATUM_SIZE = 3  # Smaller strata are merged into their parent stratum
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_MARGIN = 0.05
+OUTCOME_SCORES = {'Pass': 1.0, 'Partial Pass': 0.5, 'Fail': 0.0}
+
+
+def z_score(confidence: float) -> float:
+    """ Two-sided standard normal quantile of a confidence level, e.g. 1.96 for 0.95. """
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def wilson_interval(successes: float, n: int, confidence: float = DEFAULT_CONFIDENCE) -> Tuple[float, float]:
+    """
+    Wilson score interval of a proportion. Unlike the normal approximation it stays inside [0, 1]
+    and is usable for the small per-brand counts of a sample.
+
+    Args:
+    successes (float): Number of successes. Partial passes may count as half.
+    n (int): Number of trials.
+    confidence (float): Confidence level of the interval.
+
+    Returns:
+    Tuple[float, float]: Lower and upper bound; (0.0, 1.0) if n is 0.
+    """
+    if n == 0:
+        return 0.0, 1.0
+    z = z_score(confidence)
+    p = successes / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+def required_sample_size(population: int, confidence: float = DEFAULT_CONFIDENCE, margin: float = DEFAULT_MARGIN) -> int:
+    """
+    Number of rows needed to estimate a pass rate within +/- margin at the given confidence level.
+
+    Uses the worst case p = 0.5 with the finite population correction, e.g. 166 of 291 rows
+    at 95% +/- 5% and 56 at 90% +/- 10%.
+
+    Args:
+    population (int): Number of rows in the full eval set.
+    confidence (float): Confidence level.
+    margin (float): Half-width of the confidence interval.
+
+    Returns:
+    int: The sample size, at most the population.
+    """
+    z = z_score(confidence)
+    n0 = z * z * 0.25 / (margin * margin)
+    return min(population, math.ceil(n0 / (1 + (n0 - 1) / population)))
+
+
+def stratum_labels(df: pd.DataFrame, strata: List[str] = STRATA, min_size: int = MIN_STRATUM_SIZE) -> pd.Series:
+    """
+    Assigns every eval row to a stratum.
+
+    A row's stratum is the combination of all `strata` columns if at least min_size rows share it.
+    Otherwise the last column is dropped and the row joins the coarser stratum, and so on. Most
+    articles have one or two questions, so article IDs only separate articles asked about often,
+    while brand and outcome are kept for nearly every row.
+
+    Args:
+    df (pd.DataFrame): The eval set.
+    strata (List[str]): Columns to stratify by, coarsest first. pass_fail is normalized to Pass/Partial Pass/Fail.
+    min_size (int): Minimum number of rows per stratum.
+
+    Returns:
+    pd.Series: The stratum of each row, indexed like df.
+    """
+    columns = pd.DataFrame({column: df[column].astype(object) for column in strata}, index=df.index)
+    if 'pass_fail' in strata:
+        columns['pass_fail'] = pd.Series(normalize_outcomes(df['pass_fail']), index=df.index).astype(object)
+    columns = columns.where(columns.notna(), 'none').astype(str)
+
+    labels = pd.Series('', index=df.index, dtype=object)
+    for depth in range(len(strata), 0, -1):
+        unresolved = labels == ''
+        keys = columns.loc[unresolved, strata[:depth]].agg(' | '.join, axis=1)
+        sizes = keys.map(keys.value_counts())
+        resolved = sizes.index[sizes >= min_size]
+        labels[resolved] = keys[resolved]
+    labels[labels == ''] = 'other'
+    return labels
+
+
+def allocate(sizes: pd.Series, n: int) -> pd.Series:
+    """
+    Splits a sample of n rows across strata in proportion to their sizes (largest remainder).
+    Every stratum gets at least one row when n allows it.
+
+    Args:
+    sizes (pd.Series): Number of rows per stratum.
+    n (int): Sample size.
+
+    Returns:
+    pd.Series: Number of rows drawn from each stratum, summing to n.
+    """
+    exact = sizes / sizes.sum() * n
+    counts = np.floor(exact).astype(int)
+    if n >= len(sizes):
+        counts = counts.clip(lower=1)
+    counts = counts.clip(upper=sizes)
+    while counts.sum() > n:
+        # Take the rows given out by the minimum-one rule back from the most over-allocated stratum
+        surplus = (counts - exact)[counts > 1]
+        counts[surplus.idxmax()] -= 1
+    remainders = (exact - np.floor(exact)).sort_values(ascending=False, kind='stable')
+    while counts.sum() < n:
+        for stratum in remainders.index:
+            if counts.sum() < n and counts[stratum] < sizes[stratum]:
+                counts[stratum] += 1
+    return counts
+
+
+def sample_rows(df: pd.DataFrame, size: Optional[int] = None, confidence: Optional[float] = None,
+                margin: float = DEFAULT_MARGIN, strata: List[str] = STRATA, seed: int = 0,
+                min_stratum_size: int = MIN_STRATUM_SIZE) -> List[int]:
+    """
+    Draws a reproducible stratified sample of an eval set.
+
+    The size is either given or derived from a confidence level and margin. Within each stratum,
+    rows are drawn in an order fixed by the seed and each row's question and brand. The same
+    seed therefore gives the same sample on every run, and a larger sample mostly adds rows to a
+    smaller one rather than replacing them.
+
+    Args:
+    df (pd.DataFrame): The eval set, with question, filter, pass_fail and article_id columns.
+    size (Optional[int]): Number of rows to draw.
+    confidence (Optional[float]): Confidence level the sample size is derived from if size is None.
+    margin (float): Margin of error the sample size is derived from if size is None.
+    strata (List[str]): Columns to stratify by, coarsest first.
+    seed (int): Seed of the draw.
+    min_stratum_size (int): Minimum number of rows per stratum, see stratum_labels.
+
+    Returns:
+    List[int]: Sorted row positions of the sample; all rows if neither size nor confidence is given.
+    """
+    if size is None and confidence is None:
+        return list(range(len(df)))
+    n = min(len(df), size if size is not None else required_sample_size(len(df), confidence, margin))
+    labels = stratum_labels(df, strata, min_stratum_size)
+    counts = allocate(labels.value_counts(), n)
+    if counts.sum() != n:
+        logger.error(f"Allocated {counts.sum()} rows across strata instead of {n}")
+
+    order = [content_hash(seed, row_key(str(question), str(brand))) for question, brand in zip(df['question'], df['filter'])]
+    draw = pd.DataFrame({'stratum': labels.to_numpy(), 'order': order, 'position': range(len(df))})
+    draw = draw.sort_values(['order', 'position'], kind='stable')
+    draw = draw[draw.groupby('stratum').cumcount() < draw['stratum'].map(counts)]
+    logger.info(f"Sampled {len(draw)} of {len(df)} rows from {len(counts)} strata (seed {seed})")
+    return sorted(draw['position'].tolist())
+
+
+def outcome_scores(values: pd.Series) -> pd.Series:
+    """ Maps pass_fail strings or numeric labels onto 1.0 (Pass), 0.5 (Partial Pass) and 0.0 (Fail); unknown values become NaN. """
+    return pd.Series(normalize_outcomes(values), index=values.index).astype(object).map(OUTCOME_SCORES)
+
+
+def rate_with_interval(scores: pd.Series, confidence: float = DEFAULT_CONFIDENCE) -> Dict[str, Any]:
+    """ Mean of 0/1 (or 0.5) scores with its Wilson interval. Missing scores are left out. """
+    scores = scores.dropna()
+    low, high = wilson_interval(float(scores.sum()), len(scores), confidence)
+    return {'rate': scores.mean() if len(scores) else float('nan'), 'low': low, 'high': high, 'n': len(scores)}
+
+
+def summarize_rates(scores: pd.Series, groups: Optional[pd.Series] = None, confidence: float = DEFAULT_CONFIDENCE) -> pd.DataFrame:
+    """
+    Rate and confidence interval overall and per group.
+
+    Args:
+    scores (pd.Series): Per-row scores in [0, 1], e.g. from outcome_scores.
+    groups (Optional[pd.Series]): Group of each row, e.g. the brand.
+    confidence (float): Confidence level of the intervals.
+
+    Returns:
+    pd.DataFrame: One row for 'all' and one per group, with rate, low, high and n columns.
+    """
+    rows = {'all': rate_with_interval(scores, confidence)}
+    if groups is not None:
+        for group, part in scores.groupby(groups):
+            rows[group] = rate_with_interval(part, confidence)
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def format_rate(summary: Dict[str, Any], confidence: float = DEFAULT_CONFIDENCE) -> str:
+    """ Formats a rate_with_interval result, e.g. '0.62 (95% CI 0.56-0.68, n=166)'. """
+    return f"{summary['rate']:.2f} ({confidence:.0%} CI {summary['low']:.2f}-{summary['high']:.2f}, n={summary['n']})"
+
+
+def write_sample(csv_path: str, output_path: str, jsonl_path: Optional[str] = None, jsonl_output_path: Optional[str] = None,
+                 **sample_args: Any) -> List[int]:
+    """
+    Writes a stratified sample of an eval CSV and, optionally, the matching lines of its search results.
+
+    The search result files hold one line per eval row, so the same positions are kept in both.
+
+    Args:
+    csv_path (str): The full eval CSV.
+    output_path (str): Where the sampled CSV is written.
+    jsonl_path (Optional[str]): Search results of the full eval set.
+    jsonl_output_path (Optional[str]): Where the sampled search results are written.
+    **sample_args: Passed to sample_rows (size, confidence, margin, seed, ...).
+
+    Returns:
+    List[int]: The sampled row positions.
+    """
+    df = pd.read_csv(csv_path)
+    positions = sample_rows(df, **sample_args)
+    df.iloc[positions].to_csv(output_path, index=False)
+    if jsonl_path and jsonl_output_path:
+        with open(jsonl_path, 'r') as file:
+            lines = [line for line in file if line.strip()]
+        with open(jsonl_output_path, 'w') as file:
+            file.writelines(lines[position] for position in positions)
+
+    full = rate_with_interval(outcome_scores(df['pass_fail']))
+    sampled = rate_with_interval(outcome_scores(df['pass_fail'].iloc[positions]))
+    logger.info(f"Wrote {len(positions)} rows to {output_path}. Pass rate of the sample: {format_rate(sampled)}, "
+                f"of the full set: {full['rate']:.2f}")
+    return positions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a reproducible stratified sample of an eval set.')
+    parser.add_argument('--csv', default='./data/input/eval.csv', help='Full eval CSV.')
+    parser.add_argument('--output', default='./data/input/eval_sample.csv', help='Sampled eval CSV.')
+    parser.add_argument('--jsonl', help='Search results of the full eval set, sampled alongside the CSV.')
+    parser.add_argument('--jsonl-output', help='Where the sampled search results are written.')
+    parser.add_argument('--size', type=int, help='Number of rows to draw.')
+    parser.add_argument('--confidence', type=float, default=DEFAULT_CONFIDENCE, help='Confidence level the size is derived from when --size is not given.')
+    parser.add_argument('--margin', type=float, default=DEFAULT_MARGIN, help='Margin of error the size is derived from when --size is not given.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    write_sample(args.csv, args.output, args.jsonl, args.jsonl_output, size=args.size,
+                 confidence=None if args.size else args.confidence, margin=args.margin, seed=args.seed)
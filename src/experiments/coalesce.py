@@ -1,35 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.cache import content_hash
 from src.utils.io import save_to_excel
+from src.config.logging import logger
+from src.utils.cache import JsonlCache
 from src.utils.io import save_to_csv
 from src.generate.llm import LLM
-import pandas as pd 
+from typing import Optional
+from typing import List
+import pandas as pd
+import re
+
+
+ANSWER_COLUMNS = ['ans_exp_1', 'ans_exp_2', 'ans_exp_3']
+CACHE_PATH = './data/results/.cache/coalesce.jsonl'
+# Lead-ins the format step sometimes adds, e.g. "Sure, here is the formatted answer:" or "**Formatted Answer:**".
+# coalesce_answer removes them; rows resolved without it have them stripped here.
+PREAMBLE_PATTERN = re.compile(
+    r"^[\s*#]*(?:(?:sure|okay|ok|certainly)\b[,!.]?\s*)?"
+    r"(?:here(?:\s+is|'s)\s+(?:the|a|your)\s+(?:\w+\s+)?answer\b[^:\n]*[:.]"
+    r"|(?:formatted|combined|compiled|final)\s+answer\s*(?::|[*\s]*(?=\n|$)))[*\s]*",
+    re.IGNORECASE)
+
+
+def strip_preamble(answer: str) -> str:
+    """ Removes a lead-in like "Sure, here is the formatted answer:" from the start of an answer. """
+    return PREAMBLE_PATTERN.sub('', answer.strip(), count=1).strip()
 
 
 def merge_answers(df: pd.DataFrame) -> list:
     """ Merges answers from different columns of a DataFrame into a single list. """
-    merged_answers = []
-    for _, row in df.iterrows():
-        ans_exp_1, ans_exp_2, ans_exp_3 = row['ans_exp_1'], row['ans_exp_2'], row['ans_exp_3']
-        merged_ans = ['Answer 1', ans_exp_1, '\n\n', 'Answer 2', ans_exp_2, '\n\n', 'Answer 3', ans_exp_3]
-        merged_answers.append('\n'.join(merged_ans))
-    return merged_answers
+    answers = df[ANSWER_COLUMNS].fillna('').astype(str)
+    merged = ('Answer 1\n' + answers['ans_exp_1'] + '\n\n\n\n'
+              + 'Answer 2\n' + answers['ans_exp_2'] + '\n\n\n\n'
+              + 'Answer 3\n' + answers['ans_exp_3'])
+    return merged.tolist()
+
+
+def resolve_trivial_answers(df: pd.DataFrame) -> List[Optional[str]]:
+    """
+    Resolves rows whose answers need no LLM call to combine.
+
+    A row is trivial when, after stripping lead-ins (see strip_preamble) and dropping empty answers
+    and duplicates (ignoring case and whitespace), at most one answer remains.
+
+    Args:
+    df (pd.DataFrame): Consolidated results with the ans_exp_* columns.
+
+    Returns:
+    List[Optional[str]]: The final answer of each trivial row, or None for rows that still need coalescing.
+    """
+    answers = df[ANSWER_COLUMNS].fillna('').astype(str).apply(lambda column: column.map(strip_preamble))
+    normalized = answers.apply(lambda column: column.str.lower().str.split().str.join(' '))
+
+    resolved = []
+    for originals, keys in zip(answers.itertuples(index=False), normalized.itertuples(index=False)):
+        candidates = {}
+        for original, key in zip(originals, keys):
+            if key and key not in candidates:
+                candidates[key] = original
+        if len(candidates) <= 1:
+            resolved.append(next(iter(candidates.values()), ''))
+        else:
+            resolved.append(None)
+    return resolved
 
-def coalesce_answers(merged_answers: list, llm: LLM) -> list:
-    """ Coalesces merged answers using the provided language model. """
-    return [llm.coalesce_answer(ans) for ans in merged_answers]
 
+def coalesce_answers(merged_answers: list, llm: LLM, max_workers: int = 8, cache: Optional[JsonlCache] = None) -> list:
+    """
+    Coalesces merged answers using the provided language model.
 
-def main():
+    Identical inputs are sent once, cached results are reused and the remaining calls run concurrently.
+
+    Args:
+    merged_answers (list): Merged answer strings.
+    llm (LLM): The language model.
+    max_workers (int): Maximum number of concurrent coalesce calls.
+    cache (Optional[JsonlCache]): Cache of coalesced answers keyed by the hash of the merged input.
+
+    Returns:
+    list: The coalesced answer for each merged input, in order.
+    """
+    cache = cache if cache is not None else JsonlCache()
+    keys = [content_hash('coalesce_answer', merged) for merged in merged_answers]
+    pending = {}
+    for key, merged in zip(keys, merged_answers):
+        if key not in pending and cache.get(key) is None:
+            pending[key] = merged
+
+    logger.info(f"Coalescing {len(pending)} unique answers ({len(merged_answers) - len(pending)} deduplicated or cached)")
+
+    def coalesce(item):
+        key, merged = item
+        answer = llm.coalesce_answer(merged)
+        if answer is not None:
+            cache.set(key, answer)
+        return key, answer
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for key, answer in executor.map(coalesce, pending.items()):
+            results[key] = answer
+    return [results[key] if key in results else cache.get(key) for key in keys]
+
+
+def main(consolidated_path: str = './data/results/consolidated.csv',
+         csv_output_path: str = './data/results/coalesced.csv',
+         excel_output_path: str = './data/results/coalesced.xlsx'):
     llm = LLM()
-    df = pd.read_csv('./data/results/consolidated.csv')
+    df = pd.read_csv(consolidated_path)
 
-    merged_answers = merge_answers(df)
-    coalesced_answers = coalesce_answers(merged_answers, llm)
-    df['final_answer'] = coalesced_answers
+    final_answers = resolve_trivial_answers(df)
+    needs_llm = [i for i, answer in enumerate(final_answers) if answer is None]
+    logger.info(f"{len(df) - len(needs_llm)} of {len(df)} rows resolved without an LLM call")
 
-    # Save the combined DataFrame as new CSV and Excel files
-    csv_output_path = './data/results/coalesced.csv'
-    excel_output_path = './data/results/coalesced.xlsx'
+    merged_answers = merge_answers(df.iloc[needs_llm])
+    coalesced_answers = coalesce_answers(merged_answers, llm, cache=JsonlCache(CACHE_PATH))
+    for i, answer in zip(needs_llm, coalesced_answers):
+        final_answers[i] = answer
+    df['final_answer'] = final_answers
 
+    # Save the combined DataFrame as new CSV and Excel files
     save_to_csv(df, csv_output_path)
     save_to_excel(df, excel_output_path)
 
@@ -18,20 +18,17 @@ def combine_dataframes_columnwise(dfs: list) -> pd.DataFrame:
     return combined_df.loc[:, ~combined_df.columns.duplicated()]
 
 
-def main():
+def main(experiment_paths: list = ('./data/results/exp_1.csv', './data/results/exp_2.csv', './data/results/exp_3.csv'),
+         consolidated_columnwise_file: str = './data/results/consolidated.csv',
+         excel_output_path: str = './data/results/consolidated.xlsx'):
     """ Main function to execute the script tasks. """
     # Load the CSV files
-    exp_1 = load_csv('./data/results/exp_1.csv')
-    exp_2 = load_csv('./data/results/exp_2.csv')
-    exp_3 = load_csv('./data/results/exp_3.csv')
+    experiments = [load_csv(path) for path in experiment_paths]
 
     # Combine the DataFrames column-wise
-    consolidated_columnwise = combine_dataframes_columnwise([exp_1, exp_2, exp_3])
+    consolidated_columnwise = combine_dataframes_columnwise(experiments)
 
     # Save the consolidated DataFrame to new CSV and Excel files
-    consolidated_columnwise_file = './data/results/consolidated.csv'
-    excel_output_path = './data/results/consolidated.xlsx'
-
     save_to_csv(consolidated_columnwise, consolidated_columnwise_file)
     save_to_excel(consolidated_columnwise, excel_output_path)
 
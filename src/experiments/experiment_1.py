@@ -1,27 +1,44 @@
-from search.retriever import read_jsonl_file
+from src.utils.incremental import save_row_fingerprints
+from src.utils.incremental import load_previous_rows
+from src.utils.incremental import jsonl_fingerprints
+from src.utils.incremental import reuse_or_compute
+from src.utils.incremental import code_version
+from src.utils.incremental import LLM_SOURCE
+from src.search.citations import parse_citations
+from src.search.retriever import read_jsonl_file
+from src.search.retriever import QueryResults
 from src.utils.io import save_to_excel
 from src.config.logging import logger
 from src.utils.io import save_to_csv
 from src.generate.llm import LLM
-from typing import List, Dict
+from typing import List, Dict, Optional
 import pandas as pd
 
 # Initialize the Language Model
 llm = LLM()
 
-def read_and_process_jsonl(file_path: str) -> List[Dict]:
-    """ Reads and processes data from a JSONL file. """
+OUTPUT_COLUMNS = ['brand', 'ans_exp_1', 'matched_articles_new']
+
+def process_query_result(query_result: QueryResults) -> Dict:
+    """ Formats the summarized answer of a single query. """
+    matched_articles_new = []
+    matches = query_result.results
+    citations = parse_citations(query_result.summarized_answer)
+    for rank, match in matches.items():
+        if rank in citations:
+            matched_articles_new.append(match.knowledge_id)
+    return {'brand': query_result.brand, 'ans_exp_1': llm.format_answer(citations.text), 'matched_articles_new': '\n'.join(matched_articles_new)}
+
+def read_and_process_jsonl(file_path: str, previous: Optional[Dict[str, Dict]] = None) -> List[Dict]:
+    """ Reads and processes data from a JSONL file. Rows of `previous` whose search result is unchanged are reused. """
     out_data = []
+    stats = {}
     try:
         query_results = read_jsonl_file(file_path)
-        for query_result in query_results:
-            matched_articles_new = []
-            matches = query_result.results
-            citations = query_result.extract_citations(query_result.summarized_answer)
-            for rank, match in matches.items():
-                if rank in citations:
-                    matched_articles_new.append(match.knowledge_id)
-            out_data.append({'brand': query_result.brand, 'ans_exp_1': llm.format_answer(query_result.summarized_answer), 'matched_articles_new': '\n'.join(matched_articles_new)})
+        fingerprints = jsonl_fingerprints(file_path, code_version(__file__, LLM_SOURCE))
+        for query_result, fingerprint in zip(query_results, fingerprints):
+            out_data.append(reuse_or_compute(fingerprint, previous, lambda: process_query_result(query_result), stats))
+        logger.info(f"Rows reused: {stats.get('reused', 0)}, computed: {stats.get('computed', 0)}")
         return out_data
     except Exception as e:
         logger.error(f"Error reading or processing JSONL file: {e}")
@@ -45,16 +62,14 @@ def combine_dataframes(df_csv: pd.DataFrame, df_jsonl: pd.DataFrame) -> pd.DataF
         return pd.DataFrame()
 
 
-def main():
+def main(jsonl_file_path: str = './data/results/eval_doc_search.jsonl',
+         csv_file_path: str = './data/input/eval.csv',
+         concat_csv_path: str = './data/results/exp_1.csv',
+         excel_output_path: str = './data/results/exp_1.xlsx'):
     """ Main function to execute the script tasks. """
-    # File paths
-    jsonl_file_path = './data/results/eval_doc_search.jsonl'
-    csv_file_path = './data/input/eval.csv'
-    concat_csv_path = './data/results/exp_1.csv'
-    excel_output_path = './data/results/exp_1.xlsx'
-
     logger.info("Reading and processing JSONL file.")
-    jsonl_data = read_and_process_jsonl(jsonl_file_path)
+    previous = load_previous_rows(concat_csv_path, OUTPUT_COLUMNS)
+    jsonl_data = read_and_process_jsonl(jsonl_file_path, previous)
     df_jsonl = pd.DataFrame(jsonl_data)
 
     df_csv = read_csv(csv_file_path)
@@ -66,6 +81,7 @@ def main():
         return
 
     save_to_csv(df_combined, concat_csv_path)
+    save_row_fingerprints(concat_csv_path, jsonl_fingerprints(jsonl_file_path, code_version(__file__, LLM_SOURCE)))
     save_to_excel(df_combined, excel_output_path)
 
 if __name__ == "__main__":
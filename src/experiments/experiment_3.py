@@ -1,36 +1,53 @@
-from search.retriever import read_jsonl_file
+from src.utils.incremental import save_row_fingerprints
+from src.utils.incremental import load_previous_rows
+from src.utils.incremental import jsonl_fingerprints
+from src.utils.incremental import reuse_or_compute
+from src.utils.incremental import code_version
+from src.utils.incremental import LLM_SOURCE
+from src.search.retriever import read_jsonl_file
+from src.search.retriever import QueryResults
 from src.utils.io import save_to_excel
 from src.config.logging import logger
 from src.utils.io import save_to_csv
 from src.generate.llm import LLM
-from typing import List, Dict
+from typing import List, Dict, Optional
 import pandas as pd
 
 llm = LLM()
 
-def extract_and_process_data(file_path: str) -> List[Dict]:
-    """ Extracts and processes data from a JSONL file. """
+OUTPUT_COLUMNS = ['brand', 'ans_exp_3', 'matched_articles_new']
+
+def process_query_result(query_result: QueryResults) -> Dict:
+    """ Answers a single query from its search result. """
+    matched_articles_new = []
+    summarized_answer = query_result.summarized_answer
+    citations = query_result.extract_citations(summarized_answer)
+    context = '\n\n'.join([query_result.get_extractive_segment_by_rank(rank) for rank in citations])
+    query = query_result.query
+    ans = llm.find_answer(query, context)
+    matches = query_result.results
+    for rank, match in matches.items():
+        if rank in citations:
+            matched_articles_new.append(match.knowledge_id)
+    return {
+        'brand': query_result.brand,
+        'ans_exp_3': llm.format_answer(ans),
+        'matched_articles_new': '\n'.join(matched_articles_new)
+    }
+
+
+def extract_and_process_data(file_path: str, previous: Optional[Dict[str, Dict]] = None) -> List[Dict]:
+    """ Extracts and processes data from a JSONL file. Rows of `previous` whose search result is unchanged are reused. """
     out_data = []
+    stats = {}
     try:
         query_results = read_jsonl_file(file_path)
-        for query_result in query_results:
-            matched_articles_new = []
-            summarized_answer = query_result.summarized_answer
-            citations = query_result.extract_citations(summarized_answer)
-            context = '\n\n'.join([query_result.get_extractive_segment_by_rank(rank) for rank in citations])
-            query = query_result.query
-            ans = llm.find_answer(query, context)
-            matches = query_result.results
-            for rank, match in matches.items():
-                if rank in citations:
-                    matched_articles_new.append(match.knowledge_id)
-            out_data.append({
-                'brand': query_result.brand,
-                'ans_exp_3': llm.format_answer(ans),
-                'matched_articles_new': '\n'.join(matched_articles_new)
-            })
+        fingerprints = jsonl_fingerprints(file_path, code_version(__file__, LLM_SOURCE))
+        for query_result, fingerprint in zip(query_results, fingerprints):
+            out_data.append(reuse_or_compute(fingerprint, previous, lambda: process_query_result(query_result), stats))
     except Exception as e:
         logger.error(f"Error in extracting and processing JSONL data: {e}")
+    logger.info(f"Rows reused: {stats.get('reused', 0)}, computed: {stats.get('computed', 0)}")
     return out_data
 
 def read_and_drop_csv(file_path: str, columns_to_drop: List[str]) -> pd.DataFrame:
@@ -51,15 +68,13 @@ def combine_dataframes(df1: pd.DataFrame, df2: pd.DataFrame) -> pd.DataFrame:
         return pd.DataFrame()
 
 
-def main():
+def main(jsonl_file_path: str = './data/results/eval_doc_search.jsonl',
+         csv_file_path: str = './data/input/eval.csv',
+         concat_csv_path: str = './data/results/exp_3.csv',
+         excel_output_path: str = './data/results/exp_3.xlsx'):
     """ Main function to execute the script tasks. """
-    # File paths
-    jsonl_file_path = './data/results/eval_doc_search.jsonl'
-    csv_file_path = './data/input/eval.csv'
-    concat_csv_path = './data/results/exp_3.csv'
-    excel_output_path = './data/results/exp_3.xlsx'
-
-    jsonl_data = extract_and_process_data(jsonl_file_path)
+    previous = load_previous_rows(concat_csv_path, OUTPUT_COLUMNS)
+    jsonl_data = extract_and_process_data(jsonl_file_path, previous)
     df_jsonl = pd.DataFrame(jsonl_data)
 
     df_csv_dropped = read_and_drop_csv(csv_file_path, ['filter'])
@@ -71,6 +86,7 @@ def main():
         return
 
     save_to_csv(df_combined, concat_csv_path)
+    save_row_fingerprints(concat_csv_path, jsonl_fingerprints(jsonl_file_path, code_version(__file__, LLM_SOURCE)))
     save_to_excel(df_combined, excel_output_path)
 
 if __name__ == "__main__":
@@ -1,92 +1,59 @@
+from src.utils.pdf import extract_text_from_gcs_pdf
+from src.utils.incremental import save_row_fingerprints
+from src.utils.incremental import load_previous_rows
+from src.utils.incremental import jsonl_fingerprints
+from src.utils.incremental import reuse_or_compute
+from src.utils.incremental import code_version
+from src.utils.incremental import LLM_SOURCE
 from src.search.retriever import read_jsonl_file
+from src.search.retriever import QueryResults
 from src.utils.io import save_to_excel
 from src.config.logging import logger
 from src.utils.io import save_to_csv
 from src.generate.llm import LLM
-from google.cloud import storage
 from typing import Optional
 from typing import List
 from typing import Dict
 import pandas as pd
-import PyPDF2
-import io
 
 
 llm = LLM()
 
-def extract_text_from_gcs_pdf(gcs_url: str) -> Optional[str]:
-    """
-    Extracts text from a PDF file stored in Google Cloud Storage.
-
-    Args:
-    gcs_url (str): The URL of the PDF file in Google Cloud Storage. 
-                   Format: 'gs://bucket-name/path/to/pdf/file.pdf'
-
-    Returns:
-    Optional[str]: Extracted text from the PDF or None if extraction fails.
-    """
-    try:
-        # Extract bucket name and blob name from the URL
-        if not gcs_url.startswith("gs://"):
-            raise ValueError("URL must start with 'gs://'")
-
-        parts = gcs_url[5:].split('/', 1)
-        if len(parts) < 2:
-            raise ValueError("Invalid GCS URL format")
-
-        bucket_name, blob_name = parts
-
-        # Initialize Google Cloud Storage client
-        storage_client = storage.Client()
-
-        # Access the bucket and blob
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-
-        # Download the blob to a BytesIO object
-        pdf_bytes = io.BytesIO()
-        blob.download_to_file(pdf_bytes)
-        pdf_bytes.seek(0)
-
-        # Read PDF and extract text
-        reader = PyPDF2.PdfReader(pdf_bytes)
-        text = ''
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text
-
-        return text
-
-    except Exception as e:
-        logger.error(f"An error occurred: {e}")
-        return None
-
-def extract_and_process_data(file_path: str) -> List[Dict]:
-    """ Extracts and processes data from a JSONL file. """
+OUTPUT_COLUMNS = ['brand', 'ans_exp_4', 'matched_articles_new']
+
+def process_query_result(query_result: QueryResults) -> Dict:
+    """ Answers a single query from its search result. """
+    matched_articles_new = []
+    summarized_answer = query_result.summarized_answer
+    citations = query_result.extract_citations(summarized_answer)
+    most_cited = query_result.most_cited(summarized_answer)[0]
+    matches = query_result.results
+    top_match = matches.get(most_cited)
+    query = query_result.query
+    context = extract_text_from_gcs_pdf(top_match.link)
+    ans = llm.find_answer(query, context)
+    for rank, match in matches.items():
+        if rank in citations:
+            matched_articles_new.append(match.knowledge_id)
+    return {
+        'brand': query_result.brand,
+        'ans_exp_4': llm.format_answer(ans),
+        'matched_articles_new': '\n'.join(matched_articles_new)
+    }
+
+
+def extract_and_process_data(file_path: str, previous: Optional[Dict[str, Dict]] = None) -> List[Dict]:
+    """ Extracts and processes data from a JSONL file. Rows of `previous` whose search result is unchanged are reused. """
     out_data = []
+    stats = {}
     try:
         query_results = read_jsonl_file(file_path)
-        for query_result in query_results:
-            matched_articles_new = []
-            summarized_answer = query_result.summarized_answer
-            citations = query_result.extract_citations(summarized_answer)
-            most_cited = query_result.most_cited(summarized_answer)[0]
-            matches = query_result.results
-            top_match = matches.get(most_cited)
-            query = query_result.query
-            context = extract_text_from_gcs_pdf(top_match.link)
-            ans = llm.find_answer(query, context)
-            for rank, match in matches.items():
-                if rank in citations:
-                    matched_articles_new.append(match.knowledge_id)
-            out_data.append({
-                'brand': query_result.brand,
-                'ans_exp_4': llm.format_answer(ans),
-                'matched_articles_new': '\n'.join(matched_articles_new)
-            })
+        fingerprints = jsonl_fingerprints(file_path, code_version(__file__, LLM_SOURCE))
+        for query_result, fingerprint in zip(query_results, fingerprints):
+            out_data.append(reuse_or_compute(fingerprint, previous, lambda: process_query_result(query_result), stats))
     except Exception as e:
         logger.error(f"Error in extracting and processing JSONL data: {e}")
+    logger.info(f"Rows reused: {stats.get('reused', 0)}, computed: {stats.get('computed', 0)}")
     return out_data
 
 def read_and_drop_csv(file_path: str, columns_to_drop: List[str]) -> pd.DataFrame:
@@ -115,7 +82,8 @@ def main():
     concat_csv_path = './data/results/exp_4.csv'
     excel_output_path = './data/results/exp_4.xlsx'
 
-    jsonl_data = extract_and_process_data(jsonl_file_path)
+    previous = load_previous_rows(concat_csv_path, OUTPUT_COLUMNS)
+    jsonl_data = extract_and_process_data(jsonl_file_path, previous)
     df_jsonl = pd.DataFrame(jsonl_data)
 
     df_csv_dropped = read_and_drop_csv(csv_file_path, ['filter'])
@@ -127,6 +95,7 @@ def main():
         return
 
     save_to_csv(df_combined, concat_csv_path)
+    save_row_fingerprints(concat_csv_path, jsonl_fingerprints(jsonl_file_path, code_version(__file__, LLM_SOURCE)))
     save_to_excel(df_combined, excel_output_path)
 
 if __name__ == "__main__":
@@ -1,81 +1,29 @@
 from src.search.multi_query_retriever import read_jsonl_file
+from src.search.multi_query_retriever import QueryResult
+from src.utils.pdf import extract_text_from_gcs_pdf
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.pdf import construct_gcs_url
 from src.utils.io import save_to_excel
 from src.config.logging import logger
 from src.utils.io import save_to_csv
+from src.utils.tracing import span
 from src.generate.llm import LLM
-from google.cloud import storage
 from typing import Optional
+from typing import Tuple
 from typing import List
 from typing import Dict 
 import pandas as pd
-import PyPDF2
-import io
+import re
 
 
-llm = LLM()
-
-def extract_text_from_gcs_pdf(gcs_url: str) -> Optional[str]:
-    """
-    Extracts text from a PDF file stored in Google Cloud Storage.
-
-    Args:
-    gcs_url (str): The URL of the PDF file in Google Cloud Storage. 
-                   Format: 'gs://bucket-name/path/to/pdf/file.pdf'
-
-    Returns:
-    Optional[str]: Extracted text from the PDF or None if extraction fails.
-    """
-    try:
-        # Extract bucket name and blob name from the URL
-        if not gcs_url.startswith("gs://"):
-            raise ValueError("URL must start with 'gs://'")
-
-        parts = gcs_url[5:].split('/', 1)
-        if len(parts) < 2:
-            raise ValueError("Invalid GCS URL format")
-
-        bucket_name, blob_name = parts
-
-        # Initialize Google Cloud Storage client
-        storage_client = storage.Client()
-
-        # Access the bucket and blob
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-
-        # Download the blob to a BytesIO object
-        pdf_bytes = io.BytesIO()
-        blob.download_to_file(pdf_bytes)
-        pdf_bytes.seek(0)
-
-        # Read PDF and extract text
-        reader = PyPDF2.PdfReader(pdf_bytes)
-        text = ''
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text
+MAP_MAX_CHARS = 20000  # Context read from each document in the map step
+DOMINANCE_RATIO = 2.0  # Top document weight over the runner-up above which its answer is used alone
+NO_ANSWER_PREFIX_CHARS = 200  # Non-answers say so up front; later mentions are part of real answers
+NO_ANSWER_PATTERN = re.compile(r"(does not|doesn't) (contain|provide|mention|specify)|not (found|mentioned|provided|specified) in|no (answer|information)|(cannot|can't|unable to) (find|be found|answer|determine)", re.IGNORECASE)
 
-        return text
-
-    except Exception as e:
-        logger.error(f"An error occurred: {e}")
-        return None
-    
-
-def construct_gcs_url(match_id: str) -> str:
-    """
-    Generates a Google Cloud Storage (GCS) URL for a PDF document based on its match ID.
-
-    Parameters:
-    - match_id (str): Unique identifier of the document.
-
-    Returns:
-    - str: GCS URL for the document.
-    """
-    base_url = 'gs://farmers-poc-as/documents-for-vertex-search-v1/pdfs_v3/{match_id}.pdf'
-    return base_url.format(match_id=match_id)
+llm = LLM()
 
+OUTPUT_COLUMNS = ['brand', 'ans_exp_5', 'cited_new', 'matched_article_new']
 
 def extract_and_process_data(file_path: str) -> List[Dict]:
     """ Extracts and processes data from a JSONL file. """
@@ -98,38 +46,117 @@ def extract_and_process_data(file_path: str) -> List[Dict]:
     return out_data
 
 
-def extract_and_process_data_top_k_ids(file_path: str) -> List[Dict]:
-    """ Extracts and processes data from a JSONL file. """
+def is_non_answer(answer: Optional[str]) -> bool:
+    """ True if a map step failed or the model said the document does not answer the query. """
+    return not answer or NO_ANSWER_PATTERN.search(answer[:NO_ANSWER_PREFIX_CHARS]) is not None
+
+
+def answer_from_document(query: str, match_id: str, max_chars: Optional[int] = MAP_MAX_CHARS) -> Optional[str]:
+    """
+    Map step: answers a query from a single document, reading at most max_chars of it.
+
+    Args:
+    query (str): The question.
+    match_id (str): The knowledge ID of the document.
+    max_chars (Optional[int]): Maximum number of document characters used as context.
+
+    Returns:
+    Optional[str]: The answer, or None if the document could not be read or the call failed.
+    """
+    context = extract_text_from_gcs_pdf(construct_gcs_url(match_id), max_chars=max_chars)
+    if context is None:
+        return None
+    return llm.find_answer(query, context)
+
+
+def answer_from_top_k(query: str, ranked_ids: List[Tuple[str, float]], executor: ThreadPoolExecutor,
+                      max_chars: Optional[int] = MAP_MAX_CHARS, dominance: float = DOMINANCE_RATIO) -> Tuple[Optional[str], List[str]]:
+    """
+    Answers a query across the top ranked documents with one concurrent map call per document and one reduce call.
+
+    All map calls start at once, so the wait is that of the slowest one. If the top document outweighs
+    the runner-up by `dominance` and its answer is substantive, it is returned as soon as it arrives,
+    without waiting for the other documents or reducing.
+
+    Args:
+    query (str): The question.
+    ranked_ids (List[Tuple[str, float]]): (knowledge ID, weight) pairs, best first, as from find_most_weighted_ids.
+    executor (ThreadPoolExecutor): Pool running the map calls.
+    max_chars (Optional[int]): Maximum number of characters of each document used as context.
+    dominance (float): Weight ratio of the top document to the runner-up above which its answer is used alone.
+
+    Returns:
+    Tuple[Optional[str], List[str]]: The answer and the IDs of the documents it came from. The answer is ''
+    if no document answers the query, and None if none does because a document could not be read or a call failed.
+    """
+    if not ranked_ids:
+        return '', []
+    futures = [executor.submit(answer_from_document, query, match_id, max_chars) for match_id, _ in ranked_ids]
+
+    with span('experiment_5.map_reduce', documents=len(futures)) as s:
+        top_id, top_weight = ranked_ids[0]
+        runner_up = ranked_ids[1][1] if len(ranked_ids) > 1 else 0.0
+        if top_weight >= dominance * runner_up:
+            top_answer = futures[0].result()
+            if not is_non_answer(top_answer):
+                for future in futures[1:]:
+                    future.cancel()
+                s.set(early_exit=True)
+                return top_answer, [top_id]
+
+        results = [(match_id, future.result()) for (match_id, _), future in zip(ranked_ids, futures)]
+        answers = [(match_id, answer) for match_id, answer in results if not is_non_answer(answer)]
+        s.set(answered=len(answers))
+        if not answers:
+            failed = any(answer is None for _, answer in results)
+            return None if failed else '', []
+        if len(answers) == 1:
+            return answers[0][1], [answers[0][0]]
+
+        merged = '\n\n\n\n'.join(f'Answer {i}\n{answer}' for i, (_, answer) in enumerate(answers, start=1))
+        combined = llm.coalesce_answer(merged)
+        if combined is None:
+            # Fall back to the best ranked answer rather than losing the row
+            return answers[0][1], [answers[0][0]]
+        return combined, [match_id for match_id, _ in answers]
+
+
+def process_query_result(query_result: QueryResult, executor: ThreadPoolExecutor, top_k: int = 3,
+                         max_chars: Optional[int] = MAP_MAX_CHARS) -> Dict:
+    """
+    Answers a single query from its top_k fused documents, running the map calls in `executor`.
+    ans_exp_5 is '' if no document answers the query and None if that is because a map call failed.
+    """
+    ans, answered_from = answer_from_top_k(query_result.query, query_result.match_ids[:top_k], executor, max_chars=max_chars)
+    logger.info(f"Answered '{query_result.query}' from {answered_from}", extra={'sampled': True})
+    return {
+        'brand': query_result.brand,
+        'ans_exp_5': ans,
+        'cited_new': query_result.cited_ids,
+        'matched_article_new': query_result.match_ids
+    }
+
+
+def extract_and_process_data_top_k_ids(file_path: str, top_k: int = 3, max_chars: Optional[int] = MAP_MAX_CHARS,
+                                       max_workers: int = 8) -> List[Dict]:
+    """
+    Extracts and processes data from a JSONL file, answering each query from its top_k fused documents.
+
+    Args:
+    file_path (str): Multi-query search results, as written by src/eval/doc_search_multi_query.py.
+    top_k (int): Number of documents answered from per query.
+    max_chars (Optional[int]): Maximum number of characters of each document used as context.
+    max_workers (int): Number of map calls running at once.
+
+    Returns:
+    List[Dict]: One row per query with the answer, the cited and the matched IDs.
+    """
     out_data = []
     try:
-        i = 0
         query_results = read_jsonl_file(file_path)
-        for query_result in query_results:
-            print(i+1)
-            match_ids = query_result.match_ids
-            cited_ids = query_result.cited_ids
-            query = query_result.query
-            context = []
-            """
-            for match_id in match_ids:
-                gcs_url = construct_gcs_url(match_id)
-                text = extract_text_from_gcs_pdf(gcs_url)
-                #context.append(text)
-                context = text
-                ans = llm.find_answer(query, context)
-                print(ans)
-            context = '\n\n'.join(context)
-            """
-            #ans = llm.find_answer(query, context)
-            ans = 'foobar'
-            out_data.append({
-                'brand': query_result.brand,
-                 # 'ans_exp_5': llm.format_answer(ans),
-                'ans_exp_5': ans,
-                'cited_new': cited_ids,
-                'matched_article_new': match_ids
-            })
-            i += 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for query_result in query_results:
+                out_data.append(process_query_result(query_result, executor, top_k=top_k, max_chars=max_chars))
     except Exception as e:
         logger.error(f"Error in extracting and processing JSONL data: {e}")
     return out_data
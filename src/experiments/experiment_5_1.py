@@ -1,79 +1,17 @@
+from src.utils.pdf import extract_text_from_gcs_pdf
+from src.utils.pdf import construct_gcs_url
 from src.config.logging import logger
 from collections import defaultdict
-from google.cloud import storage
 from src.generate.llm import LLM
-from PyPDF2 import PdfReader
-from typing import Optional
 from typing import Tuple
 from typing import List
 from typing import Dict 
 import pandas as pd
-import time 
-import io
 
 
 llm = LLM()
 
 
-def extract_text_from_gcs_pdf(gcs_url: str) -> Optional[str]:
-    """
-    Extracts text from a PDF file stored in Google Cloud Storage.
-
-    Args:
-        gcs_url (str): The URL of the PDF file in Google Cloud Storage.
-
-    Returns:
-        Optional[str]: Extracted text from the PDF or None if extraction fails.
-    """
-    attempt = 0
-    max_attempts = 3
-    backoff_factor = 2  # Time to wait multiplies by this factor with each attempt
-    base_wait_time = 1  # Initial wait time in seconds
-
-    while attempt < max_attempts:
-        try:
-            if not gcs_url.startswith("gs://"):
-                raise ValueError("URL must start with 'gs://'")
-
-            parts = gcs_url[5:].split('/', 1)
-            if len(parts) < 2:
-                raise ValueError("Invalid GCS URL format")
-
-            bucket_name, blob_name = parts
-
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(bucket_name)
-            blob = bucket.blob(blob_name)
-
-            pdf_bytes = io.BytesIO()
-            blob.download_to_file(pdf_bytes)
-            pdf_bytes.seek(0)
-
-            reader = PdfReader(pdf_bytes)
-            text = ''.join(page.extract_text() for page in reader.pages if page.extract_text())
-
-            return text
-        except Exception as e:
-            attempt += 1
-            wait_time = base_wait_time * (backoff_factor ** attempt)
-            logger.error(f"Attempt {attempt}/{max_attempts} failed with error: {e}. Retrying in {wait_time} seconds...")
-            time.sleep(wait_time)
-    logger.error("Maximum retry attempts reached. Failing operation.")
-    return None
-
-def construct_gcs_url(match_id: str) -> str:
-    """
-    Generates a Google Cloud Storage (GCS) URL for a PDF document based on its match ID.
-
-    Args:
-        match_id (str): Unique identifier of the document.
-
-    Returns:
-        str: GCS URL for the document.
-    """
-    base_url = 'gs://farmers-poc-as/documents-for-vertex-search-v1/pdfs_v3/{match_id}.pdf'
-    return base_url.format(match_id=match_id)
-
 def normalize_scores_in_list(score_list: List[Tuple[str, float]]) -> List[Tuple[str, float]]:
     """
     Normalizes the scores in a list of tuples to be between 0 and 1.
@@ -173,7 +111,7 @@ def process_dataframe(df_path: str, output_path: str) -> None:
             in_top3 += 1
         
         gcs_url = construct_gcs_url(combo[0][0])
-        text = extract_text_from_gcs_pdf(gcs_url)
+        text = extract_text_from_gcs_pdf(gcs_url, attempts=3)
         
         llm = LLM()  # Assuming LLM is initialized here
         ans = llm.find_answer(q, text)
@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
+from src.eval.sampling import rate_with_interval
+from src.utils.ratelimit import RateLimiter
+from src.utils.cache import content_hash
+from src.utils.io import save_to_excel
+from src.eval.sampling import format_rate
+from src.config.logging import logger
+from src.utils.cache import JsonlCache
+from src.utils.io import save_to_csv
+from src.generate.llm import LLM
+from typing import Optional
+from typing import List
+from typing import Dict
+import pandas as pd
+
+
+CACHE_PATH = './data/results/.cache/grade.jsonl'
+LABEL_SCORES = {'Pass': 1.0, 'Partial Pass': 0.5, 'Fail': 0.0}
+
+
+def normalize_label(label: str) -> Optional[str]:
+    """ Maps a label returned by the model onto 'Pass', 'Partial Pass' or 'Fail'. """
+    label = ' '.join(str(label).lower().replace('_', ' ').split())
+    if label.startswith('partial'):
+        return 'Partial Pass'
+    if label.startswith('pass'):
+        return 'Pass'
+    if label.startswith('fail'):
+        return 'Fail'
+    return None
+
+
+def grade_key(question: str, expected: str, predicted: str) -> str:
+    """ Cache key of a grade. The grading prompt is part of the key, so editing it re-grades every row. """
+    return content_hash('grade_answer', LLM.GRADE_TASK, question, expected, predicted)
+
+
+def make_batches(items: List[Dict[str, str]], batch_size: int, max_chars: int) -> List[List[Dict[str, str]]]:
+    """
+    Packs rows into batches of at most batch_size rows and max_chars characters.
+
+    A row longer than max_chars on its own is graded in a batch of one.
+    """
+    batches, batch, size = [], [], 0
+    for item in items:
+        item_chars = sum(len(value) for value in item.values())
+        if batch and (len(batch) >= batch_size or size + item_chars > max_chars):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(item)
+        size += item_chars
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def grade_answers(questions: List[str], expected: List[str], predicted: List[str], llm: LLM,
+                  batch_size: int = 5, max_chars: int = 12000, max_workers: int = 4,
+                  requests_per_minute: float = 60, cache: Optional[JsonlCache] = None) -> List[Dict[str, Optional[str]]]:
+    """
+    Grades generated answers against the expected answers with the language model.
+
+    Rows already graded with the current prompt are served from the cache and identical rows are
+    graded once. The remaining rows are packed into batches that run concurrently under a rate limit.
+    A batch whose response cannot be parsed is re-graded one row at a time.
+
+    Args:
+    questions (List[str]): The eval questions.
+    expected (List[str]): The expected answers.
+    predicted (List[str]): The generated answers.
+    llm (LLM): The language model.
+    batch_size (int): Maximum number of rows per prompt.
+    max_chars (int): Maximum number of characters of row content per prompt.
+    max_workers (int): Maximum number of concurrent prompts.
+    requests_per_minute (float): Maximum number of prompts started per minute.
+    cache (Optional[JsonlCache]): Cache of grades keyed by grade_key.
+
+    Returns:
+    List[Dict[str, Optional[str]]]: A {'label', 'reason'} dict per row; the label is None if grading failed.
+    """
+    cache = cache if cache is not None else JsonlCache()
+    keys = [grade_key(q, e, p) for q, e, p in zip(questions, expected, predicted)]
+    pending = {}
+    for key, q, e, p in zip(keys, questions, expected, predicted):
+        if key not in pending and cache.get(key) is None:
+            pending[key] = {'key': key, 'question': q, 'expected': e, 'predicted': p}
+
+    batches = make_batches([{k: v for k, v in item.items() if k != 'key'} for item in pending.values()], batch_size, max_chars)
+    logger.info(f"Grading {len(pending)} unique answers in {len(batches)} batches ({len(keys) - len(pending)} deduplicated or cached)")
+    limiter = RateLimiter(requests_per_minute, burst=max_workers)
+
+    def grade(batch: List[Dict[str, str]]) -> None:
+        limiter.acquire()
+        grades = llm.grade_answers(batch)
+        if grades is None and len(batch) > 1:
+            for item in batch:
+                grade([item])
+            return
+        for item, result in zip(batch, grades or []):
+            label = normalize_label(result['label'])
+            if label is not None:
+                cache.set(grade_key(item['question'], item['expected'], item['predicted']), {'label': label, 'reason': result['reason']})
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(grade, batches))
+    logger.info(f"Waited {limiter.waited:.1f}s for the rate limit")
+    return [cache.get(key) or {'label': None, 'reason': None} for key in keys]
+
+
+def main(input_path: str = './data/results/coalesced.csv',
+         csv_output_path: str = './data/results/graded.csv',
+         excel_output_path: str = './data/results/graded.xlsx',
+         answer_column: str = 'final_answer'):
+    llm = LLM()
+    df = pd.read_csv(input_path)
+    columns = df[['question', 'expected_ans', answer_column]].fillna('').astype(str)
+
+    grades = grade_answers(columns['question'].tolist(), columns['expected_ans'].tolist(),
+                           columns[answer_column].tolist(), llm, cache=JsonlCache(CACHE_PATH))
+    df['grade'] = [grade['label'] for grade in grades]
+    df['grade_reason'] = [grade['reason'] for grade in grades]
+    # Same encoding as the manual labels plotted by src/insights/compare.py
+    df['label'] = df['grade'].map(LABEL_SCORES)
+    logger.info(f"Grades: {df['grade'].value_counts(dropna=False).to_dict()}")
+    logger.info(f"Pass rate: {format_rate(rate_with_interval(df['label']))}")
+
+    save_to_csv(df, csv_output_path)
+    save_to_excel(df, excel_output_path)
+
+if __name__ == "__main__":
+    main()
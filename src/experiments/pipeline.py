@@ -0,0 +1,223 @@
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from src.utils.cache import content_hash
+from src.utils.cache import file_hash
+from src.config.logging import logger
+from typing import Callable
+from typing import Iterable
+from typing import Optional
+from typing import Tuple
+from typing import List
+from typing import Dict
+import importlib
+import argparse
+import json
+import os
+
+
+STATE_PATH = './data/results/.pipeline_state.json'
+LLM_CACHE_PATH = './data/results/.cache/llm_responses.jsonl'
+CONFIG_PATH = './config/config.yml'
+LLM_SOURCE = './src/generate/llm.py'
+
+
+class Node:
+    """
+    A step of the experiment pipeline with the files it reads and writes.
+
+    Attributes:
+        name (str): Unique node name.
+        inputs (List[str]): Files the step reads. Outputs of other nodes become dependencies.
+        outputs (List[str]): Files the step writes.
+        run (Callable[[], None]): Executes the step.
+        sources (List[str]): Code whose changes invalidate the step, e.g. the module holding the LLM prompts.
+    """
+
+    def __init__(self, name: str, inputs: List[str], outputs: List[str], run: Callable[[], None], sources: List[str]) -> None:
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.run = run
+        self.sources = sources
+
+
+def fingerprint(node: Node) -> str:
+    """ Fingerprints a node by its input files, its code (including prompts) and the project config. """
+    parts = [node.name]
+    parts += [f'{path}={file_hash(path)}' for path in node.inputs]
+    parts += [f'{path}={file_hash(path)}' for path in node.sources]
+    parts.append(file_hash(CONFIG_PATH))
+    return content_hash(*parts)
+
+
+def run_module(module_name: str, **kwargs) -> Callable[[], None]:
+    """ Returns a callable that imports a pipeline module on demand and calls its main function. """
+    def run() -> None:
+        importlib.import_module(module_name).main(**kwargs)
+    return run
+
+
+def default_nodes() -> List[Node]:
+    """ The eval JSONL -> experiments 1-3 -> consolidate -> coalesce -> grade -> compare chain. """
+    jsonl_path = './data/results/eval_doc_search.jsonl'
+    csv_path = './data/input/eval.csv'
+    nodes = []
+    for n in (1, 2, 3):
+        outputs = [f'./data/results/exp_{n}.csv', f'./data/results/exp_{n}.xlsx']
+        nodes.append(Node(
+            f'exp_{n}', [jsonl_path, csv_path], outputs,
+            run_module(f'src.experiments.experiment_{n}', jsonl_file_path=jsonl_path, csv_file_path=csv_path,
+                       concat_csv_path=outputs[0], excel_output_path=outputs[1]),
+            [f'./src/experiments/experiment_{n}.py', './src/search/retriever.py', LLM_SOURCE],
+        ))
+    experiment_paths = [f'./data/results/exp_{n}.csv' for n in (1, 2, 3)]
+    nodes.append(Node(
+        'consolidate', experiment_paths, ['./data/results/consolidated.csv', './data/results/consolidated.xlsx'],
+        run_module('src.experiments.consolidate', experiment_paths=experiment_paths),
+        ['./src/experiments/consolidate.py'],
+    ))
+    nodes.append(Node(
+        'coalesce', ['./data/results/consolidated.csv'], ['./data/results/coalesced.csv', './data/results/coalesced.xlsx'],
+        run_module('src.experiments.coalesce'),
+        ['./src/experiments/coalesce.py', LLM_SOURCE],
+    ))
+    nodes.append(Node(
+        'grade', ['./data/results/coalesced.csv'], ['./data/results/graded.csv', './data/results/graded.xlsx'],
+        run_module('src.experiments.grade'),
+        ['./src/experiments/grade.py', LLM_SOURCE],
+    ))
+    nodes.append(Node(
+        'compare', ['./data/results/graded.csv'], ['./data/results/figures/comparison_plots.png'],
+        run_module('src.insights.compare'),
+        ['./src/insights/compare.py'],
+    ))
+    return nodes
+
+
+def dependencies(nodes: List[Node]) -> Dict[str, List[str]]:
+    """ Maps each node to the nodes producing its inputs. """
+    producers = {os.path.normpath(path): node.name for node in nodes for path in node.outputs}
+    return {node.name: sorted({producers[os.path.normpath(path)] for path in node.inputs
+                               if os.path.normpath(path) in producers}) for node in nodes}
+
+
+def select(nodes: List[Node], deps: Dict[str, List[str]], targets: Optional[Iterable[str]]) -> List[Node]:
+    """ Restricts the pipeline to the targets and everything upstream of them. """
+    if not targets:
+        return nodes
+    wanted, stack = set(), list(targets)
+    while stack:
+        name = stack.pop()
+        if name not in wanted:
+            wanted.add(name)
+            stack.extend(deps[name])
+    return [node for node in nodes if node.name in wanted]
+
+
+def load_state(state_path: str) -> Dict[str, str]:
+    """ Loads the fingerprints of the last successful run of each node. """
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path, 'r') as file:
+        return json.load(file)
+
+
+def is_stale(node: Node, state: Dict[str, str], force: Iterable[str]) -> bool:
+    """ A node is stale if forced, if an output is missing, or if its fingerprint changed since its last run. """
+    if node.name in force or not all(os.path.exists(path) for path in node.outputs):
+        return True
+    return state.get(node.name) != fingerprint(node)
+
+
+def run_pipeline(nodes: List[Node], state_path: str = STATE_PATH, targets: Optional[Iterable[str]] = None,
+                 force: Iterable[str] = (), max_workers: int = 3, dry_run: bool = False) -> Dict[str, str]:
+    """
+    Runs the stale nodes of the pipeline, executing independent nodes in parallel.
+
+    Staleness is decided when a node's dependencies have finished, so a node whose upstream
+    re-ran but produced identical files is still skipped.
+
+    Args:
+    nodes (List[Node]): The pipeline nodes.
+    state_path (str): JSON file holding the fingerprint of each node's last successful run.
+    targets (Optional[Iterable[str]]): Nodes to bring up to date. Defaults to all.
+    force (Iterable[str]): Nodes to re-run regardless of their fingerprint.
+    max_workers (int): Maximum number of nodes running at once.
+    dry_run (bool): Only report which nodes would run.
+
+    Returns:
+    Dict[str, str]: The outcome of each node: 'ran', 'fresh', 'failed', 'skipped' or 'stale' (dry run).
+    """
+    deps = dependencies(nodes)
+    selected = select(nodes, deps, targets)
+    state = load_state(state_path)
+    force = set(force)
+    outcome = {}
+
+    if dry_run:
+        for node in selected:
+            upstream_stale = any(outcome.get(dep) == 'stale' for dep in deps[node.name])
+            outcome[node.name] = 'stale' if upstream_stale or is_stale(node, state, force) else 'fresh'
+            logger.info(f"{node.name}: {outcome[node.name]}")
+        return outcome
+
+    def execute(node: Node) -> Tuple[str, Optional[str]]:
+        # Runs in a worker thread; state is only updated and saved by the main thread
+        if not is_stale(node, state, force):
+            logger.info(f"{node.name}: up to date, skipping")
+            return 'fresh', None
+        logger.info(f"{node.name}: running")
+        node.run()
+        return 'ran', fingerprint(node)
+
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(outcome) < len(selected):
+            progressed = False
+            for node in selected:
+                if node.name in outcome or node in running.values():
+                    continue
+                if any(outcome.get(dep) in ('failed', 'skipped') for dep in deps[node.name]):
+                    outcome[node.name] = 'skipped'
+                    logger.error(f"{node.name}: skipped because an upstream node failed")
+                    progressed = True
+                elif all(dep in outcome for dep in deps[node.name]):
+                    running[executor.submit(execute, node)] = node
+            if not running:
+                if not progressed:
+                    raise ValueError(f"Pipeline has a dependency cycle among {set(n.name for n in selected) - set(outcome)}")
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                node = running.pop(future)
+                try:
+                    outcome[node.name], node_fingerprint = future.result()
+                    if node_fingerprint is not None:
+                        state[node.name] = node_fingerprint
+                except Exception as e:
+                    outcome[node.name] = 'failed'
+                    logger.error(f"{node.name}: failed with {e}")
+            os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+            with open(state_path, 'w') as file:
+                json.dump(state, file, indent=2)
+    return outcome
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the stale steps of the experiment pipeline.')
+    parser.add_argument('targets', nargs='*', help='Nodes to bring up to date (default: all).')
+    parser.add_argument('--force', nargs='*', default=[], help='Nodes to re-run even if up to date.')
+    parser.add_argument('--workers', type=int, default=3, help='Maximum number of nodes running at once.')
+    parser.add_argument('--dry-run', action='store_true', help='Only report which nodes are stale.')
+    parser.add_argument('--no-llm-cache', action='store_true', help='Do not reuse cached LLM responses.')
+    args = parser.parse_args()
+
+    if not args.dry_run and not args.no_llm_cache:
+        # Unchanged rows of a re-run node hit the cache, so only rows whose prompts changed are sent to the model.
+        from src.generate.llm import LLM
+        LLM.enable_response_cache(LLM_CACHE_PATH)
+
+    results = run_pipeline(default_nodes(), targets=args.targets, force=args.force,
+                           max_workers=args.workers, dry_run=args.dry_run)
+    logger.info(f"Pipeline finished: {results}")
@@ -1,68 +1,19 @@
+from src.utils.pdf import extract_text_from_gcs_pdf
+from src.utils.pdf import construct_gcs_url
+from src.generate.lookup import stream_document_answer
 from src.search.multi_query_retriever import read_jsonl_file
 from src.utils.io import save_to_excel
 from src.config.logging import logger
 from src.utils.io import save_to_csv
 from src.generate.llm import LLM
-from google.cloud import storage
-from PyPDF2 import PdfReader
 from typing import Optional
 from typing import List
 from typing import Dict 
 import pandas as pd
-import io
 
 
 llm = LLM()
 
-def extract_text_from_gcs_pdf(gcs_url: str) -> Optional[str]:
-    """
-    Extracts text from a PDF file stored in Google Cloud Storage (GCS).
-
-    Parameters:
-    - gcs_url (str): The URL of the PDF file in GCS. Format: 'gs://bucket-name/path/to/file.pdf'
-
-    Returns:
-    - Optional[str]: The extracted text from the PDF, or None if extraction fails.
-    """
-    try:
-        if not gcs_url.startswith("gs://"):
-            raise ValueError("URL must start with 'gs://'")
-
-        parts = gcs_url[5:].split('/', 1)
-        if len(parts) < 2:
-            raise ValueError("Invalid GCS URL format")
-
-        bucket_name, blob_name = parts
-
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-
-        pdf_bytes = io.BytesIO()
-        blob.download_to_file(pdf_bytes)
-        pdf_bytes.seek(0)
-
-        reader = PdfReader(pdf_bytes)
-        text = ''.join(page.extract_text() for page in reader.pages if page.extract_text())
-
-        return text
-    except Exception as e:
-        logger.error(f"Failed to extract text from PDF in GCS: {e}", exc_info=True)
-        return None
-
-def construct_gcs_url(match_id: str) -> str:
-    """
-    Generates a Google Cloud Storage (GCS) URL for a PDF document based on its match ID.
-
-    Parameters:
-    - match_id (str): Unique identifier of the document.
-
-    Returns:
-    - str: GCS URL for the document.
-    """
-    base_url = 'gs://farmers-poc-as/documents-for-vertex-search-v1/pdfs_v3/{match_id}.pdf'
-    return base_url.format(match_id=match_id)
-
 def query_document(query: str, match_id: str) -> Optional[str]:
     """
     Queries a document in GCS with a given match ID for a specific query and extracts the relevant answer.
@@ -87,5 +38,9 @@ def query_document(query: str, match_id: str) -> Optional[str]:
 query = 'What is the mid-term cancellation fee in CA?'
 matched_id = [('kaD4T0000004dL3UAI', 1.0)]
 
-answer = query_document(query, matched_id[0][0])
-logger.info(answer)
\ No newline at end of file
+# Streamed variant: prints the answer as it is generated and reports time-to-first-token
+lookup_metrics = {}
+for token in stream_document_answer(query, matched_id[0][0], metrics=lookup_metrics):
+    print(token, end='', flush=True)
+print()
+logger.info(f"Lookup metrics: {lookup_metrics}")
\ No newline at end of file
@@ -0,0 +1,275 @@
+from src.search.multi_query_retriever import read_jsonl_file as read_multi_query_jsonl
+from src.search.retriever import read_jsonl_file as read_single_query_jsonl
+from src.utils.incremental import save_row_fingerprints
+from src.utils.incremental import load_previous_rows
+from src.utils.incremental import is_complete_row
+from src.experiments.pipeline import LLM_CACHE_PATH
+from concurrent.futures import ThreadPoolExecutor
+from src.eval.sampling import rate_with_interval
+from src.eval.sampling import DEFAULT_CONFIDENCE
+from src.utils.incremental import code_version
+from src.eval.sampling import outcome_scores
+from src.utils.incremental import LLM_SOURCE
+from src.eval.sampling import DEFAULT_MARGIN
+from src.eval.sampling import format_rate
+from src.eval.sampling import sample_rows
+from src.utils.cache import content_hash
+from src.utils.io import save_to_excel
+from src.config.logging import logger
+from src.utils.io import save_to_csv
+from src.generate.llm import LLM
+from typing import Optional
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Any
+import pandas as pd
+import importlib
+import argparse
+import time
+import os
+
+
+class Experiment:
+    """
+    An experiment module run by the runner.
+
+    The module provides OUTPUT_COLUMNS and process_query_result(query_result), which computes one
+    output row from one search record.
+
+    Attributes:
+        name (str): Name used on the command line.
+        module (str): Module holding the experiment.
+        jsonl_path (str): Search results the experiment reads.
+        csv_path (str): Eval CSV whose rows the results are joined to.
+        output_path (str): CSV the rows are written to; the Excel copy sits next to it.
+        multi_query (bool): Whether jsonl_path holds multi-query results.
+        empty_answers (bool): Whether an empty answer is a valid result. Only a missing (None) answer then marks a failed row.
+    """
+
+    def __init__(self, name: str, module: str, jsonl_path: str, csv_path: str, output_path: str,
+                 multi_query: bool = False, empty_answers: bool = False) -> None:
+        self.name = name
+        self.module = module
+        self.jsonl_path = jsonl_path
+        self.csv_path = csv_path
+        self.output_path = output_path
+        self.multi_query = multi_query
+        self.empty_answers = empty_answers
+
+
+# Same inputs and outputs as each module's main()
+EXPERIMENTS = {
+    'exp_1': Experiment('exp_1', 'src.experiments.experiment_1', './data/results/eval_doc_search.jsonl', './data/input/eval.csv', './data/results/exp_1.csv'),
+    'exp_2': Experiment('exp_2', 'src.experiments.experiment_2', './data/results/eval_doc_search.jsonl', './data/input/eval.csv', './data/results/exp_2.csv'),
+    'exp_3': Experiment('exp_3', 'src.experiments.experiment_3', './data/results/eval_doc_search.jsonl', './data/input/eval.csv', './data/results/exp_3.csv'),
+    'exp_4': Experiment('exp_4', 'src.experiments.experiment_4', './data/results/sampled_eval_doc_search.jsonl', './data/input/sampled_eval.csv', './data/results/exp_4.csv'),
+    'exp_5': Experiment('exp_5', 'src.experiments.experiment_5', './data/results/eval_2_mq_doc_search_new.jsonl', './data/input/eval_2.csv', './data/results/exp_5_new.csv',
+                        multi_query=True, empty_answers=True),
+}
+
+
+def sample_output_path(output_path: str) -> str:
+    """ Output of a run on a sample: next to the full output, with a .sample suffix. """
+    root, extension = os.path.splitext(output_path)
+    return f'{root}.sample{extension}'
+
+
+class SharedInputs:
+    """
+    Eval CSVs and search results, each read once however many experiments use them.
+
+    With sample_args, experiments see only a stratified sample of each eval CSV (see
+    src/eval/sampling.py) and the search results at the same row positions.
+    """
+
+    def __init__(self, sample_args: Optional[Dict[str, Any]] = None) -> None:
+        self.sample_args = sample_args
+        self.csvs: Dict[str, pd.DataFrame] = {}
+        self.positions: Dict[str, List[int]] = {}
+        self.lines: Dict[str, List[str]] = {}
+        self.records: Dict[tuple, list] = {}
+
+    @property
+    def sampled(self) -> bool:
+        return self.sample_args is not None
+
+    def load(self, experiment: Experiment) -> None:
+        if experiment.csv_path not in self.csvs:
+            df = pd.read_csv(experiment.csv_path)
+            self.csvs[experiment.csv_path] = df
+            self.positions[experiment.csv_path] = sample_rows(df, **self.sample_args) if self.sampled else list(range(len(df)))
+        if experiment.jsonl_path not in self.lines:
+            with open(experiment.jsonl_path, 'r') as file:
+                self.lines[experiment.jsonl_path] = [line.strip() for line in file if line.strip()]
+        key = (experiment.jsonl_path, experiment.multi_query)
+        if key not in self.records:
+            reader = read_multi_query_jsonl if experiment.multi_query else read_single_query_jsonl
+            self.records[key] = reader(experiment.jsonl_path)
+
+    def csv(self, experiment: Experiment) -> pd.DataFrame:
+        return self.csvs[experiment.csv_path].iloc[self.positions[experiment.csv_path]].reset_index(drop=True)
+
+    def query_results(self, experiment: Experiment) -> list:
+        records = self.records[(experiment.jsonl_path, experiment.multi_query)]
+        return [records[position] for position in self.positions[experiment.csv_path] if position < len(records)]
+
+    def fingerprints(self, experiment: Experiment, version: str) -> List[str]:
+        """ Same fingerprints as jsonl_fingerprints, from the lines already in memory. """
+        lines = self.lines[experiment.jsonl_path]
+        return [content_hash(version, lines[position]) for position in self.positions[experiment.csv_path] if position < len(lines)]
+
+
+def run_experiment(experiment: Experiment, inputs: SharedInputs, row_workers: int = 8,
+                   map_executor: Optional[ThreadPoolExecutor] = None) -> Dict[str, Any]:
+    """
+    Runs one experiment on the shared inputs, computing its rows concurrently.
+
+    Rows whose search record and experiment code are unchanged since the last run are reused from
+    its output. A row that raises is written empty, and a row with a missing answer is written as is;
+    both are recomputed on the next run. Runs on a sample write next to the full output (see
+    sample_output_path) and also reuse rows of the full run.
+
+    Args:
+    experiment (Experiment): The experiment.
+    inputs (SharedInputs): Loaded inputs.
+    row_workers (int): Maximum number of rows computed at once.
+    map_executor (Optional[ThreadPoolExecutor]): Pool for the per-document calls of multi-query experiments.
+
+    Returns:
+    Dict[str, Any]: Row counts, the wall time of the experiment and, where the eval CSV has expected
+    articles, the rate at which they are among the matched articles, with its confidence interval.
+    """
+    start = time.perf_counter()
+    module = importlib.import_module(experiment.module)
+    process: Callable = module.process_query_result
+    if experiment.multi_query:
+        process = lambda query_result: module.process_query_result(query_result, map_executor)
+
+    query_results = inputs.query_results(experiment)
+    fingerprints = inputs.fingerprints(experiment, code_version(module.__file__, LLM_SOURCE))
+    output_path = sample_output_path(experiment.output_path) if inputs.sampled else experiment.output_path
+    previous = load_previous_rows(experiment.output_path, module.OUTPUT_COLUMNS, experiment.empty_answers)
+    if inputs.sampled:
+        previous.update(load_previous_rows(output_path, module.OUTPUT_COLUMNS, experiment.empty_answers))
+    failed = []
+
+    def compute(index: int) -> Dict[str, Any]:
+        if fingerprints[index] in previous:
+            return previous[fingerprints[index]]
+        try:
+            row = process(query_results[index])
+        except Exception as e:
+            logger.error(f"{experiment.name}: row {index} failed with {e}")
+            failed.append(index)
+            return {}
+        # A missing answer means an LLM call failed; the row is kept but computed again next run
+        if not is_complete_row(row, experiment.empty_answers):
+            logger.error(f"{experiment.name}: row {index} has no answer")
+            failed.append(index)
+        return row
+
+    with ThreadPoolExecutor(max_workers=row_workers) as executor:
+        rows = list(executor.map(compute, range(len(query_results))))
+
+    df_csv = inputs.csv(experiment).drop(columns=['filter'])
+    df_rows = pd.DataFrame(rows, columns=module.OUTPUT_COLUMNS)
+    df_combined = pd.concat([df_csv, df_rows], axis=1)
+    save_to_csv(df_combined, output_path)
+    # Failed rows get no fingerprint, so the next run computes them again
+    failed = set(failed)
+    save_row_fingerprints(output_path, ['' if i in failed else fp for i, fp in enumerate(fingerprints)])
+    save_to_excel(df_combined, output_path.replace('.csv', '.xlsx'))
+
+    reused = sum(fp in previous for fp in fingerprints)
+    result = {'rows': len(rows), 'reused': reused, 'computed': len(rows) - reused, 'failed': len(failed),
+              'seconds': round(time.perf_counter() - start, 1)}
+    matched_column = next((column for column in module.OUTPUT_COLUMNS if column.startswith('matched_article')), None)
+    if matched_column and 'article_id' in df_csv:
+        expected = df_csv['article_id'].head(len(df_rows))
+        hits = pd.Series([str(article_id) in str(matched) if pd.notna(article_id) else None
+                          for article_id, matched in zip(expected, df_rows[matched_column])], dtype=object)
+        result['article_matched'] = format_rate(rate_with_interval(hits.dropna().astype(float)))
+    return result
+
+
+def log_sample_outcomes(inputs: SharedInputs) -> None:
+    """ Logs the manual pass rate of each sampled eval CSV with its confidence interval, next to that of the full set. """
+    for csv_path, df in inputs.csvs.items():
+        if 'pass_fail' not in df:
+            continue
+        scores = outcome_scores(df['pass_fail'])
+        sampled = rate_with_interval(scores.iloc[inputs.positions[csv_path]])
+        logger.info(f"{csv_path}: pass rate of the sample {format_rate(sampled)}, "
+                    f"of the full set {rate_with_interval(scores)['rate']:.2f}")
+
+
+def run_experiments(names: List[str], experiments: Optional[Dict[str, Experiment]] = None, row_workers: int = 8,
+                    requests_per_minute: Optional[float] = None, llm_cache: bool = True,
+                    sample_args: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Runs the selected experiments concurrently in one process.
+
+    Inputs are loaded once, the LLM response cache and the single-flight PDF downloads are shared,
+    and all model calls draw from one rate budget. A sweep takes about as long as its slowest experiment.
+
+    Args:
+    names (List[str]): Experiments to run, e.g. ['exp_1', 'exp_2'].
+    experiments (Optional[Dict[str, Experiment]]): Experiment definitions. Defaults to EXPERIMENTS.
+    row_workers (int): Maximum number of rows each experiment computes at once.
+    requests_per_minute (Optional[float]): Model calls per minute shared by all experiments. Unlimited if None.
+    llm_cache (bool): Reuse and store LLM responses in the shared response cache.
+    sample_args (Optional[Dict[str, Any]]): Run on a stratified sample of each eval CSV, drawn by
+        sampling.sample_rows with these arguments (size or confidence, margin, seed). Full sets if None.
+
+    Returns:
+    Dict[str, Any]: The row counts and wall time of each experiment, or the error it failed with.
+    """
+    experiments = experiments or EXPERIMENTS
+    selected = [experiments[name] for name in names]
+    if llm_cache:
+        LLM.enable_response_cache(LLM_CACHE_PATH)
+    limiter = LLM.set_rate_limit(requests_per_minute, burst=row_workers)
+
+    inputs = SharedInputs(sample_args)
+    for experiment in selected:
+        inputs.load(experiment)
+    if inputs.sampled:
+        log_sample_outcomes(inputs)
+
+    results = {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=row_workers * 3) as map_executor, \
+            ThreadPoolExecutor(max_workers=len(selected) or 1) as executor:
+        futures = {experiment.name: executor.submit(run_experiment, experiment, inputs, row_workers, map_executor)
+                   for experiment in selected}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"{name}: failed with {e}")
+                results[name] = {'error': str(e)}
+    logger.info(f"Ran {len(selected)} experiments in {time.perf_counter() - start:.1f}s: {results}")
+    if limiter is not None:
+        logger.info(f"Waited {limiter.waited:.1f}s for the shared rate limit")
+    logger.info(f"LLM calls: {LLM.call_metrics()}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run experiments concurrently on shared inputs and caches.')
+    parser.add_argument('experiments', nargs='*', default=list(EXPERIMENTS), help=f'Experiments to run (default: all of {", ".join(EXPERIMENTS)}).')
+    parser.add_argument('--workers', type=int, default=8, help='Rows computed at once per experiment.')
+    parser.add_argument('--rpm', type=float, help='Model calls per minute shared by all experiments.')
+    parser.add_argument('--no-llm-cache', action='store_true', help='Do not reuse cached LLM responses.')
+    parser.add_argument('--sample', type=int, help='Run on a stratified sample of this many rows of each eval CSV.')
+    parser.add_argument('--confidence', type=float, help=f'Run on a stratified sample sized for this confidence level (e.g. {DEFAULT_CONFIDENCE}).')
+    parser.add_argument('--margin', type=float, default=DEFAULT_MARGIN, help='Margin of error the sample is sized for with --confidence.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the sample.')
+    args = parser.parse_args()
+
+    sample_args = None
+    if args.sample or args.confidence:
+        sample_args = {'size': args.sample, 'confidence': args.confidence, 'margin': args.margin, 'seed': args.seed}
+    run_experiments(args.experiments, row_workers=args.workers, requests_per_minute=args.rpm,
+                    llm_cache=not args.no_llm_cache, sample_args=sample_args)
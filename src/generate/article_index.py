@@ -0,0 +1,227 @@
+from src.utils.pdf import extract_text_from_gcs_pdf
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.ratelimit import RateLimiter
+from src.utils.pdf import construct_gcs_url
+from src.utils.cache import content_hash
+from src.config.logging import logger
+from src.utils.cache import JsonlCache
+from collections import Counter
+from src.generate.llm import LLM
+from typing import FrozenSet
+from typing import Optional
+from typing import Tuple
+from typing import List
+from typing import Dict
+from typing import Any
+import threading
+import argparse
+import json
+import re
+
+
+INDEX_PATH = './data/precomputed/articles.jsonl'
+ARTICLE_MAX_CHARS = 24000  # Article text sent to the digest prompt
+MATCH_THRESHOLD = 0.8  # Keyword overlap (Jaccard) above which a stored answer is served for a query
+STOPWORDS = frozenset("""a an the and or but if then than so of to in on at by for with from into about as is are was were be been
+being do does did can could should would will shall may might must i me my we our you your he she it its they them their this that
+these those there here what when where which who whom why how not no yes all any each some such own same very just also""".split())
+
+# States and brands change the answer, so a stored question must name exactly the same ones as the query
+QUALIFIERS = frozenset("""al ak az ar ca co ct de fl ga hi id il ia ks ky la md ma mi mn ms mo mt ne nv nh nj nm ny nc nd oh ok
+pa ri sc sd tn tx ut vt va wa wv wi wy dc alabama alaska arizona arkansas california colorado connecticut delaware florida georgia
+hawaii idaho illinois indiana iowa kansas kentucky louisiana maine maryland massachusetts michigan minnesota mississippi missouri
+montana nebraska nevada hampshire jersey mexico york carolina dakota ohio oklahoma oregon pennsylvania rhode tennessee texas utah
+vermont virginia washington wisconsin wyoming farmers bristol west specialty commercial fws fia fact""".split())
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def keywords(text: str) -> FrozenSet[str]:
+    """ Lowercased content words of a text, used to match queries to precomputed questions. """
+    return frozenset(word for word in _WORD.findall(str(text).lower()) if word not in STOPWORDS and len(word) > 1)
+
+
+def digest_version(text: str) -> str:
+    """ Version of an article digest; changes when the article text or the digest prompt changes. """
+    return content_hash(LLM.DIGEST_TASK, text)
+
+
+class ArticleIndex:
+    """
+    Precomputed summaries and canonical question/answer pairs per knowledge article.
+
+    Entries are stored by article ID in an append-only JSONL file, and the questions are indexed by
+    keyword so a query can be matched to a stored answer without calling the model.
+
+    Attributes:
+        store (JsonlCache): Digests keyed by article ID.
+        postings (Dict[str, set]): Keyword -> (article ID, question index) pairs containing it.
+    """
+
+    def __init__(self, path: Optional[str] = INDEX_PATH) -> None:
+        self.store = JsonlCache(path)
+        self.lock = threading.Lock()
+        self.postings: Dict[str, set] = {}
+        self.question_keywords: Dict[Tuple[str, int], FrozenSet[str]] = {}
+        for article_id, entry in self.store.entries.items():
+            self._index(article_id, entry)
+
+    def _index(self, article_id: str, entry: Dict[str, Any]) -> None:
+        for i, pair in enumerate(entry['qa']):
+            words = keywords(pair['question'])
+            self.question_keywords[(article_id, i)] = words
+            for word in words:
+                self.postings.setdefault(word, set()).add((article_id, i))
+
+    def _unindex(self, article_id: str) -> None:
+        for key in [key for key in self.question_keywords if key[0] == article_id]:
+            for word in self.question_keywords.pop(key):
+                self.postings[word].discard(key)
+
+    def add(self, article_id: str, version: str, digest: Dict[str, Any]) -> None:
+        """ Stores the digest of an article, replacing any previous one. """
+        entry = {'version': version, 'summary': digest['summary'], 'qa': digest['qa']}
+        with self.lock:
+            if article_id in self.store:
+                self._unindex(article_id)
+            self.store.set(article_id, entry)
+            self._index(article_id, entry)
+
+    def version(self, article_id: str) -> Optional[str]:
+        entry = self.store.entries.get(article_id)
+        return entry['version'] if entry else None
+
+    def best_answer(self, query: str, article_ids: Optional[List[str]] = None,
+                    threshold: float = MATCH_THRESHOLD) -> Optional[Dict[str, Any]]:
+        """
+        Finds the stored question closest to a query.
+
+        A stored answer is served without a model call, so matching is strict: the stored question must
+        contain every keyword of the query, name the same states and brands (QUALIFIERS), and differ
+        from it by few extra keywords.
+
+        Args:
+        query (str): The question asked.
+        article_ids (Optional[List[str]]): Only consider these articles, e.g. the search results. All if None.
+        threshold (float): Minimum keyword overlap (Jaccard) between the query and the stored question.
+
+        Returns:
+        Optional[Dict[str, Any]]: The article_id, question, answer and score of the best match, or None.
+        """
+        words = keywords(query)
+        qualifiers = words & QUALIFIERS
+        allowed = set(article_ids) if article_ids is not None else None
+        candidates = {key for word in words for key in self.postings.get(word, ())
+                      if allowed is None or key[0] in allowed}
+        best, best_score = None, threshold
+        for key in candidates:
+            stored = self.question_keywords[key]
+            if not words <= stored or stored & QUALIFIERS != qualifiers:
+                continue
+            score = len(words) / len(stored)
+            if score >= best_score:
+                best, best_score = key, score
+        if best is None:
+            return None
+        pair = self.store.entries[best[0]]['qa'][best[1]]
+        return {'article_id': best[0], 'question': pair['question'], 'answer': pair['answer'], 'score': best_score}
+
+    def context(self, article_id: str) -> Optional[str]:
+        """ The summary and Q/A pairs of an article as a compact find_answer context, or None if not indexed. """
+        entry = self.store.entries.get(article_id)
+        if not entry:
+            return None
+        pairs = '\n\n'.join(f"Q: {pair['question']}\nA: {pair['answer']}" for pair in entry['qa'])
+        return f"Summary:\n{entry['summary']}\n\n{pairs}"
+
+    def __contains__(self, article_id: str) -> bool:
+        return article_id in self.store
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+
+def rank_articles(jsonl_paths: List[str], top_n: Optional[int] = None) -> List[str]:
+    """
+    Orders the articles in search result files by how often they were matched, most frequent first.
+
+    Args:
+    jsonl_paths (List[str]): Single or multi-query search result JSONL files.
+    top_n (Optional[int]): Number of articles to return. All if None.
+
+    Returns:
+    List[str]: Knowledge IDs.
+    """
+    counts = Counter()
+    for path in jsonl_paths:
+        with open(path, 'r') as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                results = [record] if 'match_info' in record else [value for value in record.values() if isinstance(value, dict)]
+                for result in results:
+                    counts.update(match['knowledge_id'] for match in result.get('match_info', []))
+    return [article_id for article_id, _ in counts.most_common(top_n)]
+
+
+def precompute_article(article_id: str, index: ArticleIndex, llm: LLM, limiter: Optional[RateLimiter] = None,
+                       max_chars: int = ARTICLE_MAX_CHARS) -> str:
+    """
+    Digests one article unless its stored digest is current.
+
+    Returns:
+    str: 'current', 'digested' or 'failed'.
+    """
+    text = extract_text_from_gcs_pdf(construct_gcs_url(article_id), max_chars=max_chars)
+    if not text:
+        return 'failed'
+    version = digest_version(text)
+    if index.version(article_id) == version:
+        return 'current'
+    if limiter is not None:
+        limiter.acquire()
+    digest = llm.digest_article(text)
+    if digest is None:
+        return 'failed'
+    index.add(article_id, version, digest)
+    return 'digested'
+
+
+def build_index(article_ids: List[str], path: str = INDEX_PATH, max_workers: int = 4,
+                requests_per_minute: float = 60, max_chars: int = ARTICLE_MAX_CHARS) -> ArticleIndex:
+    """
+    Offline job: stores a summary and canonical Q/A pairs for each article.
+
+    Articles whose text and digest prompt are unchanged since the last run are skipped, so the job
+    can be re-run after new articles show up in the search results.
+
+    Args:
+    article_ids (List[str]): Knowledge IDs to digest, e.g. from rank_articles.
+    path (str): JSONL file backing the index.
+    max_workers (int): Maximum number of articles digested at once.
+    requests_per_minute (float): Maximum number of digest prompts started per minute.
+    max_chars (int): Maximum number of characters of each article sent to the model.
+
+    Returns:
+    ArticleIndex: The updated index.
+    """
+    index = ArticleIndex(path)
+    llm = LLM()
+    limiter = RateLimiter(requests_per_minute, burst=max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        statuses = Counter(executor.map(lambda article_id: precompute_article(article_id, index, llm, limiter, max_chars), article_ids))
+    logger.info(f"Precomputed {len(article_ids)} articles: {dict(statuses)}; index holds {len(index)} articles")
+    return index
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute summaries and Q/A pairs for the most frequently matched articles.')
+    parser.add_argument('jsonl', nargs='+', help='Search result JSONL files the articles are taken from.')
+    parser.add_argument('--top', type=int, default=200, help='Number of most frequently matched articles to digest.')
+    parser.add_argument('--output', default=INDEX_PATH)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rpm', type=float, default=60, help='Digest prompts per minute.')
+    args = parser.parse_args()
+
+    build_index(rank_articles(args.jsonl, args.top), path=args.output, max_workers=args.workers, requests_per_minute=args.rpm)
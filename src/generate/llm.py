@@ -1,18 +1,44 @@
 from langchain.prompts.chat import HumanMessagePromptTemplate, ChatPromptTemplate
 from langchain.chat_models import ChatVertexAI
+from src.generate.tokens import input_token_budget
+from src.search.citations import strip_citations
+from src.generate.tokens import truncate_to_tokens
+from src.generate.tokens import estimate_tokens
+from src.utils.ratelimit import RateLimiter
+from src.utils.cache import content_hash
 from src.config.logging import logger
+from src.utils.cache import JsonlCache
+from src.utils.tracing import Span
+from src.utils.tracing import span
 from src.config.setup import config
 from typing import Optional
+from typing import Iterator
+from typing import List
+from typing import Dict
+import threading
+import json
 import time
 
+
+def _compile(human_template: str, **partials: str) -> ChatPromptTemplate:
+    """ Builds a single-message chat prompt once; `partials` bind the fixed task text. """
+    return ChatPromptTemplate.from_messages([HumanMessagePromptTemplate.from_template(human_template)]).partial(**partials)
+
+
 class LLM:
     """
     A class representing a Language Model using Vertex AI.
 
     Attributes:
         model (ChatVertexAI): The chat model loaded from Vertex AI.
+        context_overflow (str): What find_answer does with a context too long for the model: 'truncate' or 'reject'.
     """
     _model_instance = None  # Class attribute to hold the singleton instance
+    _response_cache: Optional[JsonlCache] = None  # Shared cache of completions keyed by prompt hash
+    _metrics: Dict[str, Dict[str, int]] = {}  # Per-method call and token totals, see call_metrics
+    _metrics_lock = threading.Lock()
+    _rate_limiter: Optional[RateLimiter] = None  # Shared budget of model calls per minute, see set_rate_limit
+    context_overflow = 'truncate'
 
     def __init__(self) -> None:
         """
@@ -47,106 +73,363 @@ class LLM:
             logger.error(f"Failed to load the model: {e}")
             return None
 
+    @classmethod
+    def enable_response_cache(cls, path: Optional[str] = None) -> JsonlCache:
+        """
+        Serves repeated prompts from a persistent cache, so re-running a step only pays for prompts that changed.
+
+        Args:
+            path (Optional[str]): JSONL file backing the cache. Memory-only if None.
+
+        Returns:
+            JsonlCache: The shared response cache.
+        """
+        cls._response_cache = JsonlCache(path)
+        return cls._response_cache
+
+    @classmethod
+    def set_rate_limit(cls, requests_per_minute: Optional[float], burst: Optional[int] = None) -> Optional[RateLimiter]:
+        """
+        Limits the model calls of every LLM user in the process to one shared budget. Cached responses do not count.
+
+        Args:
+            requests_per_minute (Optional[float]): Maximum number of model calls started per minute. None removes the limit.
+            burst (Optional[int]): Number of calls that may start at once before calls are spaced out.
+
+        Returns:
+            Optional[RateLimiter]: The shared limiter.
+        """
+        cls._rate_limiter = RateLimiter(requests_per_minute, burst=burst) if requests_per_minute else None
+        return cls._rate_limiter
+
+    def _acquire(self, s: Span) -> None:
+        limiter = LLM._rate_limiter
+        if limiter is not None:
+            waited = limiter.acquire()
+            if waited:
+                s.set(rate_limit_wait_ms=waited * 1000)
+
+    @staticmethod
+    def _cache_key(prompt: list) -> str:
+        return content_hash(config.TEXT_GEN_MODEL_NAME, *(message.content for message in prompt))
+
+    @classmethod
+    def _record(cls, method: str, **counts: int) -> None:
+        with cls._metrics_lock:
+            totals = cls._metrics.setdefault(method, {})
+            for name, count in counts.items():
+                totals[name] = totals.get(name, 0) + count
+
+    @classmethod
+    def call_metrics(cls) -> Dict[str, Dict[str, int]]:
+        """
+        Per-method totals since the process started: calls, estimated prompt and completion tokens,
+        cache hits, and prompts truncated or rejected before sending.
+        """
+        with cls._metrics_lock:
+            return {method: dict(totals) for method, totals in cls._metrics.items()}
+
+    def _prepare(self, template: ChatPromptTemplate, s: Span, **values: str) -> Optional[list]:
+        """
+        Formats a precompiled prompt and checks its estimated size against the model's input limit.
+
+        Returns:
+            Optional[list]: The prompt messages, or None if the prompt is too long to send.
+        """
+        prompt = template.format_prompt(**values).to_messages()
+        tokens = sum(estimate_tokens(message.content) for message in prompt)
+        budget = input_token_budget(config.TEXT_GEN_MODEL_NAME)
+        s.set(prompt_chars=sum(len(message.content) for message in prompt), prompt_tokens_est=tokens)
+        if tokens > budget:
+            s.set(rejected=True)
+            self._record(s.stage, rejected=1)
+            logger.error(f"Prompt of ~{tokens} tokens exceeds the input budget of {budget} tokens; not sending it")
+            return None
+        return prompt
+
+    def _fit_context(self, query: str, context: str, s: Span) -> Optional[str]:
+        """
+        Truncates a find_answer context so the whole prompt fits the model's input limit, or returns
+        None if `context_overflow` is 'reject'.
+        """
+        context = context or ''
+        overhead = sum(estimate_tokens(message.content) for message in self.FIND_ANSWER_PROMPT.format_prompt(query=query, context='').to_messages())
+        available = input_token_budget(config.TEXT_GEN_MODEL_NAME) - overhead
+        tokens = estimate_tokens(context)
+        s.set(context_tokens_est=tokens)
+        if tokens <= available:
+            return context
+        if self.context_overflow == 'reject':
+            s.set(rejected=True)
+            self._record(s.stage, rejected=1)
+            logger.error(f"Context of ~{tokens} tokens exceeds the {available} tokens left for it; not sending it")
+            return None
+        fitted = truncate_to_tokens(context, available)
+        s.set(truncated_chars=len(context) - len(fitted))
+        self._record(s.stage, truncated=1)
+        logger.info(f"Truncated context from {len(context)} to {len(fitted)} characters to fit the model input", extra={'sampled': True})
+        return fitted
+
+    def _complete(self, prompt: list, s: Span) -> str:
+        """
+        Runs the chat model on a formatted prompt, using the response cache when it is enabled.
+        """
+        prompt_tokens = sum(estimate_tokens(message.content) for message in prompt)
+        cache = LLM._response_cache
+        key = None
+        if cache is not None:
+            key = self._cache_key(prompt)
+            cached = cache.get(key)
+            if cached is not None:
+                s.set(cache_hit=True, response_chars=len(cached))
+                self._record(s.stage, calls=1, cache_hits=1)
+                return cached
+        self._acquire(s)
+        completion = self.model(prompt).content
+        s.set(response_chars=len(completion))
+        self._record(s.stage, calls=1, prompt_tokens=prompt_tokens, completion_tokens=estimate_tokens(completion))
+        if key is not None:
+            cache.set(key, completion)
+        return completion
+
+    RETRIES = 5  # Maximum number of attempts of find_answer and of starting stream_answer
+    BACKOFF_FACTOR = 2  # Backoff multiplier
+    INITIAL_DELAY = 1  # Initial delay in seconds
+
+    FIND_ANSWER_TASK = """Given a query and context, identify the answer within the provided context. Please provide a detailed, comprehensive answer. Stick to the original content and focus on the details. Pay attention to codes, actions, steps, phone numbers, amounts, and other finer details. Include all of these in the answer. Prioritize insurance-specific information. Be extremely detailed and thorough. Ensure the formatting is clean for easy understanding."""
+    FIND_ANSWER_PROMPT = _compile("{task}\n\n==Query==\n{query}\n\n==Context==\n{context}", task=FIND_ANSWER_TASK)
+
     def find_answer(self, query: str, context: str) -> Optional[str]:
         """
         Generates a response for a given task and query using the chat model, with retry logic in case of errors.
+
+        Contexts too long for the model are truncated before sending (or rejected, see `context_overflow`),
+        so retries are only spent on transient errors.
         """
-        task = """Given a query and context, identify the answer within the provided context. Please provide a detailed, comprehensive answer. Stick to the original content and focus on the details. Pay attention to codes, actions, steps, phone numbers, amounts, and other finer details. Include all of these in the answer. Prioritize insurance-specific information. Be extremely detailed and thorough. Ensure the formatting is clean for easy understanding."""
-        logger.info(f'Query = {query}')
-
-        retries = 5  # Maximum number of retries
-        backoff_factor = 2  # Backoff multiplier
-        initial_delay = 1  # Initial delay in seconds
-
-        for attempt in range(retries):
-            try:
-                human_template = "{task}\n\n==Query==\n{query}\n\n==Context==\n{context}"
-                human_message = HumanMessagePromptTemplate.from_template(human_template)
-                chat_template = ChatPromptTemplate.from_messages([human_message])
-                prompt = chat_template.format_prompt(task=task, query=query, context=context).to_messages()
-                response = self.model(prompt)
-                completion = response.content
-                return completion.strip()
-            except Exception as e:
-                if attempt < retries - 1:
-                    wait_time = initial_delay * (backoff_factor ** attempt)
-                    logger.error(f"Error during model prediction: {e}. Retrying in {wait_time} seconds...")
-                    time.sleep(wait_time)
-                else:
-                    logger.error(f"Final attempt failed with error: {e}")
-                    return None
+        logger.info(f'Query = {query}', extra={'sampled': True})
 
-        
+        with span('llm.find_answer', query_chars=len(query), context_chars=len(context or '')) as s:
+            context = self._fit_context(query, context, s)
+            prompt = self._prepare(self.FIND_ANSWER_PROMPT, s, query=query, context=context) if context is not None else None
+            if prompt is None:
+                return None
+            for attempt in range(self.RETRIES):
+                try:
+                    completion = self._complete(prompt, s)
+                    return completion.strip()
+                except Exception as e:
+                    if attempt < self.RETRIES - 1:
+                        s.incr('retries')
+                        wait_time = self.INITIAL_DELAY * (self.BACKOFF_FACTOR ** attempt)
+                        logger.error(f"Error during model prediction: {e}. Retrying in {wait_time} seconds...")
+                        time.sleep(wait_time)
+                    else:
+                        s.set(failed=True)
+                        logger.error(f"Final attempt failed with error: {e}")
+                        return None
+
+    def stream_answer(self, query: str, context: str) -> Iterator[str]:
+        """
+        Streams the answer of find_answer, yielding text chunks as the model produces them.
+
+        The time to the first chunk is recorded as ttft_ms on the 'llm.stream_answer' span. Cached answers
+        are yielded in one chunk, and the full answer is cached once the stream completes.
+
+        Errors before the first chunk are retried with the backoff of find_answer. If every attempt fails,
+        or the stream breaks after chunks were yielded, the error is logged and the stream ends early.
+        """
+        logger.info(f'Query = {query}', extra={'sampled': True})
+        with span('llm.stream_answer', query_chars=len(query), context_chars=len(context or '')) as s:
+            context = self._fit_context(query, context, s)
+            prompt = self._prepare(self.FIND_ANSWER_PROMPT, s, query=query, context=context) if context is not None else None
+            if prompt is None:
+                return
+            start = time.perf_counter()
+            cache = LLM._response_cache
+            key = self._cache_key(prompt) if cache is not None else None
+            cached = cache.get(key) if key is not None else None
+            if cached is not None:
+                s.set(cache_hit=True, response_chars=len(cached), ttft_ms=(time.perf_counter() - start) * 1000)
+                self._record(s.stage, calls=1, cache_hits=1)
+                yield cached.strip()
+                return
+
+            parts = []
+            for attempt in range(self.RETRIES):
+                try:
+                    self._acquire(s)
+                    # Models without streaming support return the whole completion as one chunk
+                    chunks = self.model.stream(prompt) if hasattr(self.model, 'stream') else [self.model(prompt)]
+                    for chunk in chunks:
+                        text = chunk.content if parts else chunk.content.lstrip()
+                        if not text:
+                            continue
+                        if not parts:
+                            s.set(ttft_ms=(time.perf_counter() - start) * 1000)
+                        parts.append(text)
+                        yield text
+                    break
+                except Exception as e:
+                    if parts:
+                        # Chunks already reached the caller, so the stream cannot be restarted
+                        s.set(failed=True)
+                        logger.error(f"Stream failed after {len(parts)} chunks: {e}")
+                        return
+                    if attempt < self.RETRIES - 1:
+                        s.incr('retries')
+                        wait_time = self.INITIAL_DELAY * (self.BACKOFF_FACTOR ** attempt)
+                        logger.error(f"Error starting the answer stream: {e}. Retrying in {wait_time} seconds...")
+                        time.sleep(wait_time)
+                    else:
+                        s.set(failed=True)
+                        logger.error(f"Final attempt failed with error: {e}")
+                        return
+            completion = ''.join(parts)
+            s.set(response_chars=len(completion))
+            self._record(s.stage, calls=1, prompt_tokens=s.attrs['prompt_tokens_est'], completion_tokens=estimate_tokens(completion))
+            if key is not None:
+                cache.set(key, completion)
+
+    FORMAT_ANSWER_TASK = """Format the provided answer by removing any citations, breaking it down into manageable steps or points, and ensuring it's clear and easy to read. 
+        Remove all types of citations like [1], [1, 3]."""
+    FORMAT_ANSWER_PROMPT = _compile("{task}\n\nAnswer:\n{answer}\n\nFormatted Answer:", task=FORMAT_ANSWER_TASK)
 
     def format_answer(self, answer: str) -> str:
         """
         Given an answer, clean the answer by removing the citations and formatting it to be clear and readable.
+        Citation markers are stripped before the call, so the model only has to format.
         """
-        task = """Format the provided answer by removing any citations, breaking it down into manageable steps or points, and ensuring it's clear and easy to read. 
-        Remove all types of citations like [1], [1, 3]."""
-        logger.info('Formatting generated answer...')
+        logger.info('Formatting generated answer...', extra={'sampled': True})
         try:
-            human_template = "{task}\n\nAnswer:\n{answer}\n\nFormatted Answer:"
-            human_message = HumanMessagePromptTemplate.from_template(human_template)
-            chat_template = ChatPromptTemplate.from_messages([human_message])
-            prompt = chat_template.format_prompt(task=task, answer=answer).to_messages()
-            response = self.model(prompt)
-            completion = response.content
+            with span('llm.format_answer') as s:
+                prompt = self._prepare(self.FORMAT_ANSWER_PROMPT, s, answer=strip_citations(answer))
+                if prompt is None:
+                    return None
+                completion = self._complete(prompt, s)
             return completion.strip()
         except Exception as e:
             logger.error(f"Error during model prediction: {e}")
             return None
-        
-    
+
+    COALESCE_TASK = """Given multiple answers to a question, compile them to maintain all unique points and steps in the correct sequence. 
+Be sure to remove any extraneous sentences at the beginning of the answers, such as "formatted answer" or "sure, here is the formatted answer," and so on."""
+    COALESCE_PROMPT = _compile("{task}\n\nAnswers:\n{answers}\n\nCombined Answer:", task=COALESCE_TASK)
+
     def coalesce_answer(self, answers: str) -> str:
         """
         Given various answers to a question, combine them to retain all unique points and steps in the correct order.
         """
-        task = """Given multiple answers to a question, compile them to maintain all unique points and steps in the correct sequence. 
-Be sure to remove any extraneous sentences at the beginning of the answers, such as "formatted answer" or "sure, here is the formatted answer," and so on."""
-        logger.info('Coalescing answers...')
+        logger.info('Coalescing answers...', extra={'sampled': True})
         try:
-            human_template = "{task}\n\nAnswers:\n{answers}\n\nCombined Answer:"
-            human_message = HumanMessagePromptTemplate.from_template(human_template)
-            chat_template = ChatPromptTemplate.from_messages([human_message])
-            prompt = chat_template.format_prompt(task=task, answers=answers).to_messages()
-            response = self.model(prompt)
-            completion = response.content
+            with span('llm.coalesce_answer') as s:
+                prompt = self._prepare(self.COALESCE_PROMPT, s, answers=answers)
+                if prompt is None:
+                    return None
+                completion = self._complete(prompt, s)
             return completion.strip()
         except Exception as e:
             logger.error(f"Error during model prediction: {e}")
             return None
-        
+
+    GRADE_TASK = """You are grading answers of an insurance support assistant. For each item, compare the generated answer to the expected answer.
+Label it "Pass" if it contains all key facts of the expected answer, "Partial Pass" if it contains some of them or adds incorrect details, and "Fail" if it misses the expected answer or contradicts it.
+If the expected answer is "No Answer Found", a generated answer stating that no answer was found is a "Pass".
+Respond only with a JSON list containing one object per item in the same order: [{"item": <number>, "label": "<Pass|Partial Pass|Fail>", "reason": "<one sentence>"}]"""
+    GRADE_PROMPT = _compile("{task}\n\n{items}\n\nGrades:", task=GRADE_TASK)
+
+    def grade_answers(self, items: List[Dict[str, str]]) -> Optional[List[Dict[str, str]]]:
+        """
+        Grades a batch of generated answers against their expected answers in a single call.
+
+        Args:
+            items (List[Dict[str, str]]): Rows with 'question', 'expected' and 'predicted' keys.
+
+        Returns:
+            Optional[List[Dict[str, str]]]: A {'label', 'reason'} dict per item in order, or None if the
+            response could not be matched to the items or the batch is too long to send.
+        """
+        logger.info(f'Grading {len(items)} answers...', extra={'sampled': True})
+        blocks = [f"==Item {i}==\nQuestion: {item['question']}\nExpected Answer: {item['expected']}\nGenerated Answer: {item['predicted']}"
+                  for i, item in enumerate(items, start=1)]
+        try:
+            with span('llm.grade_answers', items=len(items)) as s:
+                prompt = self._prepare(self.GRADE_PROMPT, s, items='\n\n'.join(blocks))
+                if prompt is None:
+                    return None
+                completion = self._complete(prompt, s)
+            completion = completion.strip()
+            grades = json.loads(completion[completion.find('['):completion.rfind(']') + 1])
+            if len(grades) != len(items):
+                logger.error(f"Expected {len(items)} grades, got {len(grades)}")
+                return None
+            return [{'label': str(grade.get('label', '')), 'reason': str(grade.get('reason', ''))} for grade in grades]
+        except Exception as e:
+            logger.error(f"Error during model prediction: {e}")
+            return None
+
+    DIGEST_TASK = """You are preparing a knowledge article of an insurance support team for fast lookup. From the article below:
+1. Write a summary that keeps every code, action, step, phone number, amount, deadline and state-specific rule.
+2. Write the questions support agents most likely ask about the article, each with a complete answer taken from the article.
+Respond only with a JSON object: {"summary": "<summary>", "qa": [{"question": "<question>", "answer": "<answer>"}]}"""
+    DIGEST_PROMPT = _compile("{task}\n\n==Article==\n{article}\n\nJSON:", task=DIGEST_TASK)
+
+    def digest_article(self, article: str, max_questions: int = 10) -> Optional[Dict]:
+        """
+        Summarizes a knowledge article and writes canonical question/answer pairs for it in a single call.
+
+        Args:
+            article (str): The article text.
+            max_questions (int): Maximum number of question/answer pairs kept.
+
+        Returns:
+            Optional[Dict]: {'summary': str, 'qa': [{'question', 'answer'}]}, or None if the call failed,
+            the response could not be parsed or the article is too long to send.
+        """
+        logger.info('Digesting article...', extra={'sampled': True})
+        try:
+            with span('llm.digest_article', article_chars=len(article)) as s:
+                prompt = self._prepare(self.DIGEST_PROMPT, s, article=article)
+                if prompt is None:
+                    return None
+                completion = self._complete(prompt, s).strip()
+                digest = json.loads(completion[completion.find('{'):completion.rfind('}') + 1])
+                qa = [{'question': str(pair['question']).strip(), 'answer': str(pair['answer']).strip()}
+                      for pair in digest.get('qa', []) if pair.get('question') and pair.get('answer')]
+                s.set(questions=len(qa[:max_questions]))
+            return {'summary': str(digest.get('summary', '')).strip(), 'qa': qa[:max_questions]}
+        except Exception as e:
+            logger.error(f"Error during model prediction: {e}")
+            return None
+
+    # task is equivalent to system message here
+    EXPAND_QUERY_TASK = """Given a query, create a variant of the original query. Ensure the generated variant is not in history."""
+    EXPAND_QUERY_PROMPT = _compile("{task}\n\nHistory:\n{history}\n\nQuery: {query}\n\nVariant=", task=EXPAND_QUERY_TASK)
 
     def expand_query(self, query: str, n: int) -> list:
-        # task is equivalent to system message here
-        task = f"""Given a query, create a variant of the original query. Ensure the generated variant is not in history."""
         history = ''
         variants = []
         try:
-           for _ in range(n):   
-            human_template = f'{task}\n\nHistory:\n{history}\n\nQuery: {query}\n\nVariant='
-            human_message = HumanMessagePromptTemplate.from_template(human_template)
-            chat_template = ChatPromptTemplate.from_messages([human_message])
-            prompt = chat_template.format_prompt(task=task, history=history, query=query).to_messages()
-            
-            response = self.model(prompt)
-            completion = response.content.strip()
-            variants.append(completion)
-            history += '\n' + completion
+            with span('llm.expand_query', variants=n) as s:
+                for _ in range(n):
+                    prompt = self._prepare(self.EXPAND_QUERY_PROMPT, s, history=history, query=query)
+                    if prompt is None:
+                        break
+                    completion = self._complete(prompt, s).strip()
+                    variants.append(completion)
+                    history += '\n' + completion
         except Exception as e:
             logger.error(e)
         return variants
-    
+
+    KEY_PHRASES_TASK = """Given a query, extract the most important tokens from the query. Extract as single words. Return the tokens as a pipe separated list."""
+    KEY_PHRASES_PROMPT = _compile("{task}\n\n\n\nQuery: {query}", task=KEY_PHRASES_TASK)
+
     def extract_key_phrases(self, query) -> list:
-        task = f"""Given a query, extract the most important tokens from the query. Extract as single words. Return the tokens as a pipe separated list."""
-        human_template = f'{task}\n\n\n\nQuery: {query}'
-        human_message = HumanMessagePromptTemplate.from_template(human_template)
-        chat_template = ChatPromptTemplate.from_messages([human_message])
-        prompt = chat_template.format_prompt(task=task, query=query).to_messages()
-        
-        response = self.model(prompt)
-        completion = response.content.strip()
+        with span('llm.extract_key_phrases') as s:
+            prompt = self._prepare(self.KEY_PHRASES_PROMPT, s, query=query)
+            if prompt is None:
+                return ''
+            completion = self._complete(prompt, s).strip()
         return completion
 
 
@@ -0,0 +1,139 @@
+from src.search.multi_query_retriever import find_most_weighted_ids
+from src.query.expander import expand_query_and_get_variants
+from src.utils.pdf import extract_text_from_gcs_pdf
+from src.generate.article_index import ArticleIndex
+from concurrent.futures import ThreadPoolExecutor
+from src.search.doc_search import search_batch
+from src.utils.pdf import construct_gcs_url
+from src.search.doc_search import search
+from src.config.logging import logger
+from src.generate.llm import LLM
+from typing import Iterator
+from typing import Optional
+from typing import Dict
+from typing import Any
+import time
+
+
+def _elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+def _stream_with_metrics(tokens: Iterator[str], start: float, metrics: Dict[str, Any]) -> Iterator[str]:
+    """ Passes tokens through, recording the time to the first token and the total time since `start`. """
+    for token in tokens:
+        if 'ttft_ms' not in metrics:
+            metrics['ttft_ms'] = _elapsed_ms(start)
+        yield token
+    metrics['total_ms'] = _elapsed_ms(start)
+
+
+def stream_document_answer(query: str, match_id: str, metrics: Optional[Dict[str, Any]] = None,
+                           max_chars: Optional[int] = None) -> Iterator[str]:
+    """
+    Streams the answer to a query from a single document in GCS.
+
+    Args:
+    query (str): The question to find an answer to within the document.
+    match_id (str): The knowledge ID of the document.
+    metrics (Optional[Dict[str, Any]]): Filled with document_ms, ttft_ms and total_ms.
+    max_chars (Optional[int]): Maximum number of document characters used as context.
+
+    Yields:
+    str: Chunks of the answer as the model produces them.
+    """
+    metrics = metrics if metrics is not None else {}
+    start = time.perf_counter()
+    text = extract_text_from_gcs_pdf(construct_gcs_url(match_id), max_chars=max_chars)
+    metrics['document_ms'] = _elapsed_ms(start)
+    if text is None:
+        logger.info(f"No text extracted for match_id: {match_id}")
+        return
+    yield from _stream_with_metrics(LLM().stream_answer(query, text), start, metrics)
+
+
+def stream_lookup(query: str, brand: str, expand: bool = False, prefetch: int = 3,
+                  metrics: Optional[Dict[str, Any]] = None, max_chars: Optional[int] = None,
+                  index: Optional[ArticleIndex] = None) -> Iterator[str]:
+    """
+    Answers a question end to end (query -> top document -> answer), streaming the answer.
+
+    The top `prefetch` documents of the original query start downloading as soon as its search
+    returns. With `expand`, query variants are generated and searched in the meantime, and the
+    answer comes from the best fused document, which is usually already downloaded.
+
+    With an `index` holding the best document, a stored answer to a matching question is returned
+    without calling the model; otherwise the model answers from the stored summary and Q/A pairs
+    instead of the full PDF.
+
+    Args:
+    query (str): The question.
+    brand (str): The brand to filter the search by.
+    expand (bool): Also search query variants and fuse the rankings, as in multi_query_search.
+    prefetch (int): Number of top documents to download before retrieval has finished.
+    metrics (Optional[Dict[str, Any]]): Filled with search_ms, retrieval_ms, document_ms, ttft_ms,
+                                        total_ms and match_id, all measured from the start of the lookup.
+    max_chars (Optional[int]): Maximum number of document characters used as context.
+    index (Optional[ArticleIndex]): Precomputed article digests, see src/generate/article_index.py.
+                                    Sets metrics['precomputed'] to 'answer' or 'context' when used.
+
+    Yields:
+    str: Chunks of the answer as the model produces them.
+    """
+    metrics = metrics if metrics is not None else {}
+    start = time.perf_counter()
+    stored_answer = None
+    executor = ThreadPoolExecutor(max_workers=prefetch + 2)
+    try:
+        searched = executor.submit(search, query, brand, 'ids')
+        variants = executor.submit(expand_query_and_get_variants, query) if expand else None
+
+        matches = searched.result().get('match_info', [])
+        metrics['search_ms'] = _elapsed_ms(start)
+        if not matches:
+            logger.error(f"No matches found for query '{query}' and brand '{brand}'")
+            return
+
+        links = {match['knowledge_id']: match['link'] or construct_gcs_url(match['knowledge_id']) for match in matches}
+        documents = {match['knowledge_id']: executor.submit(extract_text_from_gcs_pdf, links[match['knowledge_id']], max_chars=max_chars)
+                     for match in matches[:prefetch]}
+
+        ranked = [(match['rank'], match['knowledge_id']) for match in matches]
+        if variants is not None:
+            for result in search_batch([(variant, brand) for variant in variants.result()], profile='ids'):
+                for match in result.get('match_info', []):
+                    ranked.append((match['rank'], match['knowledge_id']))
+                    links.setdefault(match['knowledge_id'], match['link'] or construct_gcs_url(match['knowledge_id']))
+        match_id = find_most_weighted_ids(ranked, top_k=1)[0][0]
+        metrics['retrieval_ms'] = _elapsed_ms(start)
+        metrics['match_id'] = match_id
+        metrics['prefetched'] = match_id in documents
+
+        if index is not None and match_id in index:
+            hit = index.best_answer(query, [match_id])
+            metrics['precomputed'] = 'answer' if hit else 'context'
+            stored_answer = hit['answer'] if hit else None
+            text = index.context(match_id)
+        else:
+            if match_id not in documents:
+                documents[match_id] = executor.submit(extract_text_from_gcs_pdf, links[match_id], max_chars=max_chars)
+            text = documents[match_id].result()
+        metrics['document_ms'] = _elapsed_ms(start)
+        if text is None:
+            logger.info(f"No text extracted for match_id: {match_id}")
+            return
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    tokens = iter([stored_answer]) if stored_answer else LLM().stream_answer(query, text)
+    yield from _stream_with_metrics(tokens, start, metrics)
+
+
+if __name__ == '__main__':
+    query = 'What is the mid-term cancellation fee in CA?'
+    brand = 'Farmers'
+    lookup_metrics = {}
+    for token in stream_lookup(query, brand, metrics=lookup_metrics):
+        print(token, end='', flush=True)
+    print()
+    logger.info(f"Lookup metrics: {lookup_metrics}")
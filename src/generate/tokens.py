@@ -0,0 +1,60 @@
+from typing import Optional
+import re
+import os
+
+
+# Input token limits of the Vertex AI text models; LLM_MAX_INPUT_TOKENS overrides them.
+MODEL_INPUT_TOKENS = {
+    'chat-bison': 8192,
+    'chat-bison-32k': 32768,
+    'text-bison': 8192,
+    'text-bison-32k': 32768,
+    'gemini-pro': 30720,
+}
+DEFAULT_INPUT_TOKENS = 8192
+SAFETY_MARGIN = 0.9  # The estimate is approximate, so only this share of the limit is used
+CHARS_PER_TOKEN = 4
+
+# Words, numbers and single punctuation marks; long pieces count as one token per CHARS_PER_TOKEN characters.
+_PIECE = re.compile(r'\w+|[^\w\s]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens of a text without calling the model.
+
+    Args:
+    text (str): The text.
+
+    Returns:
+    int: The estimated token count.
+    """
+    return sum(-(-len(piece) // CHARS_PER_TOKEN) for piece in _PIECE.findall(text or ''))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cuts a text after the piece at which its estimated token count reaches max_tokens.
+
+    Args:
+    text (str): The text.
+    max_tokens (int): The token budget.
+
+    Returns:
+    str: The longest prefix within the budget.
+    """
+    if max_tokens <= 0:
+        return ''
+    tokens = 0
+    for match in _PIECE.finditer(text):
+        tokens += -(-len(match.group()) // CHARS_PER_TOKEN)
+        if tokens > max_tokens:
+            return text[:match.start()]
+    return text
+
+
+def input_token_budget(model_name: Optional[str]) -> int:
+    """ Number of estimated input tokens a prompt may use for the given model. """
+    limit = os.environ.get('LLM_MAX_INPUT_TOKENS')
+    limit = int(limit) if limit else MODEL_INPUT_TOKENS.get(model_name or '', DEFAULT_INPUT_TOKENS)
+    return int(limit * SAFETY_MARGIN)
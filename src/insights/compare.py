@@ -1,67 +1,152 @@
 from src.config.logging import logger
 import matplotlib.pyplot as plt
+from typing import Optional
 from typing import Tuple
+from typing import List
 import pandas as pd
+import numpy as np
+import argparse
 import os
 
-def load_excel_data(file_path: str) -> pd.DataFrame:
+
+OUTCOMES = ['Pass', 'Partial Pass', 'Fail']
+# Keyed by the lowercased, whitespace-collapsed label, so 'PASS', 'pass' and 'Pass' all match
+PASS_FAIL_LABELS = {'pass': 'Pass', 'fail': 'Fail', 'partial pass': 'Partial Pass',
+                    'missing content in load': 'Fail', 'pass - no answer provided answer.': 'Pass'}
+LABEL_SCORES = {1.0: 'Pass', 0.5: 'Partial Pass', 0.0: 'Fail'}
+
+
+def load_columns(file_path: str, columns: List[str]) -> pd.DataFrame:
     """
-    Load data from an Excel file.
+    Load only the given columns of a results file. Columns missing from the file are skipped.
+
+    CSV and Parquet files are read column-wise, so the wide answer columns are never parsed.
+    Excel files have to be parsed whole; prefer the CSV written next to them.
+
+    Args:
+    file_path (str): Path to a .csv, .parquet or .xlsx results file.
+    columns (List[str]): Columns to load.
+
+    Returns:
+    pd.DataFrame: Dataframe containing the requested columns.
+    """
+    logger.info(f"Loading {columns} from {file_path}")
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.csv':
+        return pd.read_csv(file_path, usecols=lambda column: column in columns)
+    if extension == '.parquet':
+        import pyarrow.parquet as pq
+        available = pq.read_schema(file_path).names
+        return pd.read_parquet(file_path, columns=[column for column in columns if column in available])
+    return pd.read_excel(file_path, usecols=lambda column: column in columns)
+
+
+def normalize_outcomes(values: pd.Series) -> pd.Series:
+    """
+    Map manual pass_fail strings or numeric labels (1.0/0.5/0.0) onto 'Pass', 'Partial Pass' and 'Fail'.
+
+    Strings are matched ignoring case and extra whitespace. The number of values left unmapped is logged.
 
     Args:
-    file_path (str): Path to the Excel file.
+    values (pd.Series): A pass_fail or label column.
 
     Returns:
-    pd.DataFrame: Dataframe containing the loaded data.
+    pd.Series: Categorical outcomes; unknown values become NaN.
     """
-    logger.info(f"Loading data from {file_path}")
-    return pd.read_excel(file_path)
+    if pd.api.types.is_numeric_dtype(values):
+        outcomes = values.map(LABEL_SCORES)
+    else:
+        keys = values.astype(str).str.lower().str.split().str.join(' ')
+        outcomes = keys.where(values.notna()).map(PASS_FAIL_LABELS)
+    unmapped = values[outcomes.isna() & values.notna()]
+    if len(unmapped):
+        logger.warning(f"{len(unmapped)} of {len(values)} outcome values could not be mapped, e.g. {unmapped.unique()[:5].tolist()}")
+    return pd.Categorical(outcomes.where(outcomes.isin(OUTCOMES)), categories=OUTCOMES)
 
-def prepare_data_for_plotting(df: pd.DataFrame) -> Tuple[pd.Series, pd.Series]:
+
+def parse_run(spec: str) -> Tuple[str, str, str]:
+    """ Parse a run given as name=path:column, e.g. 'After=./data/results/graded.csv:label'. """
+    name, _, location = spec.partition('=')
+    path, _, column = location.rpartition(':')
+    return name, path, column
+
+
+def load_runs(runs: List[Tuple[str, str, str]], by: Optional[str] = 'brand') -> pd.DataFrame:
     """
-    Prepare data for plotting by processing 'pass_fail' and 'label' columns.
+    Load the outcome column of every run into one long dataframe.
+
+    Each file is read once, with only the columns its runs need.
 
     Args:
-    df (pd.DataFrame): The dataframe containing the data.
+    runs (List[Tuple[str, str, str]]): (name, path, column) of each run.
+    by (Optional[str]): Column to break the outcomes down by, e.g. 'brand'.
 
     Returns:
-    Tuple[pd.Series, pd.Series]: Two Series objects for plotting.
+    pd.DataFrame: One row per (run, question) with 'run', 'outcome' and the breakdown column.
+    Runs whose column is missing from their file are skipped with a warning.
     """
-    # Process 'pass_fail' column
-    pass_fail_breakdown = df['pass_fail'].value_counts()
-    pass_fail_breakdown_corrected = pass_fail_breakdown.rename(
-        index={'PASS': 'Pass', 'FAIL': 'Fail', 'Partial Pass': 'Partial Pass', 
-               'Missing Content in Load': 'Fail', 'Pass - No Answer provided answer.': 'Pass'})
-    pass_fail_breakdown_corrected = pass_fail_breakdown_corrected.groupby(level=0).sum()
+    by_path = {}
+    for name, path, column in runs:
+        by_path.setdefault(path, []).append((name, column))
 
-    # Process 'label' column
-    label_breakdown = df['label'].value_counts().rename(index={1.0: 'Pass', 0.0: 'Fail', 0.5: 'Partial Pass'})
-    label_data = label_breakdown.reindex(['Pass', 'Partial Pass', 'Fail']).fillna(0)
+    frames = []
+    for path, path_runs in by_path.items():
+        df = load_columns(path, [column for _, column in path_runs] + ([by] if by else []))
+        group = df[by].fillna('not available').to_numpy() if by in df else np.full(len(df), 'all', dtype=object)
+        for name, column in path_runs:
+            if column not in df:
+                logger.warning(f"Skipping run '{name}': {path} has no '{column}' column")
+                continue
+            frames.append(pd.DataFrame({'run': name, 'group': group, 'outcome': normalize_outcomes(df[column])}))
+    if not frames:
+        return pd.DataFrame(columns=['run', 'group', 'outcome'])
+    long = pd.concat(frames, ignore_index=True)
+    loaded = set(long['run'])
+    long['run'] = pd.Categorical(long['run'], categories=[name for name, _, _ in runs if name in loaded])
+    return long
 
-    return pass_fail_breakdown_corrected, label_data
 
-def plot_data(pass_fail_data: pd.Series, label_data: pd.Series, output_file: str):
+def breakdown(long: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Count outcomes per run and per (run, group) in a single groupby.
+
+    Args:
+    long (pd.DataFrame): Output of load_runs.
+
+    Returns:
+    Tuple[pd.DataFrame, pd.DataFrame]: Outcome counts per run (runs x outcomes) and the pass rate
+    per group and run (groups x runs), where a partial pass counts as half.
+    """
+    counts = long.groupby(['run', 'group', 'outcome'], observed=False).size().unstack('outcome', fill_value=0)
+    counts = counts[counts.sum(axis=1) > 0]
+    per_run = counts.groupby(level='run', observed=False).sum()[OUTCOMES]
+    scores = counts['Pass'] + 0.5 * counts['Partial Pass']
+    per_group = (scores / counts.sum(axis=1)).unstack('run')
+    return per_run, per_group
+
+
+def plot_data(per_run: pd.DataFrame, per_group: pd.DataFrame, output_file: str):
     """
     Plot and save the data.
 
     Args:
-    pass_fail_data (pd.Series): Data for the 'Pass/Fail' plot.
-    label_data (pd.Series): Data for the 'Label' plot.
+    per_run (pd.DataFrame): Outcome counts per run.
+    per_group (pd.DataFrame): Pass rate per group and run.
     output_file (str): Path to save the output plot.
     """
-    # Plotting
     fig, axes = plt.subplots(nrows=1, ncols=2, figsize=(15, 6))
     fig.suptitle('Farmers Insurance Comparative Analysis', fontsize=16)
 
-    # 'Pass/Fail' plot
-    pass_fail_data.plot(kind='bar', ax=axes[0], color='skyblue', title='Assessment of Pass/Fail Outcomes (Before)')
+    # Outcomes of every run side by side
+    per_run.T.plot(kind='bar', ax=axes[0], title='Assessment of Pass/Fail Outcomes', rot=0)
     axes[0].set_xlabel('Category')
     axes[0].set_ylabel('Frequency')
 
-    # 'Label' plot
-    label_data.plot(kind='bar', ax=axes[1], color='salmon', title='Assessment of Pass/Fail Outcomes (After)')
-    axes[1].set_xlabel('Category')
-    axes[1].set_ylabel('Frequency')
+    # Pass rate of every run per brand
+    per_group.plot(kind='bar', ax=axes[1], title='Pass Rate by Brand')
+    axes[1].set_xlabel('Brand')
+    axes[1].set_ylabel('Pass Rate (partial pass = 0.5)')
+    axes[1].set_ylim(0, 1)
 
     # Save the plot
     if not os.path.exists(os.path.dirname(output_file)):
@@ -70,10 +155,24 @@ def plot_data(pass_fail_data: pd.Series, label_data: pd.Series, output_file: str
     plt.close()
     logger.info(f"Plot saved to {output_file}")
 
+def main(file_path: str = './data/results/graded.csv',
+         output_file: str = './data/results/figures/comparison_plots.png',
+         runs: Optional[List[Tuple[str, str, str]]] = None):
+    """ Loads the outcome columns of the runs and saves the comparison plots. Defaults to manual (before) vs. graded (after) labels. """
+    runs = runs or [('Before', file_path, 'pass_fail'), ('After', file_path, 'label')]
+    long = load_runs(runs)
+    if long.empty:
+        logger.error(f"None of the runs could be loaded: {runs}")
+        return None
+    per_run, per_group = breakdown(long)
+    logger.info(f"Outcomes per run:\n{per_run.to_string()}")
+    plot_data(per_run, per_group, output_file)
+    return per_run, per_group
+
 # Main execution
 if __name__ == "__main__":
-    file_path = './data/results/coalesced.xlsx'
-    df = load_excel_data(file_path)
-    pass_fail_breakdown_corrected, label_data = prepare_data_for_plotting(df)
-    output_file = './data/results/figures/comparison_plots.png'
-    plot_data(pass_fail_breakdown_corrected, label_data, output_file)
+    parser = argparse.ArgumentParser(description='Compare pass/fail outcomes across runs and brands.')
+    parser.add_argument('runs', nargs='*', help="Runs as name=path:column, e.g. After=./data/results/graded.csv:label")
+    parser.add_argument('--output', default='./data/results/figures/comparison_plots.png')
+    args = parser.parse_args()
+    main(output_file=args.output, runs=[parse_run(spec) for spec in args.runs])
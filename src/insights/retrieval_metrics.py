@@ -0,0 +1,141 @@
+from src.search import multi_query_retriever
+from src.utils.incremental import row_key
+from src.config.logging import logger
+from src.search import retriever
+from typing import Iterable
+from typing import Tuple
+from typing import List
+from typing import Dict
+import pandas as pd
+import numpy as np
+import argparse
+
+
+def load_ground_truth(csv_path: str) -> pd.DataFrame:
+    """
+    Loads the expected article of every eval question. Questions without an expected article are dropped.
+
+    Args:
+    csv_path (str): Path to the eval CSV with question, filter and article_id columns.
+
+    Returns:
+    pd.DataFrame: One row per question with its key, brand and expected article ID.
+    """
+    df = pd.read_csv(csv_path, usecols=['question', 'filter', 'article_id']).dropna(subset=['article_id'])
+    df['key'] = [row_key(question, brand) for question, brand in zip(df['question'], df['filter'])]
+    return df.rename(columns={'filter': 'brand'}).drop_duplicates('key')
+
+
+def load_rankings(jsonl_path: str, mode: str = 'single') -> pd.DataFrame:
+    """
+    Loads the ranked knowledge IDs of every query from a search result JSONL file.
+
+    Args:
+    jsonl_path (str): Path to the JSONL written by src/eval/doc_search.py or doc_search_multi_query.py.
+    mode (str): 'single' for single-query results (ranked by search rank), 'multi' for multi-query
+                results (ranked by the fused score of multi_query_retriever), 'cited' for multi-query
+                results ranked by the fused score of cited documents only.
+
+    Returns:
+    pd.DataFrame: One row per query with its key and the list of ranked IDs.
+    """
+    keys, rankings = [], []
+    if mode == 'single':
+        for query_result in retriever.read_jsonl_file(jsonl_path):
+            keys.append(row_key(query_result.query, query_result.brand))
+            rankings.append([query_result.results[rank].knowledge_id for rank in sorted(query_result.results)])
+    elif mode in ('multi', 'cited'):
+        for query_result in multi_query_retriever.read_jsonl_file(jsonl_path):
+            keys.append(row_key(query_result.query, query_result.brand))
+            ranked = query_result.match_ids if mode == 'multi' else query_result.cited_ids
+            rankings.append([doc_id for doc_id, _ in ranked])
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+    return pd.DataFrame({'key': keys, 'ranked_ids': rankings}).drop_duplicates('key')
+
+
+def hit_matrix(ranked_ids: List[List[str]], expected: np.ndarray, depth: int) -> np.ndarray:
+    """
+    Builds a boolean matrix marking where the expected article appears in each ranking.
+
+    Args:
+    ranked_ids (List[List[str]]): Ranked IDs per query.
+    expected (np.ndarray): Expected article ID per query.
+    depth (int): Number of ranks to consider.
+
+    Returns:
+    np.ndarray: Matrix of shape (queries, depth), True at the rank of the expected article.
+    """
+    padded = np.full((len(ranked_ids), depth), '', dtype=object)
+    for i, ids in enumerate(ranked_ids):
+        ids = ids[:depth]
+        padded[i, :len(ids)] = ids
+    return padded == expected[:, None]
+
+
+def compute_metrics(hits: np.ndarray, ks: Iterable[int]) -> pd.DataFrame:
+    """
+    Computes per-query recall@k, reciprocal rank and nDCG from a hit matrix.
+
+    With a single relevant article per query, nDCG reduces to 1 / log2(rank + 1) and recall@k to a hit at rank <= k.
+
+    Args:
+    hits (np.ndarray): Hit matrix from hit_matrix.
+    ks (Iterable[int]): Cut-offs for recall@k.
+
+    Returns:
+    pd.DataFrame: One row per query with a column per metric.
+    """
+    found = hits.any(axis=1)
+    rank = np.where(found, hits.argmax(axis=1) + 1, 0)
+    metrics = {f'recall@{k}': hits[:, :k].any(axis=1).astype(float) for k in ks}
+    metrics['mrr'] = np.where(found, 1.0 / np.maximum(rank, 1), 0.0)
+    metrics['ndcg'] = np.where(found, 1.0 / np.log2(np.maximum(rank, 1) + 1), 0.0)
+    return pd.DataFrame(metrics)
+
+
+def evaluate(csv_path: str, jsonl_path: str, mode: str = 'single', ks: Iterable[int] = (1, 3, 5)) -> Tuple[Dict[str, float], pd.DataFrame]:
+    """
+    Scores stored search results against the expected articles of the eval set.
+
+    Args:
+    csv_path (str): Eval CSV with the expected article IDs.
+    jsonl_path (str): Search result JSONL to score.
+    mode (str): 'single', 'multi' or 'cited', see load_rankings.
+    ks (Iterable[int]): Cut-offs for recall@k.
+
+    Returns:
+    Tuple[Dict[str, float], pd.DataFrame]: Overall metrics and per-brand metrics.
+    """
+    ks = list(ks)
+    joined = load_ground_truth(csv_path).merge(load_rankings(jsonl_path, mode), on='key', how='inner')
+    if joined.empty:
+        logger.error(f"No questions of {csv_path} were found in {jsonl_path}")
+        return {}, pd.DataFrame()
+
+    ranked_ids = joined['ranked_ids'].tolist()
+    # MRR and nDCG look at the full ranking, recall only at the cut-offs.
+    depth = max(ks + [len(ids) for ids in ranked_ids])
+    hits = hit_matrix(ranked_ids, joined['article_id'].to_numpy(dtype=object), depth)
+    per_query = compute_metrics(hits, ks)
+    per_query['brand'] = joined['brand'].to_numpy()
+
+    overall = per_query.drop(columns='brand').mean().to_dict()
+    overall['queries'] = len(per_query)
+    per_brand = per_query.groupby('brand').agg(['mean']).droplevel(1, axis=1)
+    per_brand['queries'] = per_query.groupby('brand').size()
+    return overall, per_brand
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline retrieval metrics over stored search results.')
+    parser.add_argument('--csv', default='./data/input/sampled_eval.csv', help='Eval CSV with expected article IDs.')
+    parser.add_argument('--jsonl', default='./data/results/sampled_eval_mq_doc_search.jsonl', help='Search results to score.')
+    parser.add_argument('--mode', default='multi', choices=['single', 'multi', 'cited'])
+    parser.add_argument('--k', type=int, nargs='*', default=[1, 3, 5])
+    args = parser.parse_args()
+
+    overall_metrics, brand_metrics = evaluate(args.csv, args.jsonl, args.mode, args.k)
+    print(pd.Series(overall_metrics).round(4).to_string())
+    print()
+    print(brand_metrics.round(4).to_string())
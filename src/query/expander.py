@@ -1,9 +1,12 @@
 from src.config.logging import logger
+from src.utils.singleflight import single_flight
+from src.utils.tracing import span
 from src.generate.llm import LLM
 from src.config.setup import *
 from typing import List
 
 
+@single_flight('query.expand')
 def expand_query_and_get_variants(query: str, num_variants: int = 4) -> List[str]:
     """
     Expand a given query using a language model and return a list of query variants.
@@ -19,9 +22,11 @@ def expand_query_and_get_variants(query: str, num_variants: int = 4) -> List[str
     Exception: If an error occurs in the query expansion process.
     """
     try:
-        llm = LLM()  # Initialize the language model
-        variants = llm.expand_query(query, num_variants)
-        cleaned_variants = [variant.strip() for variant in variants]
+        with span('query.expand', num_variants=num_variants) as s:
+            llm = LLM()  # Initialize the language model
+            variants = llm.expand_query(query, num_variants)
+            cleaned_variants = [variant.strip() for variant in variants]
+            s.set(variants=len(cleaned_variants))
         return cleaned_variants
     except Exception as e:
         logger.error(f"Error expanding query '{query}': {e}")
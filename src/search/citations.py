@@ -0,0 +1,115 @@
+from src.config.logging import logger
+from functools import cached_property
+from typing import Iterator
+from typing import Tuple
+from typing import List
+from typing import Dict
+import json
+import re
+
+
+# One citation marker with one or more ranks, e.g. [2] or [1, 3]
+CITATION_PATTERN = re.compile(r'\[(\d+(?:\s*,\s*\d+)*)\]')
+
+
+class Citations:
+    """
+    Citations of a summarized answer, parsed in one pass. The order, most cited ranks and cleaned
+    text are derived from the parse on first access.
+
+    Attributes:
+        counts (Dict[int, int]): Number of times each rank is cited, in order of first citation.
+        order (List[int]): Cited ranks sorted by frequency; ties keep the order of first citation.
+        most_cited (List[int]): The most frequently cited rank(s). In case of a tie, includes all.
+        text (str): The answer with all citation markers removed.
+    """
+
+    def __init__(self, source: str, counts: Dict[int, int], spans: List[Tuple[int, int]]) -> None:
+        self.source = source
+        self.counts = counts
+        self.spans = spans
+
+    @cached_property
+    def order(self) -> List[int]:
+        return sorted(self.counts, key=self.counts.get, reverse=True)
+
+    @cached_property
+    def most_cited(self) -> List[int]:
+        top = max(self.counts.values(), default=0)
+        return [rank for rank in self.order if self.counts[rank] == top]
+
+    @cached_property
+    def text(self) -> str:
+        parts, end = [], 0
+        for start, stop in self.spans:
+            # Drop the space before the marker too, so 'fee [1].' becomes 'fee.'
+            parts.append(self.source[end:start].rstrip())
+            end = stop
+        parts.append(self.source[end:])
+        return ''.join(parts)
+
+    def __contains__(self, rank: int) -> bool:
+        return rank in self.counts
+
+
+def parse_citations(text: str) -> Citations:
+    """
+    Parses the citation markers of a summarized answer, including multi-citations like [1, 3].
+
+    Args:
+    text (str): The summarized answer.
+
+    Returns:
+    Citations: Counts, frequency order, most cited rank(s) and the text without citations.
+    """
+    text = text or ''
+    counts = {}
+    spans = []
+    for match in CITATION_PATTERN.finditer(text):
+        spans.append(match.span())
+        for rank in match.group(1).split(','):
+            rank = int(rank)
+            counts[rank] = counts.get(rank, 0) + 1
+    return Citations(text, counts, spans)
+
+
+def strip_citations(text: str) -> str:
+    """ Removes citation markers like [1] and [1, 3] from a text. """
+    return parse_citations(text).text
+
+
+def iter_jsonl_citations(file_path: str) -> Iterator[Dict[str, Citations]]:
+    """
+    Parses the citations of every summarized answer in a search result JSONL file.
+
+    Single-query records hold one summary and multi-query records one per variant; either way a
+    record yields a dict from the query the summary answers to its Citations.
+
+    Args:
+    file_path (str): Path to the JSONL file.
+
+    Yields:
+    Dict[str, Citations]: The citations of each summary of a record, in file order.
+    """
+    with open(file_path, 'r') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'match_info' in record:
+                yield {record['query']: parse_citations(record.get('summarized_answer', ''))}
+            else:
+                yield {variant: parse_citations(info.get('summarized_answer', ''))
+                       for variant, info in record.items() if variant not in ['query', 'brand'] and info}
+
+
+def parse_jsonl_citations(file_path: str) -> List[Dict[str, Citations]]:
+    """ Parses the citations of a whole search result JSONL file; see iter_jsonl_citations. """
+    try:
+        return list(iter_jsonl_citations(file_path))
+    except FileNotFoundError:
+        logger.error(f"File not found: {file_path}")
+        return []
+    except json.JSONDecodeError as e:
+        logger.error(f"Error decoding JSON: {e}")
+        return []
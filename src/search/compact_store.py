@@ -0,0 +1,229 @@
+from src.search.multi_query_retriever import find_most_weighted_ids
+from src.search.multi_query_retriever import QueryResult
+from src.search.citations import parse_citations
+from src.utils.textstore import open_text_store
+from src.utils.textstore import resolve_texts
+from src.utils.cache import content_hash
+from src.config.logging import logger
+from functools import cached_property
+from typing import Optional
+from typing import Tuple
+from typing import List
+from typing import Dict
+from typing import Any
+import pandas as pd
+import numpy as np
+import argparse
+import json
+import os
+
+
+FORMAT_VERSION = 1
+TEXT_FIELDS = ['extractive_answers', 'extractive_segments']
+SUMMARY_RANK = 0  # Rank under which a variant's summarized answer is referenced in refs.parquet
+
+
+def store_path(jsonl_path: str) -> str:
+    """ Default location of the compact store converted from a JSONL file: next to it, with a .store suffix. """
+    return os.path.splitext(jsonl_path)[0] + '.store'
+
+
+def _source_stamp(jsonl_path: str) -> Dict[str, Any]:
+    stat = os.stat(jsonl_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def convert_jsonl(jsonl_path: str, output_dir: Optional[str] = None) -> str:
+    """
+    Converts a multi-query search result JSONL file into a compact store.
+
+    Layout of the store directory:
+        meta.json      queries, brands, variant strings, interned knowledge IDs and their links
+        ranks.npy      int32 [query, variant, rank - 1] -> knowledge ID index, -1 where there is no match
+        cited.npy      bool  [query, variant, rank - 1] -> whether the variant's summary cites the rank
+        texts.parquet  hash -> text, one row per distinct summary, extractive answer or segment
+        refs.parquet   (query, variant, rank, field, position) -> text hash; summaries use rank 0
+
+    Args:
+    jsonl_path (str): Path to the JSONL file, as written by src/eval/doc_search_multi_query.py.
+    output_dir (Optional[str]): Directory of the store. Defaults to store_path(jsonl_path).
+
+    Returns:
+    str: The store directory.
+    """
+    output_dir = output_dir or store_path(jsonl_path)
+    ids, id_codes, links = [], {}, []
+    queries, brands, variants, matches = [], [], [], []
+    texts, refs = {}, []
+    stored_texts = open_text_store(jsonl_path)
+
+    def text_ref(text: str, *ref: Any) -> None:
+        key = content_hash(text)
+        texts.setdefault(key, text)
+        refs.append((*ref, key))
+
+    with open(jsonl_path, 'r') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            data = resolve_texts(json.loads(line), stored_texts)
+            q = len(queries)
+            queries.append(data['query'])
+            brands.append(data['brand'])
+            row_variants, row_matches = [], []
+            for variant, info in data.items():
+                if variant in ['query', 'brand']:
+                    continue
+                v = len(row_variants)
+                row_variants.append(variant)
+                info = info or {}
+                summary = info.get('summarized_answer', '')
+                if info:
+                    text_ref(summary, q, v, SUMMARY_RANK, 'summarized_answer', 0)
+                citations = parse_citations(summary)
+                for match in info.get('match_info', []):
+                    knowledge_id = match['knowledge_id']
+                    if knowledge_id not in id_codes:
+                        id_codes[knowledge_id] = len(ids)
+                        ids.append(knowledge_id)
+                        links.append(match.get('link', ''))
+                    row_matches.append((v, match['rank'], id_codes[knowledge_id], match['rank'] in citations))
+                    for field in TEXT_FIELDS:
+                        for position, text in enumerate(match.get(field, [])):
+                            text_ref(text, q, v, match['rank'], field, position)
+            variants.append(row_variants)
+            matches.append(row_matches)
+
+    max_variants = max((len(row) for row in variants), default=0)
+    max_rank = max((rank for row in matches for _, rank, _, _ in row), default=0)
+    ranks = np.full((len(queries), max_variants, max_rank), -1, dtype=np.int32)
+    cited = np.zeros((len(queries), max_variants, max_rank), dtype=bool)
+    for q, row in enumerate(matches):
+        for v, rank, code, is_cited in row:
+            ranks[q, v, rank - 1] = code
+            cited[q, v, rank - 1] = is_cited
+
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, 'ranks.npy'), ranks)
+    np.save(os.path.join(output_dir, 'cited.npy'), cited)
+    pd.DataFrame({'hash': list(texts), 'text': list(texts.values())}).to_parquet(os.path.join(output_dir, 'texts.parquet'), index=False)
+    pd.DataFrame(refs, columns=['query', 'variant', 'rank', 'field', 'position', 'hash']).to_parquet(os.path.join(output_dir, 'refs.parquet'), index=False)
+    meta = {'version': FORMAT_VERSION, 'source': os.path.abspath(jsonl_path), 'source_stamp': _source_stamp(jsonl_path),
+            'queries': queries, 'brands': brands, 'variants': variants, 'ids': ids, 'links': links}
+    # meta.json is written last, so a store without it is incomplete
+    with open(os.path.join(output_dir, 'meta.json'), 'w') as file:
+        json.dump(meta, file)
+    logger.info(f"Converted {len(queries)} queries to {output_dir}: {len(ids)} distinct articles, "
+                f"{len(texts)} distinct texts for {len(refs)} references")
+    return output_dir
+
+
+class CompactStore:
+    """
+    Read side of a store written by convert_jsonl.
+
+    The rank and citation matrices are memory-mapped, so opening a store costs only reading
+    meta.json. Texts are loaded on the first text lookup.
+
+    Attributes:
+        queries (List[str]): The eval questions.
+        brands (List[str]): The brand filter of each question.
+        variants (List[List[str]]): The variant queries searched for each question.
+        ids (List[str]): Interned knowledge IDs; the rank matrix holds indexes into this list.
+        ranks (np.ndarray): [query, variant, rank - 1] -> knowledge ID index, -1 where there is no match.
+        cited (np.ndarray): [query, variant, rank - 1] -> whether the variant's summary cites the rank.
+    """
+
+    def __init__(self, store_dir: str) -> None:
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, 'meta.json'), 'r') as file:
+            self.meta = json.load(file)
+        if self.meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported store version {self.meta.get('version')} in {store_dir}")
+        self.queries = self.meta['queries']
+        self.brands = self.meta['brands']
+        self.variants = self.meta['variants']
+        self.ids = self.meta['ids']
+        self.links = self.meta['links']
+        self.ranks = np.load(os.path.join(store_dir, 'ranks.npy'), mmap_mode='r')
+        self.cited = np.load(os.path.join(store_dir, 'cited.npy'), mmap_mode='r')
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    def is_fresh(self, jsonl_path: str) -> bool:
+        """ True if the store was converted from the current version of the JSONL file. """
+        return os.path.exists(jsonl_path) and self.meta.get('source_stamp') == _source_stamp(jsonl_path)
+
+    def ranked_ids(self, q: int, cited_only: bool = False) -> List[Tuple[int, str]]:
+        """ (rank, knowledge ID) of every match of the question across its variants, in file order. """
+        v_index, r_index = np.nonzero((self.ranks[q] >= 0) & (self.cited[q] if cited_only else True))
+        codes = self.ranks[q][v_index, r_index]
+        return [(int(r) + 1, self.ids[code]) for r, code in zip(r_index, codes)]
+
+    def query_results(self, top_k: int = 5) -> List[QueryResult]:
+        """ Same as multi_query_retriever.read_jsonl_file on the source file, without parsing it. """
+        return [QueryResult(self.queries[q], self.brands[q],
+                            find_most_weighted_ids(self.ranked_ids(q), top_k=top_k),
+                            find_most_weighted_ids(self.ranked_ids(q, cited_only=True), top_k=top_k))
+                for q in range(len(self))]
+
+    @cached_property
+    def _texts(self) -> Dict[str, str]:
+        table = pd.read_parquet(os.path.join(self.store_dir, 'texts.parquet'))
+        return dict(zip(table['hash'], table['text']))
+
+    @cached_property
+    def _refs(self) -> Dict[Tuple[int, int, int, str], List[str]]:
+        table = pd.read_parquet(os.path.join(self.store_dir, 'refs.parquet')).sort_values('position', kind='stable')
+        refs = {}
+        for q, v, rank, field, key in zip(table['query'], table['variant'], table['rank'], table['field'], table['hash']):
+            refs.setdefault((int(q), int(v), int(rank), field), []).append(key)
+        return refs
+
+    def texts(self, q: int, v: int, rank: int, field: str = 'extractive_answers') -> List[str]:
+        """ The extractive answers or segments of a match. """
+        return [self._texts[key] for key in self._refs.get((q, v, rank, field), [])]
+
+    def summary(self, q: int, v: int) -> str:
+        """ The summarized answer of a variant's search. """
+        keys = self._refs.get((q, v, SUMMARY_RANK, 'summarized_answer'))
+        return self._texts[keys[0]] if keys else ''
+
+    def record(self, q: int) -> Dict[str, Any]:
+        """ Rebuilds the JSONL record of a question. """
+        record = {}
+        for v, variant in enumerate(self.variants[q]):
+            if (q, v, SUMMARY_RANK, 'summarized_answer') not in self._refs:
+                record[variant] = {}
+                continue
+            match_info = []
+            for r in np.nonzero(self.ranks[q, v] >= 0)[0]:
+                code = self.ranks[q, v, r]
+                match = {'rank': int(r) + 1, 'link': self.links[code], 'knowledge_id': self.ids[code]}
+                match.update({field: self.texts(q, v, int(r) + 1, field) for field in TEXT_FIELDS})
+                match_info.append(match)
+            record[variant] = {'summarized_answer': self.summary(q, v), 'match_info': match_info}
+        record.update({'query': self.queries[q], 'brand': self.brands[q]})
+        return record
+
+
+def open_store(jsonl_path: str) -> Optional[CompactStore]:
+    """ Opens the store converted from a JSONL file, or returns None if there is none or it is stale. """
+    path = store_path(jsonl_path)
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+    try:
+        store = CompactStore(path)
+    except (ValueError, OSError, json.JSONDecodeError) as e:
+        logger.error(f"Ignoring unreadable store {path}: {e}")
+        return None
+    return store if store.is_fresh(jsonl_path) else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert multi-query search results from JSONL to a compact store.')
+    parser.add_argument('jsonl', help='Path to the JSONL file.')
+    parser.add_argument('--output', help='Store directory. Defaults to the JSONL path with a .store suffix.')
+    args = parser.parse_args()
+    convert_jsonl(args.jsonl, args.output)
@@ -1,73 +1,130 @@
 from google.cloud import discoveryengine_v1beta as discoveryengine
 from google.api_core.client_options import ClientOptions
+from concurrent.futures import ThreadPoolExecutor
 from google.protobuf import json_format
 from src.config.logging import logger 
+from src.utils.singleflight import single_flight
+from src.utils.tracing import span
 from src.config.setup import config
+from functools import lru_cache
 from typing import Optional
+from typing import Tuple
+from typing import List
 from typing import Dict
 from typing import Any 
 
 
 LOCATION = "global" 
+PAGE_SIZE = 5
+MAX_PAGE_SIZE = 50
+
+# What each consumer needs from a search. Extractive content and summaries make responses larger and
+# slower, so consumers that only use the ranked knowledge IDs should not pay for them.
+SEARCH_PROFILES = {
+    'ids': {'answers': 0, 'segments': 0, 'summary': False},
+    'answers': {'answers': 3, 'segments': 0, 'summary': False},
+    'segments': {'answers': 0, 'segments': 3, 'summary': False},
+    'summary': {'answers': 0, 'segments': 0, 'summary': True},
+    'full': {'answers': 3, 'segments': 3, 'summary': True},
+}
+
+
+@lru_cache(maxsize=None)
+def get_client() -> discoveryengine.SearchServiceClient:
+    """
+    Returns the Discovery Engine search client, created once per process so every search reuses its channel.
+    """
+    # Google clients read GOOGLE_APPLICATION_CREDENTIALS when they are created, and loading the config sets it
+    config.load()
+    client_options = (
+        ClientOptions(api_endpoint=f"{LOCATION}-discoveryengine.googleapis.com")
+        if LOCATION != "global"
+        else None
+    )
+    return discoveryengine.SearchServiceClient(client_options=client_options)
+
+
+@lru_cache(maxsize=None)
+def request_template(page_size: int, profile: str = 'full') -> discoveryengine.SearchRequest:
+    """
+    Builds the parts of a search request that are the same for every query. Searches copy it and only set the query and filter.
+
+    Args:
+        page_size (int): Number of results per page.
+        profile (str): Key of SEARCH_PROFILES selecting the extractive content and summary to request.
 
-def search_data_store(search_query: str, filter_str: str) -> Optional[discoveryengine.SearchResponse]:
+    Returns:
+        discoveryengine.SearchRequest: The request template. Must not be modified.
+    """
+    if profile not in SEARCH_PROFILES:
+        raise ValueError(f"Unknown search profile: {profile}")
+    spec = SEARCH_PROFILES[profile]
+    serving_config = get_client().serving_config_path(
+        project=config.PROJECT_ID,
+        location=LOCATION,
+        data_store=config.DATA_STORE_ID,
+        serving_config="default_config",
+    )
+
+    content_search_spec = discoveryengine.SearchRequest.ContentSearchSpec(
+        snippet_spec=discoveryengine.SearchRequest.ContentSearchSpec.SnippetSpec(
+            return_snippet=False  # snippets are NOT important in the context of this use case
+        ),
+    )
+    if spec['answers'] or spec['segments']:
+        content_search_spec.extractive_content_spec = discoveryengine.SearchRequest.ContentSearchSpec.ExtractiveContentSpec(
+            max_extractive_answer_count=spec['answers'],
+            max_extractive_segment_count=spec['segments'],
+        )
+    if spec['summary']:
+        content_search_spec.summary_spec = discoveryengine.SearchRequest.ContentSearchSpec.SummarySpec(
+            summary_result_count=5,
+            include_citations=True,
+            ignore_adversarial_query=False,
+            ignore_non_summary_seeking_query=False,
+        )
+
+    return discoveryengine.SearchRequest(
+        serving_config=serving_config,
+        page_size=page_size,
+        content_search_spec=content_search_spec,
+        query_expansion_spec=discoveryengine.SearchRequest.QueryExpansionSpec(
+            condition=discoveryengine.SearchRequest.QueryExpansionSpec.Condition.AUTO,
+        ),
+        spell_correction_spec=discoveryengine.SearchRequest.SpellCorrectionSpec(
+            mode=discoveryengine.SearchRequest.SpellCorrectionSpec.Mode.AUTO
+        ),
+    )
+
+
+@lru_cache(maxsize=None)
+def brand_filter(*brands: str) -> str:
+    """ Builds the filter expression matching documents of any of the given brands. """
+    return "Brand: ANY({})".format(', '.join(f'"{brand}"' for brand in brands))
+
+
+def search_data_store(search_query: str, filter_str: str, page_size: int = PAGE_SIZE,
+                      profile: str = 'full') -> Optional[discoveryengine.SearchResponse]:
     """
     Search the data store using Google Cloud's Discovery Engine API.
 
     Args:
         search_query (str): The search query string.
         filter_str (str): Filter string for the query.
+        page_size (int): Number of results to return.
+        profile (str): Key of SEARCH_PROFILES selecting the content to return.
 
     Returns:
         discoveryengine.SearchResponse: The search response from the Discovery Engine API.
     """
     try:
-        client_options = (
-            ClientOptions(api_endpoint=f"{LOCATION}-discoveryengine.googleapis.com")
-            if LOCATION != "global"
-            else None
-        )
+        request = discoveryengine.SearchRequest(request_template(page_size, profile))
+        request.query = search_query
+        request.filter = filter_str
 
-        client = discoveryengine.SearchServiceClient(client_options=client_options)
-
-        serving_config = client.serving_config_path(
-            project=config.PROJECT_ID,
-            location=LOCATION,
-            data_store=config.DATA_STORE_ID,
-            serving_config="default_config",
-        )
-
-        content_search_spec = discoveryengine.SearchRequest.ContentSearchSpec(
-            snippet_spec=discoveryengine.SearchRequest.ContentSearchSpec.SnippetSpec(
-                return_snippet=False  # snippets are NOT important in the context of this use case
-            ),
-            extractive_content_spec=discoveryengine.SearchRequest.ContentSearchSpec.ExtractiveContentSpec(
-                max_extractive_answer_count=3,
-                max_extractive_segment_count=3,
-            ),
-            summary_spec=discoveryengine.SearchRequest.ContentSearchSpec.SummarySpec(
-                summary_result_count=5,
-                include_citations=True,
-                ignore_adversarial_query=False,
-                ignore_non_summary_seeking_query=False,
-            ),
-        )
-
-        request = discoveryengine.SearchRequest(
-            serving_config=serving_config,
-            query=search_query,
-            filter=filter_str,
-            page_size=5,
-            content_search_spec=content_search_spec,
-            query_expansion_spec=discoveryengine.SearchRequest.QueryExpansionSpec(
-                condition=discoveryengine.SearchRequest.QueryExpansionSpec.Condition.AUTO,
-            ),
-            spell_correction_spec=discoveryengine.SearchRequest.SpellCorrectionSpec(
-                mode=discoveryengine.SearchRequest.SpellCorrectionSpec.Mode.AUTO
-            ),
-        )
-
-        response = client.search(request)
+        with span('search.discovery_engine', query_chars=len(search_query), filter=filter_str, profile=profile) as s:
+            response = get_client().search(request)
+            s.set(results=len(response.results))
         return response
 
     except Exception as e:
@@ -75,15 +132,62 @@ def search_data_store(search_query: str, filter_str: str) -> Optional[discoverye
         return None
 
 
+def extract_match(result: discoveryengine.SearchResponse.SearchResult) -> Dict[str, Any]:
+    """
+    Extracts the knowledge ID, brand, link and extractive content of a single search result.
+
+    Args:
+        result (discoveryengine.SearchResponse.SearchResult): A result of the search response.
+
+    Returns:
+        Dict[str, Any]: The extracted information.
+    """
+    data = {
+        "extractive_answers": [],
+        "extractive_segments": [],
+        "knol_id": "",
+        "brand": None,
+        "link": ""
+    }
+
+    # Convert protocol buffer message to JSON
+    result_json = json_format.MessageToDict(result.document._pb)
+
+    # Extracting fields from JSON
+    struct_data = result_json.get('structData', {})
+    derived_struct_data = result_json.get('derivedStructData', {})
+
+    knol_id = struct_data.get("Id")
+    data['knol_id'] = knol_id
+    data['brand'] = struct_data.get("Brand")
+
+    # Collect extractive answers 
+    extractive_answers = derived_struct_data.get("extractive_answers")
+    if extractive_answers:
+        data["extractive_answers"] = [answer["content"] for answer in extractive_answers]
+
+    # Collect extractive segments
+    extractive_segments = derived_struct_data.get("extractive_segments")
+    if extractive_segments:
+        data["extractive_segments"] = [segment["content"] for segment in extractive_segments]
+
+    # Extracting link
+    link = derived_struct_data.get("link")
+    if link:
+        data["link"] = link
+
+    return data
+
+
 def extract_relevant_data(response: Optional[discoveryengine.SearchResponse]):
     """
-    Extracts company, title, snippet, and link from the search response.
+    Extracts the summary and the knowledge ID, link and extractive content of each result from the search response.
 
     Args:
         response (discoveryengine.SearchResponse): The search response object from the Discovery Engine API.
 
     Returns:
-        List[Dict[str, str]]: A list of dictionaries containing the extracted information.
+        List: The summary, if the response has one, followed by a dictionary per result.
     """
     extracted_data = []
 
@@ -96,45 +200,7 @@ def extract_relevant_data(response: Optional[discoveryengine.SearchResponse]):
         extracted_data.append(summary)
         
     for result in response.results:
-        data = {
-            "extractive_answers": [],
-            "extractive_segments": [],
-            "knol_id": "",
-            "link": ""
-        }
-
-        # Convert protocol buffer message to JSON
-        result_json = json_format.MessageToDict(result.document._pb)
-
-        # Extracting fields from JSON
-        struct_data = result_json.get('structData', {})
-        derived_struct_data = result_json.get('derivedStructData', {})
-
-        knol_id = struct_data.get("Id")
-        data['knol_id'] = knol_id
-
-        # Collect extractive answers 
-        extractive_answers = derived_struct_data.get("extractive_answers")
-        if extractive_answers:
-            answers = []
-            for answer in extractive_answers:
-                answers.append(answer["content"])
-        data['extractive_answers'] = answers
-
-        # Collect extractive segmentss
-        extractive_segments = derived_struct_data.get("extractive_segments")
-        if extractive_segments:
-            segments = []
-            for segment in extractive_segments:
-                segments.append(segment["content"])
-            data["extractive_segments"] = segments
-
-        # Extracting link
-        link = derived_struct_data.get("link")
-        if link:
-            data["link"] = link
-
-        extracted_data.append(data)
+        extracted_data.append(extract_match(result))
     return extracted_data
 
 
@@ -145,11 +211,13 @@ def create_summary_dict(matches):
     :param matches: List of match data extracted.
     :return: A dictionary containing the summary and details of each match.
     """
-    summary_dict = {"summarized_answer": matches[0]}
+    # Responses without a summary (e.g. the 'ids' profile) start with the first match
+    has_summary = bool(matches) and isinstance(matches[0], str)
+    summary_dict = {"summarized_answer": matches[0] if has_summary else ''}
     match_info = []
 
     rank = 1
-    for match in matches[1:]:
+    for match in matches[1 if has_summary else 0:]:
         info = {
             "rank": rank,
             "link": match["link"],
@@ -165,7 +233,8 @@ def create_summary_dict(matches):
     return summary_dict
 
 
-def search(query: str, brand: str) -> Dict[str, Any]:
+@single_flight('search')
+def search(query: str, brand: str, profile: str = 'full', page_size: int = PAGE_SIZE) -> Dict[str, Any]:
     """
     Searches a data store based on a given search query and brand, 
     then consolidates the results in a dictionary.
@@ -173,16 +242,21 @@ def search(query: str, brand: str) -> Dict[str, Any]:
     Parameters:
     query (str): The query used for searching the data store.
     brand (str): The brand to filter the search results.
+    profile (str): Key of SEARCH_PROFILES; content not requested is returned empty.
+    page_size (int): Number of results to return.
 
     Returns:
     Dict[str, Any]: A dictionary containing the consolidated results of the search.
-                    Returns an empty dictionary if an error occurs.
+                    Returns an empty dictionary if an error occurs. Concurrent identical
+                    searches share one request and the same dictionary, so copy before modifying.
     """
-    filter_str = f"Brand: ANY(\"{brand}\")"
+    filter_str = brand_filter(brand)
 
     try:
         # Perform the search with the provided query and filter
-        hits = search_data_store(query, filter_str)
+        hits = search_data_store(query, filter_str, page_size=page_size, profile=profile)
+        if hits is None:
+            return {}
 
         # Extract relevant data from the search results
         matches = extract_relevant_data(hits)
@@ -198,6 +272,93 @@ def search(query: str, brand: str) -> Dict[str, Any]:
         return {}
     
 
+
+def _result_brands(match: Dict[str, Any]) -> List[str]:
+    """ Brands of a match; the Brand field may hold a single value or a list. """
+    brand = match.get("brand")
+    if brand is None:
+        return []
+    return brand if isinstance(brand, list) else [brand]
+
+
+def search_brands_together(query: str, brands: Tuple[str, ...], profile: str = 'full') -> Dict[str, Dict[str, Any]]:
+    """
+    Answers one query for several brands with a single search over all of them, partitioning the results locally.
+
+    A brand whose top results may be cut off by the page size is searched again on its own. Since the
+    shared search has no per-brand summary, partitioned results carry an empty summarized answer.
+
+    Args:
+    query (str): The query.
+    brands (Tuple[str, ...]): The brands to search.
+    profile (str): Key of SEARCH_PROFILES.
+
+    Returns:
+    Dict[str, Dict[str, Any]]: The search result of each brand in the format of search().
+    """
+    page_size = min(PAGE_SIZE * len(brands), MAX_PAGE_SIZE)
+    response = search_data_store(query, brand_filter(*brands), page_size=page_size, profile=profile)
+    matches = extract_relevant_data(response)
+    if matches and isinstance(matches[0], str):
+        matches = matches[1:]
+
+    partitions = {brand: [] for brand in brands}
+    for match in matches:
+        for brand in _result_brands(match):
+            if brand in partitions:
+                partitions[brand].append(match)
+
+    # A page with fewer results than requested holds every match, otherwise short brands may be missing results.
+    page_complete = response is not None and len(response.results) < page_size
+    results = {}
+    for brand, brand_matches in partitions.items():
+        if response is not None and (page_complete or len(brand_matches) >= PAGE_SIZE):
+            results[brand] = create_summary_dict([''] + brand_matches[:PAGE_SIZE])
+        else:
+            results[brand] = search(query, brand, profile=profile)
+    return results
+
+
+def search_batch(pairs: List[Tuple[str, str]], max_workers: int = 8, share_across_brands: bool = False,
+                 profile: str = 'full') -> List[Dict[str, Any]]:
+    """
+    Searches many (query, brand) pairs, sending each distinct pair once and running the searches concurrently.
+
+    Pairs are grouped by query. With `share_across_brands`, a query asked for several brands is answered
+    by one search over all of them (see search_brands_together), which saves requests when only the
+    matches are needed.
+
+    Args:
+    pairs (List[Tuple[str, str]]): The (query, brand) pairs.
+    max_workers (int): Maximum number of concurrent searches.
+    share_across_brands (bool): Search all brands of a query at once and partition the results locally.
+    profile (str): Key of SEARCH_PROFILES.
+
+    Returns:
+    List[Dict[str, Any]]: The search result of each pair, in order, in the format of search().
+    """
+    groups = {}
+    for query, brand in pairs:
+        brands = groups.setdefault(query, [])
+        if brand not in brands:
+            brands.append(brand)
+
+    def run(group: Tuple[str, List[str]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        query, brands = group
+        if share_across_brands and len(brands) > 1:
+            try:
+                return {(query, brand): result for brand, result in search_brands_together(query, tuple(brands), profile).items()}
+            except Exception as e:
+                logger.error(f"Shared search failed for query '{query}', searching brands separately: {e}")
+        return {(query, brand): search(query, brand, profile=profile) for brand in brands}
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for group_results in executor.map(run, groups.items()):
+            results.update(group_results)
+    logger.info(f"Searched {len(results)} distinct pairs for {len(pairs)} requested")
+    return [dict(results[pair]) for pair in pairs]
+
 if __name__ == "__main__":
     query = "How do I stop pay a refund check?"
     brand = "Farmers"
@@ -1,17 +1,95 @@
 from src.query.expander import expand_query_and_get_variants
+from src.search.citations import CITATION_PATTERN
+from src.search.citations import parse_citations
+from src.search.doc_search import search_batch
 from src.search.doc_search import search
 from src.config.logging import logger
+from src.utils.tracing import span
 from src.config.setup import *
+from typing import Optional
+from typing import Dict
+from typing import Any
+import threading
+import math
+import re
 
 
-def multi_query_search(query: str, brand: str) -> dict:
+MAX_VARIANTS = 4
+CONFIDENCE_THRESHOLD = 0.75  # Original searches at or above this confidence are not expanded
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+(?!\[)')  # A marker after the full stop belongs to the sentence before it
+
+_stats = {'queries': 0, 'expanded': 0, 'variants': 0, 'saved_expansions': 0, 'saved_searches': 0}
+_stats_lock = threading.Lock()
+
+
+def search_confidence(result: Optional[Dict[str, Any]]) -> float:
+    """
+    Scores how well a single search already answers its query, from 0 (no answer) to 1.
+
+    The score is zero without a summarized answer. Otherwise it is the mean of two signals:
+    citation coverage (share of the summary's sentences carrying a citation) and agreement
+    (share of the citations pointing at the most cited knowledge ID, counting several ranks
+    of the same article together).
+
+    Args:
+    result (Optional[Dict[str, Any]]): A search result in the format of doc_search.search().
+
+    Returns:
+    float: The confidence.
+    """
+    summary = (result or {}).get('summarized_answer') or ''
+    if not summary.strip():
+        return 0.0
+    sentences = [sentence for sentence in SENTENCE_BREAK.split(summary.strip()) if sentence.strip()]
+    coverage = sum(CITATION_PATTERN.search(sentence) is not None for sentence in sentences) / len(sentences)
+
+    citations = parse_citations(summary)
+    knowledge_ids = {match['rank']: match['knowledge_id'] for match in result.get('match_info', [])}
+    per_article = {}
+    for rank, count in citations.counts.items():
+        knowledge_id = knowledge_ids.get(rank)
+        if knowledge_id is not None:
+            per_article[knowledge_id] = per_article.get(knowledge_id, 0) + count
+    agreement = max(per_article.values()) / sum(citations.counts.values()) if per_article else 0.0
+    return (coverage + agreement) / 2
+
+
+def variants_for_confidence(confidence: float, threshold: float = CONFIDENCE_THRESHOLD,
+                            max_variants: int = MAX_VARIANTS) -> int:
+    """ Number of variants to search: none at or above the threshold, up to max_variants as confidence drops to 0. """
+    if confidence >= threshold:
+        return 0
+    return max(1, math.ceil(max_variants * (threshold - confidence) / threshold))
+
+
+def adaptive_stats() -> Dict[str, int]:
+    """ Queries searched adaptively, how many were expanded, and the expansion calls and searches saved. """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _record(**counts: int) -> None:
+    with _stats_lock:
+        for name, count in counts.items():
+            _stats[name] += count
+
+
+def multi_query_search(query: str, brand: str, adaptive: bool = False, threshold: float = CONFIDENCE_THRESHOLD,
+                       max_variants: int = MAX_VARIANTS) -> dict:
     """
     Expands a given query, performs a search for each variant with the specified brand, 
     and returns the search results in a dictionary mapping each query variant to its results.
 
+    With `adaptive`, the original query is searched first and only expanded when its result is weak
+    (see search_confidence), with more variants the weaker it is. Confident queries cost one search
+    instead of an expansion call and max_variants + 1 searches; expanded ones take one search longer.
+
     Args:
     query (str): The query to be expanded and searched.
     brand (str): The brand to be included in the search.
+    adaptive (bool): Expand only when the original search is not confident.
+    threshold (float): Confidence at or above which an adaptive search is not expanded.
+    max_variants (int): Number of variants of a non-adaptive search and maximum of an adaptive one.
 
     Returns:
     dict: A dictionary mapping each query variant to a list of search results.
@@ -20,24 +98,44 @@ def multi_query_search(query: str, brand: str) -> dict:
     Exception: If an error occurs during the query expansion or search process.
     """
     try:
-        variants = expand_query_and_get_variants(query, 4)
-        search_results = {}
-        search_results[query] = search(query, brand)
-        for variant in variants:
-            result = search(variant, brand)
-            search_results[variant] = result
-        return search_results
+        if adaptive:
+            return _adaptive_search(query, brand, threshold, max_variants)
+        variants = expand_query_and_get_variants(query, max_variants)
+        queries = [query] + variants
+        # The original query and its variants are searched concurrently
+        results = search_batch([(variant, brand) for variant in queries], max_workers=len(queries))
+        return dict(zip(queries, results))
     except Exception as e:
         logger.error(f"Error in perform_brand_search with query '{query}' and brand '{brand}': {e}")
         raise
 
+
+def _adaptive_search(query: str, brand: str, threshold: float, max_variants: int) -> dict:
+    with span('search.adaptive') as s:
+        original = dict(search(query, brand))
+        confidence = search_confidence(original)
+        num_variants = variants_for_confidence(confidence, threshold, max_variants)
+        s.set(confidence=round(confidence, 3), variants=num_variants)
+        results = {query: original}
+        if num_variants:
+            variants = [variant for variant in expand_query_and_get_variants(query, num_variants) if variant != query]
+            for variant, result in zip(variants, search_batch([(variant, brand) for variant in variants], max_workers=max(len(variants), 1))):
+                results[variant] = result
+        else:
+            variants = []
+    _record(queries=1, expanded=int(num_variants > 0), variants=len(variants),
+            saved_expansions=int(num_variants == 0), saved_searches=max_variants - len(variants))
+    return results
+
+
 if __name__ == '__main__':
     query = "How do I stop a refund check?"
     brand = "Farmers"
-    results = multi_query_search(query, brand)
+    results = multi_query_search(query, brand, adaptive=True)
     
     for variant, result in results.items():
         print(f"Query: {variant}")
         ans = result['summarized_answer']
         print(f'Answer: {ans}')
-        print('-' * 100)
\ No newline at end of file
+        print('-' * 100)
+    print(adaptive_stats())
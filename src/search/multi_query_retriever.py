@@ -1,8 +1,7 @@
+from src.search.citations import parse_citations
 from typing import Any, Dict, List, Tuple
 from src.config.logging import logger
-from collections import Counter
 import json
-import re 
 
 
 class QueryResult:
@@ -99,28 +98,13 @@ def extract_ids_from_tuples(input_tuples: List[Tuple[str, float]]) -> List[str]:
     return [tup[0] for tup in input_tuples]
 
 
-def extract_citations(text: str) -> list:
-        """
-        Extracts and returns a list of citations from the given text, sorted by frequency.
-
-        Parameters:
-        text (str): The text from which citations are to be extracted.
-
-        Returns:
-        list: A list of integers representing the citations, sorted by their frequency.
-        """
-        try:
-            citations = re.findall(r'\[\d+\]', text)
-            citation_counts = Counter(int(citation.strip('[]')) for citation in citations)
-            return sorted(citation_counts, key=citation_counts.get, reverse=True)
-        except Exception as e:
-            raise RuntimeError(f"An error occurred: {e}")
-        
-
 def read_jsonl_file(file_path: str) -> List[QueryResult]:
     """
     Reads a JSONL file and returns a list of QueryResult objects.
 
+    If the file has been converted with src/search/compact_store.py since it last changed, the
+    results are computed from the store's rank matrices instead of parsing the JSON.
+
     Parameters:
     - file_path (str): The path to the JSONL file.
 
@@ -132,6 +116,13 @@ def read_jsonl_file(file_path: str) -> List[QueryResult]:
     - json.JSONDecodeError: If the file is not valid JSONL.
     - Exception: For any other errors encountered during processing.
     """
+    # Imported here because the store builds on this module
+    from src.search.compact_store import open_store
+    store = open_store(file_path)
+    if store is not None:
+        logger.info(f"Reading {file_path} from its compact store")
+        return store.query_results()
+
     query_results_list = []
     try:
         with open(file_path, 'r') as file:
@@ -155,7 +146,7 @@ def read_jsonl_file(file_path: str) -> List[QueryResult]:
                 for variant, info in data.items():
                     if variant not in ['query', 'brand'] and info:
                         summary = info['summarized_answer']
-                        citations = extract_citations(summary)
+                        citations = parse_citations(summary)
                         match_info = info['match_info']
                         for match in match_info:
                             rank = match['rank']
@@ -1,19 +1,22 @@
+from src.search.citations import parse_citations
+from src.utils.textstore import open_text_store
+from src.utils.textstore import resolve_texts
+from src.utils.textstore import TextStore
 from typing import Any, Dict, List, Optional
 from src.config.logging import logger
-from collections import Counter
 import json
-import re 
 
 class SearchResult:
     """
-    Represents an individual search result.
+    Represents an individual search result. With a text store, repeated answers and segments share one copy.
     """
-    def __init__(self, data: Dict[str, Any]):
+    def __init__(self, data: Dict[str, Any], texts: Optional[TextStore] = None):
+        intern = texts.intern if texts is not None else str
         self.rank: Optional[int] = data.get('rank')
         self.link: Optional[str] = data.get('link')
         self.knowledge_id: Optional[str] = data.get('knowledge_id')
-        self.extractive_answers: List[str] = [ans.replace('Q_A_Answer__c :', '').strip() for ans in data.get('extractive_answers', [])]
-        self.extractive_segments: List[str] = data.get('extractive_segments', [])
+        self.extractive_answers: List[str] = [intern(ans.replace('Q_A_Answer__c :', '').strip()) for ans in data.get('extractive_answers', [])]
+        self.extractive_segments: List[str] = [intern(seg) for seg in data.get('extractive_segments', [])]
 
 
 class QueryResults:
@@ -66,16 +69,7 @@ class QueryResults:
         Returns:
         list: A list of the most frequently cited citation(s) as integers. In case of a tie, includes all.
         """
-        try:
-            citations = re.findall(r'\[\d+\]', text)
-            citation_counts = Counter(int(citation.strip('[]')) for citation in citations)
-            if citation_counts:
-                max_freq = max(citation_counts.values())
-                return [citation for citation, count in citation_counts.items() if count == max_freq]
-            else:
-                return []
-        except Exception as e:
-            raise RuntimeError(f"An error occurred: {e}")
+        return parse_citations(text).most_cited
 
     def extract_citations(self, text: str) -> list:
         """
@@ -87,24 +81,22 @@ class QueryResults:
         Returns:
         list: A list of integers representing the citations, sorted by their frequency.
         """
-        try:
-            citations = re.findall(r'\[\d+\]', text)
-            citation_counts = Counter(int(citation.strip('[]')) for citation in citations)
-            return sorted(citation_counts, key=citation_counts.get, reverse=True)
-        except Exception as e:
-            raise RuntimeError(f"An error occurred: {e}")
+        return parse_citations(text).order
 
 
 def read_jsonl_file(file_path: str) -> List[QueryResults]:
     """
     Reads a JSONL file and returns a list of QueryResults.
+
+    Extractive texts stored by hash are read from the file's text store (see src/utils/textstore.py).
     """
     query_results_list = []
     try:
+        texts = open_text_store(file_path) or TextStore()
         with open(file_path, 'r') as file:
             for line in file:
-                data = json.loads(line)
-                results = [SearchResult(match) for match in data.get('match_info', [])]
+                data = resolve_texts(json.loads(line), texts)
+                results = [SearchResult(match, texts) for match in data.get('match_info', [])]
                 query_result = QueryResults(data['query'], data['brand'], data.get('summarized_answer', ''),  results)
                 query_results_list.append(query_result)
     except FileNotFoundError as e:
@@ -0,0 +1,230 @@
+from src.search.doc_search import request_template
+from src.generate.article_index import ArticleIndex
+from src.search.doc_search import SEARCH_PROFILES
+from src.search.doc_search import PAGE_SIZE
+from concurrent.futures import ThreadPoolExecutor
+from src.generate.lookup import stream_lookup
+from src.search.doc_search import get_client
+from src.utils.incremental import row_key
+from src.search.doc_search import search
+from src.config.logging import logger
+from src.config.setup import config
+from src.utils.tracing import span
+from src.utils import singleflight
+from src.generate.llm import LLM
+from cachetools import TTLCache
+from typing import Callable
+from typing import Optional
+from aiohttp import web
+from typing import Dict
+from typing import Any
+import argparse
+import asyncio
+import json
+import time
+
+
+LLM_CACHE_PATH = './data/results/.cache/llm_responses.jsonl'
+
+
+class LatencyStats:
+    """ Per-endpoint request latencies, kept in a bounded window for percentile reporting. """
+
+    def __init__(self, window: int = 1000) -> None:
+        self.window = window
+        self.latencies = {}
+        self.counters = {}
+
+    def record(self, endpoint: str, latency_ms: float, outcome: str) -> None:
+        samples = self.latencies.setdefault(endpoint, [])
+        samples.append(latency_ms)
+        del samples[:-self.window]
+        key = f'{endpoint}.{outcome}'
+        self.counters[key] = self.counters.get(key, 0) + 1
+
+    def summary(self) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, samples in self.latencies.items():
+            ordered = sorted(samples)
+            endpoints[endpoint] = {
+                'count': len(ordered),
+                'p50_ms': round(ordered[len(ordered) // 2], 1),
+                'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+                'max_ms': round(ordered[-1], 1),
+            }
+        return {'latency': endpoints, 'outcomes': dict(self.counters)}
+
+
+class LookupService:
+    """
+    Keeps the search client, the LLM and the caches warm across requests.
+
+    Identical requests that arrive while one is in flight wait for the same result instead of
+    starting their own search or LLM call. Completed results are cached for `ttl` seconds.
+    With an article `index`, answers are served from precomputed article digests where possible.
+    """
+
+    def __init__(self, max_workers: int = 16, cache_size: int = 4096, ttl: float = 3600,
+                 index: Optional[ArticleIndex] = None) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.index = index
+        self.cache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.stats = LatencyStats()
+
+    def warm_up(self) -> None:
+        """ Loads the config, credentials, search client, request templates and chat model before the first request. """
+        start = time.perf_counter()
+        config.load()
+        get_client()
+        for profile in SEARCH_PROFILES:
+            request_template(PAGE_SIZE, profile)
+        LLM()
+        logger.info(f"Service warmed up in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    async def coalesce(self, key: str, compute: Callable[[], Any]) -> tuple:
+        """
+        Returns the cached or in-flight result for the key, otherwise runs `compute` in the worker pool.
+
+        Returns:
+        tuple: The result and how it was obtained: 'cached', 'coalesced' or 'computed'.
+        """
+        if key in self.cache:
+            return self.cache[key], 'cached'
+        if key in self.in_flight:
+            return await asyncio.shield(self.in_flight[key]), 'coalesced'
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.in_flight[key] = future
+        try:
+            result = await loop.run_in_executor(self.executor, compute)
+            if result:
+                self.cache[key] = result
+            future.set_result(result)
+            return result, 'computed'
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when no other request was waiting for it
+            future.exception()
+            raise
+        finally:
+            del self.in_flight[key]
+
+    def answer(self, query: str, brand: str, expand: bool) -> Dict[str, Any]:
+        """ Runs a blocking lookup and returns the answer with its timings. """
+        metrics = {}
+        answer = ''.join(stream_lookup(query, brand, expand=expand, metrics=metrics, index=self.index))
+        return {'answer': answer, 'match_id': metrics.get('match_id'), 'metrics': metrics} if answer else {}
+
+
+class BadRequest(Exception):
+    """ Invalid request parameters, answered with status 400. """
+
+
+async def _request_params(request: web.Request) -> Dict[str, Any]:
+    """ Query string parameters, overridden by those of a JSON body. Raises BadRequest for malformed input. """
+    params = dict(request.query)
+    if request.can_read_body:
+        try:
+            body = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise BadRequest(f'malformed JSON body: {e}')
+        if not isinstance(body, dict):
+            raise BadRequest('JSON body must be an object')
+        params.update(body)
+    if not params.get('query'):
+        raise BadRequest('query is required')
+    return params
+
+
+def timed(endpoint: str) -> Callable:
+    """ Wraps a handler returning a JSON payload, adding latency_ms to the response and the service stats. """
+    def decorator(handler):
+        async def wrapper(request: web.Request) -> web.Response:
+            start = time.perf_counter()
+            service: LookupService = request.app['service']
+            params = {}
+            try:
+                params = await _request_params(request)
+                with span(f'service.{endpoint}') as s:
+                    payload, outcome = await handler(service, params)
+                    s.set(outcome=outcome)
+                status = 200 if payload else 502
+            except BadRequest as e:
+                payload, outcome, status = {'error': str(e)}, 'bad_request', 400
+            except Exception as e:
+                logger.error(f"/{endpoint} failed for {params}: {e}")
+                payload, outcome, status = {'error': str(e)}, 'error', 500
+            latency_ms = (time.perf_counter() - start) * 1000
+            service.stats.record(endpoint, latency_ms, outcome)
+            logger.info(f"/{endpoint} {outcome} in {latency_ms:.0f} ms", extra={'sampled': True})
+            return web.json_response({**(payload or {'error': 'no result'}), 'outcome': outcome, 'latency_ms': round(latency_ms, 1)}, status=status)
+        return wrapper
+    return decorator
+
+
+@timed('search')
+async def handle_search(service: LookupService, params: Dict[str, Any]) -> tuple:
+    query, brand = params['query'], params.get('brand', '')
+    profile = params.get('profile', 'full')
+    if profile not in SEARCH_PROFILES:
+        raise BadRequest(f"unknown profile '{profile}', expected one of {', '.join(SEARCH_PROFILES)}")
+    key = f"search:{profile}:{row_key(query, brand)}"
+    return await service.coalesce(key, lambda: search(query, brand, profile=profile))
+
+
+@timed('answer')
+async def handle_answer(service: LookupService, params: Dict[str, Any]) -> tuple:
+    query, brand = params['query'], params.get('brand', '')
+    expand = str(params.get('expand', 'false')).lower() in ('1', 'true', 'yes')
+    key = f"answer:{int(expand)}:{row_key(query, brand)}"
+    return await service.coalesce(key, lambda: service.answer(query, brand, expand))
+
+
+async def handle_stats(request: web.Request) -> web.Response:
+    service: LookupService = request.app['service']
+    return web.json_response({**service.stats.summary(), 'cached': len(service.cache), 'in_flight': len(service.in_flight),
+                              'single_flight': singleflight.stats()})
+
+
+def create_app(service: Optional[LookupService] = None, warm_up: bool = True) -> web.Application:
+    """
+    Builds the lookup application.
+
+    Endpoints:
+        GET|POST /search  query, brand, profile      -> search result (see src/search/doc_search.search)
+        GET|POST /answer  query, brand, expand       -> answer, match_id and lookup timings
+        GET      /stats                              -> latency percentiles, outcome counts and single-flight hits
+    """
+    service = service or LookupService()
+    if warm_up:
+        service.warm_up()
+    app = web.Application()
+    app['service'] = service
+    app.add_routes([
+        web.get('/search', handle_search), web.post('/search', handle_search),
+        web.get('/answer', handle_answer), web.post('/answer', handle_answer),
+        web.get('/stats', handle_stats),
+    ])
+
+    async def shutdown(app: web.Application) -> None:
+        app['service'].executor.shutdown(wait=False, cancel_futures=True)
+    app.on_shutdown.append(shutdown)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve /search and /answer with warm clients and caches.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=16, help='Threads running searches and LLM calls.')
+    parser.add_argument('--ttl', type=float, default=3600, help='Seconds a result stays cached.')
+    parser.add_argument('--llm-cache', action='store_true', help='Also persist LLM responses across restarts.')
+    parser.add_argument('--index', help='Precomputed article digests, as built by src/generate/article_index.py.')
+    args = parser.parse_args()
+
+    if args.llm_cache:
+        LLM.enable_response_cache(LLM_CACHE_PATH)
+    index = ArticleIndex(args.index) if args.index else None
+    web.run_app(create_app(LookupService(max_workers=args.workers, ttl=args.ttl, index=index)), host=args.host, port=args.port)
@@ -0,0 +1,91 @@
+from src.config.logging import logger
+from typing import Optional
+from typing import Any
+import threading
+import hashlib
+import json
+import os
+
+
+def content_hash(*parts: Any) -> str:
+    """
+    Computes a stable hash of the given values, used as a cache key.
+
+    Args:
+    *parts: Values that identify the cached result, e.g. prompt name and prompt inputs.
+
+    Returns:
+    str: Hex SHA-256 digest of the parts.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+def file_hash(file_path: str) -> str:
+    """
+    Computes the SHA-256 of a file, or 'missing' if it does not exist.
+
+    Args:
+    file_path (str): Path to the file.
+
+    Returns:
+    str: Hex digest of the file content.
+    """
+    if not os.path.exists(file_path):
+        return 'missing'
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class JsonlCache:
+    """
+    A thread-safe key/value cache persisted as an append-only JSONL file.
+
+    Entries are loaded once when the cache is created and every new entry is appended, so
+    interrupted runs keep the results they already paid for. Without a path the cache is memory-only.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry['key']] = entry['value']
+                    except (json.JSONDecodeError, KeyError):
+                        logger.error(f"Skipping corrupt cache line in {path}")
+
+    def get(self, key: str) -> Optional[Any]:
+        """ Returns the cached value for the key, or None on a miss. """
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        """ Stores a value and appends it to the cache file. """
+        with self.lock:
+            self.entries[key] = value
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with open(self.path, 'a') as file:
+                    file.write(json.dumps({'key': key, 'value': value}) + '\n')
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,157 @@
+from src.utils.cache import content_hash
+from src.config.logging import logger
+from src.utils.cache import file_hash
+from typing import Optional
+from typing import List
+from typing import Dict
+from typing import Any
+import pandas as pd
+import json
+import os
+
+
+LLM_SOURCE = './src/generate/llm.py'
+ANSWER_PREFIX = 'ans_'  # Computed answer columns, e.g. ans_exp_1; empty when the LLM call failed
+
+
+def row_key(question: str, brand: str) -> str:
+    """
+    Stable key of an eval question. Whitespace and case differences do not change the key.
+
+    Args:
+    question (str): The eval question.
+    brand (str): The brand filter of the question.
+
+    Returns:
+    str: Hash identifying the (question, brand) pair.
+    """
+    return content_hash(' '.join(str(question).lower().split()), str(brand).strip())
+
+
+def code_version(*source_paths: str) -> str:
+    """ Hash of the source files that shape a row's result, e.g. the experiment module and the LLM prompts. """
+    return content_hash(*(file_hash(path) for path in source_paths))
+
+
+def jsonl_fingerprints(jsonl_path: str, version: str = '') -> List[str]:
+    """
+    Fingerprints every record of a search result JSONL file.
+
+    A record carries its query and brand, so the fingerprint changes both for new questions and
+    for existing questions whose search results changed.
+
+    Args:
+    jsonl_path (str): Path to the JSONL file.
+    version (str): Code version mixed into every fingerprint so prompt changes invalidate stored rows.
+
+    Returns:
+    List[str]: One fingerprint per record, in file order.
+    """
+    with open(jsonl_path, 'r') as file:
+        return [content_hash(version, line.strip()) for line in file if line.strip()]
+
+
+def _state_path(output_path: str) -> str:
+    return os.path.splitext(output_path)[0] + '.rows.json'
+
+
+def save_row_fingerprints(output_path: str, fingerprints: List[str]) -> None:
+    """ Stores the fingerprint of each row of an output file next to it. """
+    with open(_state_path(output_path), 'w') as file:
+        json.dump(fingerprints, file)
+
+
+def is_complete_row(row: Dict[str, Any], allow_empty: bool = False) -> bool:
+    """
+    True unless an answer column of the row is missing, e.g. because find_answer or format_answer returned None.
+
+    Args:
+    row (Dict[str, Any]): A computed row.
+    allow_empty (bool): Whether an empty string is a valid answer, as for experiments that answer '' when no document does.
+
+    Returns:
+    bool: Whether the row can be kept for the next run.
+    """
+    for column, value in row.items():
+        if not column.startswith(ANSWER_PREFIX):
+            continue
+        if value is None or (isinstance(value, float) and pd.isna(value)) or (not allow_empty and str(value).strip() == ''):
+            return False
+    return True
+
+
+def load_previous_rows(output_path: str, columns: List[str], allow_empty: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Loads the rows of a previous run, keyed by the fingerprint of the input they were computed from.
+
+    Args:
+    output_path (str): The CSV written by the previous run.
+    columns (List[str]): The columns computed per row.
+    allow_empty (bool): Keep rows with an empty answer. Empty and missing answers read back the same from the
+    CSV, so the writer must then mark failed rows itself by saving an empty fingerprint.
+
+    Returns:
+    Dict[str, Dict[str, Any]]: Previous results keyed by fingerprint. Empty if there is no usable previous run.
+    Unless allow_empty is set, rows with an empty answer are left out, so transient LLM failures are retried.
+    """
+    state_path = _state_path(output_path)
+    if not os.path.exists(output_path) or not os.path.exists(state_path):
+        return {}
+    try:
+        with open(state_path, 'r') as file:
+            fingerprints = json.load(file)
+        df = pd.read_csv(output_path, usecols=lambda column: column in columns)
+        # Computed columns are aligned with the JSONL records from the first row on.
+        if len(df) < len(fingerprints) or any(column not in df for column in columns):
+            logger.error(f"Row state of {output_path} does not match the file, recomputing all rows")
+            return {}
+        df = df.head(len(fingerprints)).astype(object)
+        df = df.where(df.notna(), None)
+        return {fingerprint: row for fingerprint, row in zip(fingerprints, df.to_dict('records'))
+                if fingerprint and (allow_empty or is_complete_row(row))}
+    except Exception as e:
+        logger.error(f"Failed to load previous rows from {output_path}: {e}")
+        return {}
+
+
+def load_previous_records(jsonl_path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Loads the records of a previous search run keyed by question, so unchanged questions are not searched again.
+
+    Args:
+    jsonl_path (str): JSONL file written by the previous run.
+
+    Returns:
+    Dict[str, Dict[str, Any]]: Previous search records keyed by row_key(query, brand).
+    """
+    records = {}
+    if not os.path.exists(jsonl_path):
+        return records
+    with open(jsonl_path, 'r') as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                # Failed searches only carry the query and brand; those are searched again.
+                if len(record) > 2:
+                    records[row_key(record['query'], record['brand'])] = record
+    return records
+
+
+def reuse_or_compute(fingerprint: str, previous: Optional[Dict[str, Dict[str, Any]]], compute, stats: Dict[str, int]) -> Dict[str, Any]:
+    """
+    Returns the stored row for an unchanged input, otherwise computes it.
+
+    Args:
+    fingerprint (str): Fingerprint of the row's input.
+    previous (Optional[Dict[str, Dict[str, Any]]]): Rows of the previous run keyed by fingerprint.
+    compute: Callable producing the row.
+    stats (Dict[str, int]): Counters of reused and computed rows, updated in place.
+
+    Returns:
+    Dict[str, Any]: The row.
+    """
+    if previous and fingerprint in previous and is_complete_row(previous[fingerprint]):
+        stats['reused'] = stats.get('reused', 0) + 1
+        return previous[fingerprint]
+    stats['computed'] = stats.get('computed', 0) + 1
+    return compute()
@@ -0,0 +1,206 @@
+from concurrent.futures import ProcessPoolExecutor
+from src.config.logging import configure_worker
+from src.config.logging import get_log_queue
+from src.utils.singleflight import single_flight
+from src.config.logging import logger
+from src.config.setup import config
+from src.utils.tracing import span
+from google.cloud import storage
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+from typing import List
+import bisect
+import PyPDF2
+import time
+import io
+
+
+GCS_URL_TEMPLATE = 'gs://farmers-poc-as/documents-for-vertex-search-v1/pdfs_v3/{match_id}.pdf'
+PARALLEL_MIN_PAGES = 100  # Smaller documents parse faster than a process pool starts
+
+
+class PdfDocument:
+    """
+    Text of a PDF with the offset at which each page starts, so page ranges can be sliced without parsing again.
+
+    Attributes:
+        text (str): The text of the extracted pages, concatenated.
+        offsets (List[int]): Start of each extracted page in `text`.
+        page_count (int): Number of pages in the PDF, including pages that were not extracted.
+    """
+
+    def __init__(self, text: str, offsets: List[int], page_count: int) -> None:
+        self.text = text
+        self.offsets = offsets
+        self.page_count = page_count
+
+    def pages(self, start: int = 0, stop: Optional[int] = None) -> str:
+        """ Returns the text of the extracted pages in [start, stop). """
+        stop = len(self.offsets) if stop is None else min(stop, len(self.offsets))
+        if start >= stop:
+            return ''
+        end = self.offsets[stop] if stop < len(self.offsets) else len(self.text)
+        return self.text[self.offsets[start]:end]
+
+    def page_of(self, char_offset: int) -> int:
+        """ Returns the index of the page containing a character offset of `text`. """
+        return max(0, bisect.bisect_right(self.offsets, char_offset) - 1)
+
+
+def construct_gcs_url(match_id: str) -> str:
+    """
+    Generates a Google Cloud Storage (GCS) URL for a PDF document based on its match ID.
+
+    Args:
+    match_id (str): Unique identifier of the document.
+
+    Returns:
+    str: GCS URL for the document.
+    """
+    return GCS_URL_TEMPLATE.format(match_id=match_id)
+
+
+def parse_gcs_url(gcs_url: str) -> Tuple[str, str]:
+    """ Splits 'gs://bucket-name/path/to/file.pdf' into the bucket and blob names. """
+    if not gcs_url.startswith("gs://"):
+        raise ValueError("URL must start with 'gs://'")
+    parts = gcs_url[5:].split('/', 1)
+    if len(parts) < 2:
+        raise ValueError("Invalid GCS URL format")
+    return parts[0], parts[1]
+
+
+def download_pdf(gcs_url: str) -> bytes:
+    """
+    Downloads a PDF from Google Cloud Storage.
+
+    Args:
+    gcs_url (str): The URL of the PDF file in Google Cloud Storage.
+
+    Returns:
+    bytes: The content of the file.
+    """
+    bucket_name, blob_name = parse_gcs_url(gcs_url)
+    # Sets GOOGLE_APPLICATION_CREDENTIALS before the storage client reads it
+    config.load()
+    blob = storage.Client().bucket(bucket_name).blob(blob_name)
+    with span('gcs.download', url=gcs_url) as s:
+        pdf_bytes = io.BytesIO()
+        blob.download_to_file(pdf_bytes)
+        s.set(bytes=pdf_bytes.tell())
+    return pdf_bytes.getvalue()
+
+
+def iter_pages(pdf_bytes: bytes, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    """
+    Yields the text of each page in [start, stop), parsing a page only when it is requested.
+
+    Args:
+    pdf_bytes (bytes): The PDF content.
+    start (int): Index of the first page.
+    stop (Optional[int]): Index after the last page. Defaults to the end of the document.
+
+    Yields:
+    str: The text of the page; empty for pages without extractable text.
+    """
+    reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    for index in range(start, stop):
+        yield reader.pages[index].extract_text() or ''
+
+
+def _page_range_texts(pdf_bytes: bytes, start: int, stop: int) -> List[str]:
+    """ Process pool task parsing one page range. """
+    return list(iter_pages(pdf_bytes, start, stop))
+
+
+def extract_pages(pdf_bytes: bytes, max_pages: Optional[int] = None, max_chars: Optional[int] = None,
+                  workers: int = 1) -> PdfDocument:
+    """
+    Extracts page texts, stopping at the page or character budget.
+
+    With `workers` > 1 and at least PARALLEL_MIN_PAGES pages to parse, page ranges are parsed in a
+    process pool. The character budget then only truncates the result, since all ranges run at once.
+
+    Args:
+    pdf_bytes (bytes): The PDF content.
+    max_pages (Optional[int]): Maximum number of pages to parse.
+    max_chars (Optional[int]): Maximum number of characters to return; parsing stops once it is reached.
+    workers (int): Number of processes to parse with.
+
+    Returns:
+    PdfDocument: The extracted text with its page offsets.
+    """
+    reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+    page_count = len(reader.pages)
+    stop = page_count if max_pages is None else min(max_pages, page_count)
+
+    if workers > 1 and stop >= PARALLEL_MIN_PAGES:
+        bounds = [stop * i // workers for i in range(workers + 1)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=configure_worker, initargs=(get_log_queue(),)) as executor:
+            ranges = executor.map(_page_range_texts, [pdf_bytes] * workers, bounds[:-1], bounds[1:])
+            page_texts = iter([text for texts in ranges for text in texts])
+    else:
+        page_texts = (reader.pages[index].extract_text() or '' for index in range(stop))
+
+    parts, offsets, length = [], [], 0
+    for page_text in page_texts:
+        offsets.append(length)
+        if max_chars is not None and length + len(page_text) >= max_chars:
+            parts.append(page_text[:max_chars - length])
+            break
+        parts.append(page_text)
+        length += len(page_text)
+    return PdfDocument(''.join(parts), offsets, page_count)
+
+
+@single_flight('pdf.document')
+def extract_document_from_gcs(gcs_url: str, max_pages: Optional[int] = None, max_chars: Optional[int] = None,
+                              workers: int = 1, attempts: int = 1) -> Optional[PdfDocument]:
+    """
+    Downloads a PDF from Google Cloud Storage and extracts its pages.
+
+    Args:
+    gcs_url (str): The URL of the PDF file in Google Cloud Storage.
+                   Format: 'gs://bucket-name/path/to/pdf/file.pdf'
+    max_pages (Optional[int]): Maximum number of pages to parse.
+    max_chars (Optional[int]): Maximum number of characters to extract.
+    workers (int): Number of processes to parse large documents with.
+    attempts (int): Number of tries, with exponential backoff between them.
+
+    Returns:
+    Optional[PdfDocument]: The extracted document or None if extraction fails. Concurrent calls for
+    the same document and budget share one download.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            pdf_bytes = download_pdf(gcs_url)
+            with span('pdf.parse', url=gcs_url) as s:
+                document = extract_pages(pdf_bytes, max_pages=max_pages, max_chars=max_chars, workers=workers)
+                s.set(pages=len(document.offsets), page_count=document.page_count, chars=len(document.text))
+            return document
+        except Exception as e:
+            if attempt < attempts:
+                wait_time = 2 ** attempt
+                logger.error(f"Attempt {attempt}/{attempts} failed with error: {e}. Retrying in {wait_time} seconds...")
+                time.sleep(wait_time)
+            else:
+                logger.error(f"Failed to extract text from PDF in GCS: {e}")
+    return None
+
+
+def extract_text_from_gcs_pdf(gcs_url: str, max_pages: Optional[int] = None, max_chars: Optional[int] = None,
+                              workers: int = 1, attempts: int = 1) -> Optional[str]:
+    """
+    Extracts text from a PDF file stored in Google Cloud Storage.
+
+    Args:
+    gcs_url (str): The URL of the PDF file in Google Cloud Storage.
+    max_pages, max_chars, workers, attempts: See extract_document_from_gcs.
+
+    Returns:
+    Optional[str]: Extracted text from the PDF or None if extraction fails.
+    """
+    document = extract_document_from_gcs(gcs_url, max_pages=max_pages, max_chars=max_chars, workers=workers, attempts=attempts)
+    return document.text if document is not None else None
@@ -0,0 +1,39 @@
+from typing import Optional
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    A thread-safe token bucket limiting how many requests are started per minute.
+
+    Workers call acquire() before each request. Up to `burst` requests may start at once, after
+    which requests are spaced evenly to stay within the rate.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: Optional[int] = None) -> None:
+        self.interval = 60.0 / requests_per_minute
+        self.capacity = float(burst if burst is not None else 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self) -> float:
+        """
+        Blocks until a request may start.
+
+        Returns:
+        float: Seconds spent waiting.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.interval)
+            self.updated = now
+            # Reserve the token now; a negative balance is the queue of waiting requests.
+            self.tokens -= 1
+            wait_time = max(0.0, -self.tokens * self.interval)
+            self.waited += wait_time
+        if wait_time:
+            time.sleep(wait_time)
+        return wait_time
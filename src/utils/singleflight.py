@@ -0,0 +1,106 @@
+from src.utils.cache import content_hash
+from typing import Callable
+from typing import Dict
+from typing import Any
+import functools
+import threading
+import inspect
+
+
+class _Call:
+    """ A call in flight; followers wait on its event. """
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers arriving while a call for their key is in
+    flight wait for it and share its result (or exception) instead of starting their own.
+
+    Nothing is cached: once the call returns, the next caller runs it again.
+
+    Attributes:
+        name (str): Name reported in the stats.
+        executed (int): Calls that ran.
+        shared (int): Calls that received the result of a call already in flight.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.lock = threading.Lock()
+        self.calls: Dict[str, _Call] = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        """ Calls fn(*args, **kwargs), or waits for the call already in flight for the key. """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {'executed': self.executed, 'shared': self.shared, 'in_flight': len(self.calls)}
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_group(name: str) -> SingleFlight:
+    """ Returns the process-wide single-flight group with the given name. """
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """ Executed, shared and in-flight counts of every group, for tuning concurrency and caching. """
+    return {name: group.stats() for name, group in list(_groups.items())}
+
+
+def single_flight(name: str) -> Callable:
+    """
+    Decorator deduplicating concurrent calls with the same arguments. Defaults are applied before
+    keying, so f(x) and f(x, default) share a call. The result object is shared by all callers.
+    """
+    def decorator(fn: Callable) -> Callable:
+        signature = inspect.signature(fn)
+        group = get_group(name)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = content_hash(*(f'{param}={value!r}' for param, value in bound.arguments.items()))
+            return group.do(key, fn, *args, **kwargs)
+        wrapper.single_flight = group
+        return wrapper
+    return decorator
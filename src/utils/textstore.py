@@ -0,0 +1,126 @@
+from src.utils.cache import content_hash
+from src.config.logging import logger
+from typing import Optional
+from typing import List
+from typing import Dict
+from typing import Any
+import threading
+import json
+import os
+
+
+TEXT_FIELDS = {'extractive_answers': 'extractive_answer_refs', 'extractive_segments': 'extractive_segment_refs'}
+KEY_CHARS = 16  # 64 bits of SHA-256; collisions are negligible at millions of distinct texts
+
+
+def text_key(text: str) -> str:
+    """ Content address of a text. """
+    return content_hash(text)[:KEY_CHARS]
+
+
+def text_store_path(jsonl_path: str) -> str:
+    """ Text store of a search result file: next to it, with a .texts.jsonl suffix. """
+    return os.path.splitext(jsonl_path)[0] + '.texts.jsonl'
+
+
+class TextStore:
+    """
+    A content-addressed store of texts (hash -> text), persisted as an append-only JSONL file.
+
+    Each distinct text is stored once however many records refer to it, and reads return the same
+    string object for the same hash, so loaded records share one copy of each text.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self.texts: Dict[str, str] = {}
+        self.interned: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                        self.texts[entry['key']] = entry['text']
+                    except (json.JSONDecodeError, KeyError):
+                        logger.error(f"Skipping corrupt text store line in {path}")
+
+    def put(self, text: str) -> str:
+        """ Stores a text unless it is already present and returns its hash. """
+        key = text_key(text)
+        with self.lock:
+            if key not in self.texts:
+                self.texts[key] = text
+                if self.path:
+                    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                    with open(self.path, 'a') as file:
+                        file.write(json.dumps({'key': key, 'text': text}) + '\n')
+        return key
+
+    def get(self, key: str) -> str:
+        """ Returns the text stored under a hash. Raises KeyError for unknown hashes. """
+        return self.texts[key]
+
+    def intern(self, text: str) -> str:
+        """ Returns the shared copy of a text read inline, so duplicates are held in memory once. """
+        return self.interned.setdefault(text, text)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.texts
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+
+def _search_results(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """ The search responses of a single-query record (itself) or a multi-query record (one per variant). """
+    if 'match_info' in record:
+        return [record]
+    return [info for key, info in record.items() if key not in ['query', 'brand'] and isinstance(info, dict)]
+
+
+def _externalize_result(result: Dict[str, Any], store: TextStore) -> Dict[str, Any]:
+    matches = []
+    for match in result.get('match_info', []):
+        match = dict(match)
+        for field, ref_field in TEXT_FIELDS.items():
+            if field in match:
+                match[ref_field] = [store.put(text) for text in match.pop(field)]
+        matches.append(match)
+    return {**result, 'match_info': matches} if 'match_info' in result else result
+
+
+def externalize_texts(record: Dict[str, Any], store: TextStore) -> Dict[str, Any]:
+    """
+    Moves the extractive answers and segments of a search record into the store.
+
+    Returns:
+    Dict[str, Any]: A copy of the record in which each list of texts is replaced by a list of
+    hashes under the matching *_refs field. The record passed in is left unchanged.
+    """
+    if 'match_info' in record:
+        return _externalize_result(record, store)
+    return {key: _externalize_result(info, store) if key not in ['query', 'brand'] and isinstance(info, dict) else info
+            for key, info in record.items()}
+
+
+def resolve_texts(record: Dict[str, Any], store: Optional[TextStore]) -> Dict[str, Any]:
+    """
+    Replaces the text hashes of a search record with the texts, in place. Inline texts are interned.
+    """
+    for result in _search_results(record):
+        for match in result.get('match_info', []):
+            for field, ref_field in TEXT_FIELDS.items():
+                if ref_field in match:
+                    if store is None:
+                        raise KeyError(f"Record refers to stored texts but no text store was given: {ref_field}")
+                    match[field] = [store.get(key) for key in match.pop(ref_field)]
+                elif store is not None and field in match:
+                    match[field] = [store.intern(text) for text in match[field]]
+    return record
+
+
+def open_text_store(jsonl_path: str) -> Optional[TextStore]:
+    """ Opens the text store of a search result file, or returns None if it has none. """
+    path = text_store_path(jsonl_path)
+    return TextStore(path) if os.path.exists(path) else None
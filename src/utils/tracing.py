@@ -0,0 +1,194 @@
+from contextlib import contextmanager
+from src.config.logging import logger
+from collections import defaultdict
+from typing import Callable
+from typing import Iterator
+from typing import Optional
+from typing import List
+from typing import Dict
+from typing import Any
+import threading
+import functools
+import argparse
+import json
+import time
+import os
+
+
+TRACE_FILE = os.environ.get('TRACE_FILE', './logs/trace.jsonl')
+TRACE_ENABLED = os.environ.get('TRACE_ENABLED', '1') != '0'
+
+# Child processes inherit the run ID through the environment so their spans land in the same run.
+RUN_ID = os.environ.setdefault('TRACE_RUN_ID', time.strftime('%Y%m%d-%H%M%S') + f'-{os.getpid()}')
+
+_lock = threading.Lock()
+_file = None
+
+
+class Span:
+    """
+    A timed stage of the pipeline. Attributes can be added while the span is open and are written with its duration.
+    """
+
+    def __init__(self, stage: str, attrs: Dict[str, Any]) -> None:
+        self.stage = stage
+        self.attrs = attrs
+
+    def set(self, **attrs: Any) -> None:
+        """ Sets attributes on the span, e.g. prompt and response sizes. """
+        self.attrs.update(attrs)
+
+    def incr(self, key: str, amount: int = 1) -> None:
+        """ Increments a counter attribute on the span, e.g. retries. """
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+
+def _write(record: Dict[str, Any]) -> None:
+    """ Appends a span record to the trace file, opening it on first use. """
+    global _file
+    try:
+        line = json.dumps(record, default=str) + '\n'
+        with _lock:
+            if _file is None:
+                os.makedirs(os.path.dirname(TRACE_FILE) or '.', exist_ok=True)
+                _file = open(TRACE_FILE, 'a', buffering=1)
+            _file.write(line)
+    except Exception as e:
+        logger.error(f"Failed to write trace record: {e}")
+
+
+@contextmanager
+def span(stage: str, **attrs: Any) -> Iterator[Span]:
+    """
+    Times the enclosed block and writes it to the trace file as one JSONL record.
+
+    Args:
+    stage (str): Name of the pipeline stage, e.g. 'search.discovery_engine'.
+    **attrs: Initial attributes of the span.
+
+    Yields:
+    Span: The open span, so the block can record retries, sizes and cache hits.
+    """
+    current = Span(stage, attrs)
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield current
+    except Exception as e:
+        status = 'error'
+        current.set(error=str(e))
+        raise
+    finally:
+        if TRACE_ENABLED:
+            _write({
+                'run_id': RUN_ID,
+                'stage': stage,
+                'ts': time.time(),
+                'duration_ms': (time.perf_counter() - start) * 1000,
+                'status': status,
+                'pid': os.getpid(),
+                'thread': threading.current_thread().name,
+                **current.attrs,
+            })
+
+
+def traced(stage: str) -> Callable:
+    """ Decorator that wraps every call of the function in a span. """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def read_trace(file_path: str, run_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Reads the span records of one run from a trace file.
+
+    Args:
+    file_path (str): Path to the JSONL trace file.
+    run_id (Optional[str]): The run to read. Defaults to the last run in the file.
+
+    Returns:
+    List[Dict[str, Any]]: The span records of the run.
+    """
+    records = []
+    with open(file_path, 'r') as file:
+        for line in file:
+            if line.strip():
+                records.append(json.loads(line))
+    if not records:
+        return []
+    run_id = run_id or records[-1]['run_id']
+    return [record for record in records if record['run_id'] == run_id]
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    """ Nearest-rank percentile of an already sorted list. """
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def summarize(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Aggregates span records per stage.
+
+    Args:
+    records (List[Dict[str, Any]]): Span records of one run.
+
+    Returns:
+    Dict[str, Dict[str, Any]]: Per-stage count, total and percentile durations, errors, retries and cache hits.
+    """
+    stages = defaultdict(list)
+    for record in records:
+        stages[record['stage']].append(record)
+
+    summary = {}
+    for stage, stage_records in stages.items():
+        durations = sorted(record['duration_ms'] for record in stage_records)
+        summary[stage] = {
+            'count': len(durations),
+            'total_ms': sum(durations),
+            'p50_ms': _percentile(durations, 50),
+            'p95_ms': _percentile(durations, 95),
+            'p99_ms': _percentile(durations, 99),
+            'max_ms': durations[-1],
+            'errors': sum(1 for record in stage_records if record['status'] != 'ok'),
+            'retries': sum(record.get('retries', 0) for record in stage_records),
+            'cache_hits': sum(1 for record in stage_records if record.get('cache_hit')),
+            'durations': durations,
+        }
+    return summary
+
+
+def print_histograms(summary: Dict[str, Dict[str, Any]], width: int = 40) -> None:
+    """ Prints per-stage statistics and a log2-bucketed latency histogram, slowest stages first. """
+    for stage, stats in sorted(summary.items(), key=lambda item: item[1]['total_ms'], reverse=True):
+        print(f"\n{stage}: n={stats['count']} total={stats['total_ms'] / 1000:.1f}s "
+              f"p50={stats['p50_ms']:.1f}ms p95={stats['p95_ms']:.1f}ms p99={stats['p99_ms']:.1f}ms "
+              f"errors={stats['errors']} retries={stats['retries']} cache_hits={stats['cache_hits']}")
+        buckets = defaultdict(int)
+        for duration in stats['durations']:
+            bucket = 1
+            while bucket < duration:
+                bucket *= 2
+            buckets[bucket] += 1
+        peak = max(buckets.values())
+        for bucket in sorted(buckets):
+            bar = '#' * max(1, int(width * buckets[bucket] / peak))
+            print(f"  <= {bucket:>7} ms | {bar} {buckets[bucket]}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print per-stage latency histograms for a traced run.')
+    parser.add_argument('trace_file', nargs='?', default=TRACE_FILE)
+    parser.add_argument('--run-id', default=None, help='Run to summarize. Defaults to the last run in the file.')
+    args = parser.parse_args()
+
+    run_records = read_trace(args.trace_file, args.run_id)
+    if run_records:
+        print(f"Run {run_records[0]['run_id']}: {len(run_records)} spans")
+        print_histograms(summarize(run_records))
+    else:
+        print(f"No spans found in {args.trace_file}")